@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+"""
+aggregations
+
+Mergeable aggregate functions used by the reduce and group by
+pipeline operators.
+
+Each aggregator accumulates values with add, can be combined
+with another aggregator of the same type with merge, and can
+be saved and restored with state/from_state so partial results
+can be spilled to disk or sent between processes.
+
+Aggregations are specified by name in pipeline configs, eg:
+
+{
+    "total": {"type": "sum", "action": "module.get_value"},
+    "users": {"type": "distinct", "action": "module.get_user"},
+    "biggest": {"type": "top_k", "action": "module.get_value", "k": 5}
+}
+
+"""
+import os
+import math
+import heapq
+import shutil
+import struct
+import hashlib
+import tempfile
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+class Aggregator(object):
+    """
+    _Aggregator_
+
+    Base class for aggregate functions
+    """
+    def __init__(self):
+        self.value = None
+
+    def add(self, value):
+        raise NotImplementedError()
+
+    def merge(self, other):
+        raise NotImplementedError()
+
+    def result(self):
+        return self.value
+
+    def state(self):
+        """JSON serializable accumulated state"""
+        return self.value
+
+    @classmethod
+    def from_state(cls, state, **options):
+        agg = cls(**options)
+        agg.value = state
+        return agg
+
+
+class Count(Aggregator):
+    """count of values"""
+    def __init__(self):
+        super(Count, self).__init__()
+        self.value = 0
+
+    def add(self, value):
+        self.value += 1
+
+    def merge(self, other):
+        self.value += other.value
+
+
+class Sum(Aggregator):
+    """sum of values"""
+    def __init__(self):
+        super(Sum, self).__init__()
+        self.value = 0
+
+    def add(self, value):
+        self.value += value
+
+    def merge(self, other):
+        self.value += other.value
+
+
+class Min(Aggregator):
+    """smallest value"""
+    def add(self, value):
+        if self.value is None or value < self.value:
+            self.value = value
+
+    def merge(self, other):
+        if other.value is not None:
+            self.add(other.value)
+
+
+class Max(Aggregator):
+    """largest value"""
+    def add(self, value):
+        if self.value is None or value > self.value:
+            self.value = value
+
+    def merge(self, other):
+        if other.value is not None:
+            self.add(other.value)
+
+
+class Mean(Aggregator):
+    """arithmetic mean of values"""
+    def __init__(self):
+        super(Mean, self).__init__()
+        self.value = [0, 0]
+
+    def add(self, value):
+        self.value[0] += value
+        self.value[1] += 1
+
+    def merge(self, other):
+        self.value[0] += other.value[0]
+        self.value[1] += other.value[1]
+
+    def result(self):
+        total, count = self.value
+        if not count:
+            return None
+        return float(total) / count
+
+
+class TopK(Aggregator):
+    """
+    the k largest values, in descending order,
+    keeps a heap of at most k values
+    """
+    def __init__(self, k=10):
+        super(TopK, self).__init__()
+        self.k = k
+        self.value = []
+
+    def add(self, value):
+        if len(self.value) < self.k:
+            heapq.heappush(self.value, value)
+        elif value > self.value[0]:
+            heapq.heapreplace(self.value, value)
+
+    def merge(self, other):
+        for value in other.value:
+            self.add(value)
+
+    def result(self):
+        return sorted(self.value, reverse=True)
+
+    @classmethod
+    def from_state(cls, state, **options):
+        agg = cls(**options)
+        agg.value = list(state)
+        heapq.heapify(agg.value)
+        return agg
+
+
+class HyperLogLog(Aggregator):
+    """
+    approximate count of distinct values using a HyperLogLog
+    sketch with 2**precision registers, the standard error
+    is about 1.04/sqrt(2**precision)
+    """
+    def __init__(self, precision=12):
+        super(HyperLogLog, self).__init__()
+        if not 4 <= precision <= 16:
+            msg = "HyperLogLog precision must be between 4 and 16"
+            raise ValueError(msg)
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        elif not isinstance(value, str):
+            value = repr(value)
+        hashed, = struct.unpack('<Q', hashlib.sha1(value).digest()[:8])
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        for i, rank in enumerate(other.registers):
+            if rank > self.registers[i]:
+                self.registers[i] = rank
+
+    def result(self):
+        size = len(self.registers)
+        if size >= 128:
+            alpha = 0.7213 / (1 + 1.079 / size)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[size]
+        estimate = alpha * size * size / sum(
+            2.0 ** -rank for rank in self.registers
+        )
+        zeros = self.registers.count('\x00')
+        if estimate <= 2.5 * size and zeros:
+            # small range correction using linear counting
+            estimate = size * math.log(float(size) / zeros)
+        return int(round(estimate))
+
+    def state(self):
+        return str(self.registers).encode('hex')
+
+    @classmethod
+    def from_state(cls, state, **options):
+        agg = cls(**options)
+        agg.registers = bytearray(state.decode('hex'))
+        return agg
+
+
+AGGREGATORS = {
+    'count': Count,
+    'sum': Sum,
+    'min': Min,
+    'max': Max,
+    'mean': Mean,
+    'top_k': TopK,
+    'distinct': HyperLogLog,
+}
+
+
+def make_aggregator(spec):
+    """
+    _make_aggregator_
+
+    Create a new aggregator from a spec dict, keys
+    other than type and action are passed as options
+    """
+    options = dict(
+        (str(k), v) for k, v in spec.items() if k not in ('type', 'action')
+    )
+    return AGGREGATORS[spec['type']](**options)
+
+
+def restore_aggregator(spec, state):
+    """
+    _restore_aggregator_
+
+    Recreate an aggregator from a spec and a saved state
+    """
+    options = dict(
+        (str(k), v) for k, v in spec.items() if k not in ('type', 'action')
+    )
+    return AGGREGATORS[spec['type']].from_state(state, **options)
+
+
+class GroupTable(object):
+    """
+    _GroupTable_
+
+    Hash table of key: [aggregators] that holds at most max_keys
+    groups in memory. When that is exceeded the partial aggregates
+    are spilled to partition files on disk, chosen by the hash of
+    the key, and each partition is merged separately when the
+    results are read, so at most about 1/partitions of the spilled
+    keys are in memory at once.
+    """
+    def __init__(self, specs, max_keys=None, partitions=16, spill_dir=None):
+        self.specs = specs
+        self.max_keys = max_keys
+        self.partitions = partitions
+        self.spill_dir = spill_dir
+        self.groups = {}
+        self._tmpdir = None
+        self._files = None
+
+    def add(self, key, values):
+        """add a list of values, one per spec, to the key group"""
+        aggs = self.groups.get(key)
+        if aggs is None:
+            if self.max_keys and len(self.groups) >= self.max_keys:
+                self.spill()
+            aggs = [make_aggregator(spec) for spec in self.specs]
+            self.groups[key] = aggs
+        for agg, value in zip(aggs, values):
+            agg.add(value)
+
+    def spill(self):
+        """write the groups held in memory out to the partition files"""
+        if self._files is None:
+            self._tmpdir = tempfile.mkdtemp(
+                prefix='data_pipelines_groups', dir=self.spill_dir
+            )
+            self._files = [
+                open(os.path.join(self._tmpdir, str(i)), 'w+b')
+                for i in range(self.partitions)
+            ]
+        for key, aggs in self.groups.iteritems():
+            handle = self._files[hash(key) % self.partitions]
+            pickle.dump(
+                (key, [agg.state() for agg in aggs]),
+                handle,
+                pickle.HIGHEST_PROTOCOL
+            )
+        self.groups = {}
+
+    def _read_partition(self, handle):
+        """merge the partial aggregates in a partition file"""
+        handle.flush()
+        handle.seek(0)
+        groups = {}
+        while True:
+            try:
+                key, states = pickle.load(handle)
+            except EOFError:
+                break
+            aggs = [
+                restore_aggregator(spec, state)
+                for spec, state in zip(self.specs, states)
+            ]
+            if key in groups:
+                for existing, agg in zip(groups[key], aggs):
+                    existing.merge(agg)
+            else:
+                groups[key] = aggs
+        return groups
+
+    def items(self):
+        """iterate over key, [aggregators] for every group"""
+        if self._files is None:
+            for item in self.groups.iteritems():
+                yield item
+            return
+        self.spill()
+        try:
+            for handle in self._files:
+                for item in self._read_partition(handle).iteritems():
+                    yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """remove any spill files"""
+        if self._files is not None:
+            for handle in self._files:
+                handle.close()
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._files = None
+        self.groups = {}
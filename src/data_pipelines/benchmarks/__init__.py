@@ -0,0 +1,7 @@
+#!/usr/bin/env python
+"""
+benchmarks
+
+Benchmark scripts, run with python -m data_pipelines.benchmarks.<name>
+
+"""
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+build benchmark
+
+Time serializing, encoding, decoding and building very large
+pipeline configurations: a long linear chain of operators and
+deeply nested PipelineMaps.
+
+python -m data_pipelines.benchmarks.build [operators] [depth]
+
+"""
+import sys
+import json
+import time
+
+from data_pipelines.pipelines import (
+    Pipeline,
+    PipelineMap,
+    PipelineTransform,
+    build_pipeline
+)
+
+
+def identity(value):
+    return value
+
+
+def linear_pipeline(count):
+    """a pipeline of count chained transforms"""
+    first = last = PipelineTransform(action=identity)
+    for _ in range(count - 1):
+        oper = PipelineTransform(action=identity)
+        oper.chain(last)
+        last = oper
+    return Pipeline(first, last)
+
+
+def nested_pipeline(depth, width=2):
+    """
+    a pipeline of maps nested depth deep, each map
+    containing width pipelines, one of which holds the next map
+    """
+    inner = linear_pipeline(width)
+    for _ in range(depth):
+        pmap = PipelineMap()
+        pmap.add_pipeline(inner)
+        for _ in range(width - 1):
+            pmap.add_pipeline(linear_pipeline(width))
+        inner = Pipeline(pmap, pmap)
+    return inner
+
+
+def timed(func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    return result, time.time() - start
+
+
+def benchmark(label, pipeline):
+    conf, serialize = timed(pipeline.to_json, flat=True)
+    text, encode = timed(json.dumps, conf)
+    decoded, decode = timed(json.loads, text)
+    _, build = timed(build_pipeline, decoded)
+    row = "{:<24} {:>10} {:>10.4f} {:>10.4f} {:>10.4f} {:>10.4f}"
+    print(row.format(
+        label, len(conf['operators']), serialize, encode, decode, build
+    ))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    operators = int(argv[0]) if argv else 10000
+    depth = int(argv[1]) if len(argv) > 1 else 1000
+    header = "{:<24} {:>10} {:>10} {:>10} {:>10} {:>10}"
+    print(header.format(
+        'pipeline', 'operators', 'to_json', 'dumps', 'loads', 'build'
+    ))
+    benchmark('linear x{}'.format(operators), linear_pipeline(operators))
+    benchmark('nested maps x{}'.format(depth), nested_pipeline(depth))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+serialization benchmark
+
+Compare the encode and decode speed and encoded size of the
+available codecs on representative element payloads.
+
+python -m data_pipelines.benchmarks.serialization [repeat]
+
+"""
+import sys
+import timeit
+
+from data_pipelines.serialization import available_codecs, get_codec
+
+
+def small_element():
+    """a typical small record, eg a redis hash as a dict"""
+    return {
+        'id': 12345,
+        'name': 'element-12345',
+        'score': 0.75,
+        'active': True,
+        'tags': ['a', 'b', 'c'],
+    }
+
+
+def medium_element():
+    """a record with nested content, around 2KB encoded"""
+    return {
+        'id': 12345,
+        'events': [
+            {'ts': 1453248000 + i, 'type': 'click', 'value': i * 0.5}
+            for i in range(40)
+        ],
+        'meta': dict(('field{}'.format(i), 'value{}'.format(i))
+                     for i in range(20)),
+    }
+
+
+def large_element():
+    """a large numeric payload, around 100KB encoded"""
+    return {
+        'id': 12345,
+        'samples': [float(i) / 7 for i in range(5000)],
+    }
+
+
+PAYLOADS = [
+    ('small', small_element()),
+    ('medium', medium_element()),
+    ('large', large_element()),
+]
+
+
+def benchmark(codec_name, payload, number):
+    """return encoded size and per call encode/decode times in usec"""
+    codec = get_codec(codec_name)
+    encoded = codec.encode(payload)
+    encode = timeit.timeit(lambda: codec.encode(payload), number=number)
+    decode = timeit.timeit(lambda: codec.decode(encoded), number=number)
+    return (
+        len(encoded),
+        encode * 1e6 / number,
+        decode * 1e6 / number
+    )
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    repeat = int(argv[0]) if argv else 2000
+    row = "{:<8} {:<8} {:>10} {:>12} {:>12}"
+    print(row.format('payload', 'codec', 'bytes', 'encode us', 'decode us'))
+    for label, payload in PAYLOADS:
+        number = max(repeat // (10 if label == 'large' else 1), 1)
+        for name in available_codecs():
+            size, enc, dec = benchmark(name, payload, number)
+            print(row.format(
+                label, name, size, '{:.2f}'.format(enc), '{:.2f}'.format(dec)
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+"""
+server load benchmark
+
+Load test the pipeline REST server: POST pipeline configs to
+/data_pipelines/run_once from a number of concurrent clients and
+report the request rate and latency percentiles.
+
+By default the server app is run in process on a local port,
+with the local spooler running the jobs in place of uwsgi and a
+fake redis (fakeredis is needed) holding keys for the RedisScan
+pipelines to read, which connect to it with the fake_client
+client_factory. In that mode the job completion rate and the
+time from sending each request to its job finishing are reported
+too, along with the most jobs that were waiting for a worker.
+
+python -m data_pipelines.benchmarks.server_load \\
+    --requests 1000 --concurrency 16 --workers 4 --keys 1000
+
+With --url the requests are sent to a running server instead,
+eg one under uwsgi, and only the request latencies are reported.
+The pipelines it runs then read from the redis it is configured
+to use.
+
+"""
+import os
+import sys
+import json
+import time
+import urllib2
+import argparse
+import threading
+
+from data_pipelines.utilities import object_name
+from data_pipelines.pipelines import (
+    Pipeline,
+    PipelineSource,
+    PipelineTransform
+)
+
+
+RUN_ONCE = '/data_pipelines/run_once'
+PREFIX = 'load:'
+
+# fake redis server the pipelines read from when run locally
+FAKE_SERVER = None
+
+
+def value_size(value):
+    """transform run by the load test pipelines"""
+    return len(value or '')
+
+
+def fake_client(**kwargs):
+    """RedisScan client_factory connecting to FAKE_SERVER"""
+    import fakeredis
+    return fakeredis.FakeRedis(server=FAKE_SERVER)
+
+
+def pipeline_config(keys, client_factory=None):
+    """a pipeline that scans the load test keys"""
+    config = {'match': '{}*'.format(PREFIX), 'count': max(keys, 10)}
+    if client_factory is not None:
+        config['client_factory'] = object_name(client_factory)
+    source = PipelineSource(plugin='RedisScan', config=config)
+    size = PipelineTransform(action=value_size)
+    size.chain(source)
+    return Pipeline(source, size).to_json()
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """nearest rank percentiles of values, plus the max"""
+    if not values:
+        return {}
+    values = sorted(values)
+    result = {}
+    for point in points:
+        rank = max(int(round(point / 100.0 * len(values))) - 1, 0)
+        result['p{}'.format(point)] = values[rank]
+    result['max'] = values[-1]
+    return result
+
+
+def post(url, body):
+    """POST a JSON body, returning the decoded response"""
+    req = urllib2.Request(
+        url, json.dumps(body), {'Content-Type': 'application/json'}
+    )
+    return json.loads(urllib2.urlopen(req, timeout=60).read())
+
+
+class LoadClient(threading.Thread):
+    """
+    client thread sending count requests in sequence, recording
+    the send time and latency of each and the job it spooled
+    """
+    def __init__(self, url, body, count):
+        super(LoadClient, self).__init__()
+        self.daemon = True
+        self.url = url
+        self.body = body
+        self.count = count
+        self.sent = []
+        self.errors = 0
+
+    def run(self):
+        for _ in range(self.count):
+            start = time.time()
+            try:
+                response = post(self.url, self.body)
+            except Exception:
+                self.errors += 1
+                continue
+            self.sent.append(
+                (start, time.time() - start, response.get('spooled'))
+            )
+
+
+def run_clients(url, body, requests, concurrency):
+    """send requests from concurrency clients, returning the clients"""
+    per_client, extra = divmod(requests, concurrency)
+    clients = [
+        LoadClient(url, body, per_client + (1 if i < extra else 0))
+        for i in range(concurrency)
+    ]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    return clients
+
+
+def request_report(clients, seconds):
+    """request rate and latency summary"""
+    sent = [item for client in clients for item in client.sent]
+    return {
+        'requests': len(sent),
+        'errors': sum(client.errors for client in clients),
+        'seconds': seconds,
+        'requests_per_second': len(sent) / seconds if seconds else None,
+        'latency': percentiles([latency for _, latency, _ in sent]),
+    }
+
+
+def job_report(clients, spooler, seconds):
+    """completion rate and time to result of the spooled jobs"""
+    sent = [item for client in clients for item in client.sent]
+    completed = []
+    failed = 0
+    for start, _, job in sent:
+        record = spooler.record(job)
+        if record is None or not record['runs']:
+            continue
+        if record['errors']:
+            failed += 1
+            continue
+        completed.append(record['finished'] - start)
+    return {
+        'jobs': len(sent),
+        'completed': len(completed),
+        'failed': failed,
+        'jobs_per_second': len(completed) / seconds if seconds else None,
+        'time_to_result': percentiles(completed),
+    }
+
+
+def _sample_queue(spooler, stop, depths):
+    while not stop.is_set():
+        depths.append(spooler.pending())
+        time.sleep(0.005)
+
+
+def run_local(requests, concurrency, workers, keys, timeout=300):
+    """
+    run the server app in process with the local spooler
+    and fake redis, and load test it
+    """
+    global FAKE_SERVER
+    import fakeredis
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    from data_pipelines.server import get_logger
+    from data_pipelines.server.local_spooler import get_spooler
+
+    os.environ.setdefault('DATA_PIPELINES_LOCAL_SPOOLER', '1')
+    from data_pipelines.server import pipeline_server
+    spooler = get_spooler()
+    if pipeline_server.uwsgi is not spooler:
+        msg = "The server is using uwsgi, load test it with --url"
+        raise RuntimeError(msg)
+    get_logger().setLevel('WARNING')
+    FAKE_SERVER = fakeredis.FakeServer()
+    redis = fakeredis.FakeRedis(server=FAKE_SERVER)
+    for i in range(keys):
+        redis.set('{}{}'.format(PREFIX, i), 'value{}'.format(i))
+    spooler.workers = max(spooler.workers, workers)
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    httpd = make_server(
+        '127.0.0.1', 0, pipeline_server.build_app(), threaded=True,
+        request_handler=QuietHandler
+    )
+    serving = threading.Thread(target=httpd.serve_forever)
+    serving.daemon = True
+    serving.start()
+    depths = []
+    stop = threading.Event()
+    sampler = threading.Thread(
+        target=_sample_queue, args=(spooler, stop, depths)
+    )
+    sampler.daemon = True
+    sampler.start()
+    try:
+        url = 'http://127.0.0.1:{}{}'.format(httpd.server_port, RUN_ONCE)
+        start = time.time()
+        body = {'pipeline': pipeline_config(keys, fake_client)}
+        clients = run_clients(url, body, requests, concurrency)
+        sent = time.time() - start
+        spooler.wait(timeout)
+        finished = time.time() - start
+    finally:
+        stop.set()
+        httpd.shutdown()
+    report = request_report(clients, sent)
+    report.update(job_report(clients, spooler, finished))
+    report['max_queue_depth'] = max(depths or [0])
+    return report
+
+
+def run_remote(url, requests, concurrency, keys):
+    """load test a running server"""
+    start = time.time()
+    clients = run_clients(
+        url.rstrip('/') + RUN_ONCE,
+        {'pipeline': pipeline_config(keys)},
+        requests,
+        concurrency
+    )
+    return request_report(clients, time.time() - start)
+
+
+def main(argv=None):
+    """load test the pipeline server"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--keys', type=int, default=100)
+    opts = parser.parse_args(argv)
+    if opts.url:
+        report = run_remote(
+            opts.url, opts.requests, opts.concurrency, opts.keys
+        )
+    else:
+        report = run_local(
+            opts.requests, opts.concurrency, opts.workers, opts.keys
+        )
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""
+caching
+
+Result caches used to memoize pipeline operator actions.
+
+Caches are described by a JSON config so they can be
+serialized with the operator that uses them:
+
+{"type": "lru", "max_entries": 10000}
+{"type": "disk", "path": "/var/cache/pipelines", "max_bytes": 1000000000}
+
+get_cache returns a cache instance that is shared by every operator
+in the process using the same config, so that repeated runs of a
+pipeline, eg continuous spooler jobs, reuse earlier results.
+
+"""
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+MISSING = object()
+
+_CACHES = {}
+
+
+def input_key(name, value):
+    """
+    _input_key_
+
+    Build a cache key from the name of an action and
+    a hash of the input value
+    """
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    elif not isinstance(value, str):
+        try:
+            value = pickle.dumps(value, 2)
+        except (TypeError, pickle.PicklingError):
+            value = bytes(value)
+    digest = hashlib.sha1(name)
+    digest.update(value)
+    return digest.hexdigest()
+
+
+class LRUCache(object):
+    """
+    _LRUCache_
+
+    In memory cache that holds at most max_entries values,
+    discarding the least recently used when full
+    """
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=MISSING):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            return default
+        self._data[key] = value
+        return value
+
+    def set(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+
+class DiskCache(object):
+    """
+    _DiskCache_
+
+    Cache that pickles values to files in a directory, limited
+    to max_bytes in total and discarding the least recently used
+    entries when full. Entries persist between processes.
+    """
+    def __init__(self, path, max_bytes=2 ** 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._sizes = OrderedDict()
+        self._total = 0
+        if not os.path.exists(path):
+            os.makedirs(path)
+        entries = []
+        for name in os.listdir(path):
+            if name.endswith('.tmp'):
+                continue
+            stat = os.stat(os.path.join(path, name))
+            entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._sizes[name] = size
+            self._total += size
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def _filename(self, key):
+        return os.path.join(self.path, key)
+
+    def get(self, key, default=MISSING):
+        if key not in self._sizes:
+            return default
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as handle:
+                value = pickle.load(handle)
+        except (IOError, OSError):
+            self._discard(key)
+            return default
+        os.utime(filename, None)
+        self._sizes[key] = self._sizes.pop(key)
+        return value
+
+    def set(self, key, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        self._discard(key)
+        filename = self._filename(key)
+        tmp = '{}.tmp'.format(filename)
+        with open(tmp, 'wb') as handle:
+            handle.write(data)
+        os.rename(tmp, filename)
+        self._sizes[key] = len(data)
+        self._total += len(data)
+        while self._total > self.max_bytes:
+            self._discard(next(iter(self._sizes)))
+
+    def _discard(self, key):
+        size = self._sizes.pop(key, None)
+        if size is None:
+            return
+        self._total -= size
+        try:
+            os.remove(self._filename(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for key in list(self._sizes):
+            self._discard(key)
+
+
+CACHE_TYPES = {
+    'lru': LRUCache,
+    'disk': DiskCache
+}
+
+
+def get_cache(config):
+    """
+    _get_cache_
+
+    Return the shared cache instance for the config provided
+    """
+    name = json.dumps(config, sort_keys=True)
+    if name not in _CACHES:
+        settings = dict(config)
+        cache_type = settings.pop('type', 'lru')
+        _CACHES[name] = CACHE_TYPES[cache_type](**settings)
+    return _CACHES[name]
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""
+columnar
+
+Columnar record batches for passing tabular data between
+pipeline operators a block at a time instead of as individual
+python objects, plus the predicate helpers used to push
+filters down into columnar sources.
+
+Columns are NumPy arrays, Apache Arrow tables can be converted
+if pyarrow is installed.
+
+Example filter that can be pushed down into a ColumnarFile source:
+
+@predicate('age', '>', 30)
+def over_thirty(row):
+    return row['age'] > 30
+
+"""
+import os
+import json
+import operator
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+META_FILE = '_columns.json'
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda col, values: numpy.in1d(col, list(values)),
+    'not in': lambda col, values: ~numpy.in1d(col, list(values)),
+}
+
+
+def require_numpy():
+    """raise a helpful error if numpy isnt available"""
+    if numpy is None:
+        msg = "numpy is required for columnar data support"
+        raise RuntimeError(msg)
+
+
+def predicate(column, op, value):
+    """
+    _predicate_
+
+    Decorator for PipelineFilter action functions that declares
+    the filter as equivalent to the column op value expression,
+    so that it can be evaluated by columnar sources instead.
+    The function itself must still implement the same test
+    for a row dictionary.
+    """
+    if op not in OPERATORS:
+        msg = "Unsupported predicate operator: {}".format(op)
+        raise ValueError(msg)
+
+    def decorator(func):
+        func.predicate = [column, op, value]
+        return func
+    return decorator
+
+
+def evaluate(batch, filters):
+    """
+    _evaluate_
+
+    Evaluate a list of [column, op, value] predicates against
+    the batch and return a boolean mask of the rows that
+    satisfy all of them
+    """
+    mask = numpy.ones(len(batch), dtype=bool)
+    for column, op, value in filters:
+        mask &= numpy.asarray(OPERATORS[op](batch[column], value), dtype=bool)
+    return mask
+
+
+def may_match(stats, filters):
+    """
+    _may_match_
+
+    Given a dict of column: (min, max) statistics for a
+    block of rows, return False if the predicates cannot match
+    any row in the block, so that it can be skipped unread
+    """
+    for column, op, value in filters:
+        if column not in stats:
+            continue
+        low, high = stats[column]
+        if op == '==' and (value < low or value > high):
+            return False
+        if op == '<' and not low < value:
+            return False
+        if op == '<=' and not low <= value:
+            return False
+        if op == '>' and not high > value:
+            return False
+        if op == '>=' and not high >= value:
+            return False
+        if op == 'in' and not any(low <= v <= high for v in value):
+            return False
+    return True
+
+
+class RecordBatch(object):
+    """
+    _RecordBatch_
+
+    Block of rows stored as named, equal length NumPy column arrays
+
+    """
+    def __init__(self, columns):
+        require_numpy()
+        self.columns = OrderedDict(
+            (name, numpy.asarray(col)) for name, col in columns.items()
+        )
+        lengths = set(len(col) for col in self.columns.values())
+        if len(lengths) > 1:
+            msg = "RecordBatch columns must have the same length"
+            raise ValueError(msg)
+        self.num_rows = lengths.pop() if lengths else 0
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def names(self):
+        return list(self.columns.keys())
+
+    def select(self, names):
+        """return a batch containing only the named columns"""
+        return RecordBatch(
+            OrderedDict((name, self.columns[name]) for name in names)
+        )
+
+    def filter(self, mask):
+        """return a batch containing the rows where mask is True"""
+        return RecordBatch(
+            OrderedDict(
+                (name, col[mask]) for name, col in self.columns.items()
+            )
+        )
+
+    def rows(self):
+        """iterate over the rows as dictionaries of python values"""
+        names = self.names
+        values = [self.columns[name].tolist() for name in names]
+        for row in zip(*values):
+            yield dict(zip(names, row))
+
+    @staticmethod
+    def from_rows(rows, names=None):
+        """build a batch from a list of row dictionaries"""
+        rows = list(rows)
+        if names is None:
+            names = sorted(rows[0].keys()) if rows else []
+        return RecordBatch(
+            OrderedDict(
+                (name, [row[name] for row in rows]) for name in names
+            )
+        )
+
+    @staticmethod
+    def from_arrow(table):
+        """build a batch from a pyarrow Table or RecordBatch"""
+        columns = OrderedDict()
+        for name, col in zip(table.schema.names, table.columns):
+            chunks = getattr(col, 'chunks', [col])
+            arrays = [c.to_numpy(zero_copy_only=False) for c in chunks]
+            if not arrays:
+                columns[name] = numpy.array([])
+            elif len(arrays) == 1:
+                columns[name] = arrays[0]
+            else:
+                columns[name] = numpy.concatenate(arrays)
+        return RecordBatch(columns)
+
+
+def write_columns(path, batch):
+    """
+    _write_columns_
+
+    Write a RecordBatch (or dict of columns) as a directory
+    of .npy column files that the ColumnarFile source can
+    memory map and read a column at a time.
+    """
+    require_numpy()
+    if not isinstance(batch, RecordBatch):
+        batch = RecordBatch(batch)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for name in batch.names:
+        numpy.save(os.path.join(path, '{}.npy'.format(name)), batch[name])
+    with open(os.path.join(path, META_FILE), 'w') as handle:
+        json.dump({'columns': batch.names, 'num_rows': len(batch)}, handle)
+
+
+def push_down_predicates(pipeline):
+    """
+    _push_down_predicates_
+
+    Move PipelineFilters declared with the predicate decorator
+    that directly follow a ColumnarFile PipelineSource into the
+    source filters setting and remove them from the chain.
+    If the source was chained to a pipeline that only holds such
+    filters, the last one is kept so the pipeline still starts with
+    an operator that can be chained to another input.
+
+    Returns the list of predicates that were pushed down
+    """
+    from .pipelines import PipelineFilter, PipelineSource
+    chain = []
+    oper = pipeline.end
+    while oper is not None:
+        chain.append(oper)
+        oper = getattr(oper, 'input', None)
+    if not chain or not isinstance(chain[-1], PipelineSource):
+        return []
+    source = chain[-1]
+    if source.plugin != 'ColumnarFile':
+        return []
+    pushed = []
+    # walk downstream from the source
+    index = len(chain) - 2
+    while index >= 0:
+        oper = chain[index]
+        if type(oper) is not PipelineFilter:
+            break
+        pred = getattr(oper.action, 'predicate', None)
+        if pred is None:
+            break
+        downstream = chain[index - 1] if index > 0 else None
+        if downstream is None and pipeline.start is oper:
+            break
+        pushed.append(pred)
+        if downstream is not None:
+            downstream.chain(source)
+        else:
+            pipeline.end = source
+        if pipeline.start is oper:
+            pipeline.start = downstream
+        index -= 1
+    if pushed:
+        filters = list(source._config.get('filters', []))
+        filters.extend(pushed)
+        source._config['filters'] = filters
+    return pushed
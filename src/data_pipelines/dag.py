@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+"""
+dag
+
+Run several pipelines together as a DAG, evaluating the
+operators they have in common once.
+
+Pipelines added to a PipelineDAG are merged into a trie keyed by
+operator signatures, the operator config without its label, so
+pipelines that start with the same source (eg a RedisScan with the
+same match) and the same operators share those nodes. Where a node
+feeds more than one downstream chain or sink its output is teed.
+
+dag = PipelineDAG()
+dag.add(Pipeline.from_configuration(conf1))
+dag.add(Pipeline.from_configuration(conf2))
+results1, results2 = dag.execute()
+
+The sinks are read in step, one element at a time from each, so
+the tee buffers only hold the elements one branch is ahead of
+another, but a branch with a very selective filter can still pull
+far ahead of the others. When a branch stops early, eg at a
+PipelineLimit, or its sink finishes, its tee iterator is dropped so
+the tee doesnt keep buffering elements for it.
+
+Operators are only shared if their action can be identified by
+name, lambdas and callable instances are never shared.
+
+"""
+import json
+import inspect
+import itertools
+import collections
+
+from .pipelines import (
+    Pipeline,
+    PipelineOperator,
+    PipelineSource,
+    PipelineMap,
+    serialize
+)
+from .serialization import get_codec, DEFAULT_CODEC
+
+
+def operator_signature(oper):
+    """
+    _operator_signature_
+
+    Return a string identifying what an operator does, regardless
+    of its label and input, or None if it cant be identified
+    and so shouldnt be shared
+    """
+    action = getattr(oper, 'action', None)
+    if action is not None and not inspect.isfunction(action):
+        return None
+    conf = oper._json()
+    conf.pop('label', None)
+    if isinstance(oper, PipelineMap):
+        conf['inputs'] = [serialize(p) for p in oper.inputs]
+    signature = json.dumps(conf, sort_keys=True, default=repr)
+    if '<lambda>' in signature:
+        return None
+    return signature
+
+
+class DagNode(object):
+    """
+    _DagNode_
+
+    An operator in the DAG, the downstream nodes keyed by
+    signature and the indexes of the pipelines that end here
+    """
+    __slots__ = ('oper', 'children', 'sinks')
+
+    def __init__(self, oper):
+        self.oper = oper
+        self.children = collections.OrderedDict()
+        self.sinks = []
+
+
+class TeeBranch(object):
+    """
+    _TeeBranch_
+
+    One of the teed outputs of a shared node. Closing it, which
+    happens when an operator downstream closes its upstream chain,
+    drops the tee iterator so the tee stops holding elements for it
+    """
+    __slots__ = ('_iter',)
+
+    def __init__(self, tee_iter):
+        self._iter = tee_iter
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._iter is None:
+            raise StopIteration
+        return self._iter.next()
+
+    def close(self):
+        self._iter = None
+
+
+class PipelineDAG(object):
+    """
+    _PipelineDAG_
+
+    Set of pipelines evaluated together, sharing common
+    prefixes of operators. Pipelines that dont start with a
+    PipelineSource read from the iterable passed to chain.
+    """
+    __slots__ = ('root', 'pipelines', '_input', '_outputs')
+
+    def __init__(self, pipelines=None):
+        self.root = DagNode(None)
+        self.pipelines = []
+        self._input = None
+        self._outputs = None
+        for pipeline in pipelines or []:
+            self.add(pipeline)
+
+    def add(self, pipeline):
+        """
+        add a Pipeline to the DAG, returning its index
+        in the execute results
+        """
+        if self._outputs is not None:
+            raise RuntimeError("Cant add pipelines to a running DAG")
+        opers = []
+        oper = pipeline.end
+        while isinstance(oper, PipelineOperator):
+            opers.append(oper)
+            if isinstance(oper, PipelineSource):
+                break
+            oper = oper.input
+        node = self.root
+        for oper in reversed(opers):
+            signature = operator_signature(oper)
+            if signature is None:
+                signature = id(oper)
+            child = node.children.get(signature)
+            if child is None:
+                child = node.children[signature] = DagNode(oper)
+            node = child
+        index = len(self.pipelines)
+        node.sinks.append(index)
+        self.pipelines.append(pipeline)
+        return index
+
+    def nodes(self):
+        """iterate over the operator nodes in the DAG"""
+        stack = list(self.root.children.values())
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(node.children.values())
+
+    def chain(self, input_iter):
+        self._input = input_iter
+
+    def _wire(self):
+        """chain each node to the output of its parent"""
+        outputs = [None] * len(self.pipelines)
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.children.values())
+            children = [
+                child for child in node.children.values()
+                if not isinstance(child.oper, PipelineSource)
+            ]
+            consumers = len(children) + len(node.sinks)
+            if not consumers:
+                continue
+            upstream = node.oper if node.oper is not None else self._input
+            if consumers == 1:
+                branches = [upstream]
+            else:
+                branches = [
+                    TeeBranch(branch)
+                    for branch in itertools.tee(upstream, consumers)
+                ]
+            for child in children:
+                child.oper.chain(branches.pop(0))
+            for index in node.sinks:
+                outputs[index] = branches.pop(0)
+        self._outputs = outputs
+
+    def execute(self):
+        """
+        run all the pipelines, returning a list of
+        the results of each in the order they were added
+        """
+        if self._outputs is None:
+            self._wire()
+        results = [[] for _ in self._outputs]
+        active = list(enumerate(self._outputs))
+        while active:
+            running = []
+            for index, output in active:
+                try:
+                    results[index].append(output.next())
+                except StopIteration:
+                    if isinstance(output, TeeBranch):
+                        output.close()
+                    self._outputs[index] = None
+                    continue
+                running.append((index, output))
+            active = running
+        return results
+
+    def close(self, abort=False):
+        """
+        close every operator in the DAG, see PipelineOperator.close
+        """
+        for node in self.nodes():
+            node.oper.close(abort)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(abort=exc_type is not None)
+        return False
+
+
+def run_pipelines(configs, codec=DEFAULT_CODEC):
+    """
+    run_pipelines
+
+    Given an encoded list of pipeline configs, build them into a
+    DAG sharing their common operators and execute it, returning
+    the results of each pipeline
+    """
+    configs = get_codec(codec).decode(configs)
+    with PipelineDAG(
+            [Pipeline.from_configuration(conf) for conf in configs]) as dag:
+        return dag.execute()
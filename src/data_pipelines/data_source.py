@@ -15,6 +15,14 @@ class DataSource(PluggagePlugin):
     """
     PLUGGAGE_FACTORY_NAME = 'data_pipelines.sources'
 
+    # sources that acknowledge elements once they are read, which
+    # cant be prefetched, see data_pipelines.prefetch
+    acknowledges = False
+
+    # sources that can be read again without side effects, so a copy
+    # can be read to sample their elements, see data_pipelines.optimizer
+    rereadable = False
+
     def __init__(self):
         super(DataSource, self).__init__()
 
@@ -24,8 +32,39 @@ class DataSource(PluggagePlugin):
     def disconnect(self):
         pass
 
+    def abort(self):
+        """
+        called instead of disconnect when the pipeline is closed
+        because of an error, sources that commit what they have
+        read when they disconnect should release their connections
+        without committing
+        """
+        self.disconnect()
+
     def __iter__(self):
         return self
 
     def next(self):
         raise StopIteration
+
+    @classmethod
+    def partition_configs(cls, config, partitions):
+        """
+        _partition_configs_
+
+        Return a list of up to partitions source configs that
+        each cover a disjoint part of the data described by config,
+        sources that cant be split return the config unchanged
+        """
+        return [config]
+
+    @classmethod
+    def sample_config(cls, config):
+        """
+        _sample_config_
+
+        Return the config for a copy of the source that is read
+        to sample its elements, without any settings that would
+        make it save state
+        """
+        return config
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""
+distinct
+
+Seen sets used by the PipelineDistinct operator to drop
+duplicate elements, eg keys returned more than once by a
+RedisScan.
+
+A RedisScan returns values by default, and different keys can
+hold equal values, so to drop repeated keys the scan should
+return items with output='items' and the distinct operator use
+item_key as its action:
+
+source = PipelineSource(plugin='RedisScan', config={'output': 'items'})
+distinct = PipelineDistinct(action=item_key)
+
+ExactSet remembers keys exactly, optionally only the most
+recent max_keys of them. BloomFilter remembers keys in a fixed
+size bit array sized for a capacity and false positive rate, so
+memory use doesnt grow with the number of keys, at the cost of
+occasionally treating a new key as a duplicate.
+
+Both can be saved to and loaded from a state file so that
+continuous pipelines skip keys seen by earlier runs.
+
+"""
+import os
+import math
+import struct
+import hashlib
+import collections
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+def item_key(item):
+    """
+    _item_key_
+
+    the key of a {'key': ..., 'value': ...} item returned by
+    the redis sources
+    """
+    return item['key']
+
+
+def key_bytes(key):
+    """encode a key as a string for hashing"""
+    if isinstance(key, unicode):
+        return key.encode('utf-8')
+    if isinstance(key, str):
+        return key
+    return repr(key)
+
+
+class SeenSet(object):
+    """
+    _SeenSet_
+
+    Base class for seen sets, add returns True if the key
+    has not been seen before and records it
+    """
+    def add(self, key):
+        raise NotImplementedError()
+
+    def state(self):
+        raise NotImplementedError()
+
+    def load_state(self, state):
+        raise NotImplementedError()
+
+    def save(self, filename):
+        """write the state to filename, replacing it atomically"""
+        temp = '{}.tmp'.format(filename)
+        with open(temp, 'wb') as handle:
+            pickle.dump(self.state(), handle, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp, filename)
+
+    def load(self, filename):
+        """load the state saved in filename, if it exists"""
+        if not os.path.exists(filename):
+            return False
+        with open(filename, 'rb') as handle:
+            self.load_state(pickle.load(handle))
+        return True
+
+
+class ExactSet(SeenSet):
+    """
+    exact set of keys, if max_keys is set only the most
+    recently added max_keys keys are remembered, so duplicates
+    further apart than that are not detected
+    """
+    def __init__(self, max_keys=None):
+        self.max_keys = max_keys
+        self.keys = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key):
+        if key in self.keys:
+            return False
+        if self.max_keys and len(self.keys) >= self.max_keys:
+            self.keys.popitem(last=False)
+        self.keys[key] = None
+        return True
+
+    def state(self):
+        return {'type': 'exact', 'keys': list(self.keys)}
+
+    def load_state(self, state):
+        self.keys = collections.OrderedDict.fromkeys(state['keys'])
+        while self.max_keys and len(self.keys) > self.max_keys:
+            self.keys.popitem(last=False)
+
+
+class BloomFilter(SeenSet):
+    """
+    Bloom filter sized for capacity keys at a false positive
+    rate of error_rate, the bits are held in a bytearray and
+    the bit positions are derived from a sha1 of the key by
+    double hashing. The false positive rate rises above error_rate
+    once more than capacity keys have been added.
+    """
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        if not 0 < error_rate < 1:
+            raise ValueError("BloomFilter error_rate must be between 0 and 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2
+        ))
+        self.hashes = max(1, int(round(
+            float(self.size) / capacity * math.log(2)
+        )))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, key):
+        first, second = struct.unpack(
+            '<QQ', hashlib.sha1(key_bytes(key)).digest()[:16]
+        )
+        return [
+            (first + i * second) % self.size for i in range(self.hashes)
+        ]
+
+    def __contains__(self, key):
+        return all(
+            self.bits[pos >> 3] & (1 << (pos & 7))
+            for pos in self._positions(key)
+        )
+
+    def add(self, key):
+        new = False
+        for pos in self._positions(key):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                self.bits[pos >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def state(self):
+        return {
+            'type': 'bloom',
+            'capacity': self.capacity,
+            'error_rate': self.error_rate,
+            'count': self.count,
+            'bits': bytes(self.bits),
+        }
+
+    def load_state(self, state):
+        if (state['capacity'], state['error_rate']) != (
+                self.capacity, self.error_rate):
+            msg = "BloomFilter state has a different capacity or error_rate"
+            raise ValueError(msg)
+        self.bits = bytearray(state['bits'])
+        self.count = state['count']
+
+
+def make_seen_set(mode, max_keys=None, capacity=1000000, error_rate=0.001):
+    """
+    _make_seen_set_
+
+    Create the seen set for a distinct mode, exact or bloom
+    """
+    if mode == 'exact':
+        return ExactSet(max_keys=max_keys)
+    if mode == 'bloom':
+        return BloomFilter(capacity=capacity, error_rate=error_rate)
+    raise ValueError("Unsupported distinct mode: {}".format(mode))
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+"""
+distributed
+
+Run a pipeline across many processes and hosts.
+
+A Coordinator splits the PipelineSource of a pipeline config into
+partitions using the source plugin's partition_configs (Integers
+skip/limit ranges, mmap file byte ranges, RedisScan key hashes),
+and publishes a task per partition to a work queue.
+Workers on any host take tasks from the queue, build the pipeline
+from the partition's JSON config, run it and report the results
+back, and the coordinator merges them.
+
+If the pipeline ends in a PipelineReduce or PipelineGroupBy the
+workers run it in partial mode and the coordinator merges the
+partial aggregates. If it ends in a PipelineSort, PipelineTopK,
+PipelineLimit or PipelineDistinct the coordinator runs that
+operator again over the concatenated results, eg merging the
+sorted runs of the partitions or taking the top k of the
+partitions top k. Otherwise the results are concatenated in
+partition order.
+
+Operators whose results depend on seeing every element in order,
+like windows and take while, cant be split across partitions, and
+neither can any of the operators above unless they end the
+pipeline: partition_pipeline raises a ValueError for them.
+
+Both the nested and the flat config formats can be partitioned.
+
+Example, with workers started on other hosts with
+python -m data_pipelines.distributed --host redishost --prefix jobs
+
+queue = RedisWorkQueue(host='redishost', prefix='jobs')
+results = Coordinator(queue, partitions=16).run(pipeline.to_json())
+
+LocalWorkQueue is an in process stand-in for the redis queue
+that can be shared by worker threads.
+
+"""
+import sys
+import copy
+import Queue
+import argparse
+import traceback
+
+import redis
+import pluggage.registry
+
+from .pipelines import Pipeline, build_pipeline, make_operator
+from .serialization import get_codec, DEFAULT_CODEC
+from .utilities import short_uuid
+
+
+AGGREGATING_TYPES = ('PipelineReduce', 'PipelineGroupBy')
+RERUN_TYPES = (
+    'PipelineSort', 'PipelineTopK', 'PipelineLimit', 'PipelineDistinct'
+)
+UNSPLITTABLE_TYPES = ('PipelineWindow', 'PipelineTakeWhile')
+
+
+class WorkQueue(object):
+    """
+    _WorkQueue_
+
+    Interface for the queues carrying tasks to workers and
+    results back to the coordinator. get calls return None
+    if nothing arrives within timeout seconds
+    """
+    def put_task(self, task):
+        raise NotImplementedError()
+
+    def get_task(self, timeout=None):
+        raise NotImplementedError()
+
+    def put_result(self, job, result):
+        raise NotImplementedError()
+
+    def get_result(self, job, timeout=None):
+        raise NotImplementedError()
+
+
+class LocalWorkQueue(WorkQueue):
+    """
+    in process work queue, for tests and for
+    running workers as threads
+    """
+    def __init__(self):
+        self._tasks = Queue.Queue()
+        self._results = {}
+
+    def _result_queue(self, job):
+        return self._results.setdefault(job, Queue.Queue())
+
+    def put_task(self, task):
+        self._tasks.put(task)
+
+    def get_task(self, timeout=None):
+        try:
+            return self._tasks.get(timeout=timeout)
+        except Queue.Empty:
+            return None
+
+    def put_result(self, job, result):
+        self._result_queue(job).put(result)
+
+    def get_result(self, job, timeout=None):
+        try:
+            return self._result_queue(job).get(timeout=timeout)
+        except Queue.Empty:
+            return None
+
+
+class RedisWorkQueue(WorkQueue):
+    """
+    work queue using redis lists, tasks are pushed to
+    <prefix>:tasks and results to <prefix>:results:<job>.
+    Messages are encoded with the named codec.
+    """
+    def __init__(self, host='localhost', port=6379, db=0,
+                 prefix='data_pipelines', codec=DEFAULT_CODEC,
+                 result_ttl=3600, connection=None, **connect_options):
+        self.prefix = prefix
+        self.codec = get_codec(codec)
+        self.result_ttl = result_ttl
+        self._redis = connection or redis.Redis(
+            host=host, port=port, db=db, **connect_options
+        )
+
+    def _tasks_key(self):
+        return '{}:tasks'.format(self.prefix)
+
+    def _results_key(self, job):
+        return '{}:results:{}'.format(self.prefix, job)
+
+    def _pop(self, key, timeout):
+        if timeout is None:
+            timeout = 0
+        else:
+            # BRPOP treats 0 as block forever and only takes whole seconds
+            timeout = max(int(timeout), 1)
+        item = self._redis.brpop(key, timeout=timeout)
+        if item is None:
+            return None
+        return self.codec.decode(item[1])
+
+    def put_task(self, task):
+        self._redis.lpush(self._tasks_key(), self.codec.encode(task))
+
+    def get_task(self, timeout=None):
+        return self._pop(self._tasks_key(), timeout)
+
+    def put_result(self, job, result):
+        key = self._results_key(job)
+        pipe = self._redis.pipeline()
+        pipe.lpush(key, self.codec.encode(result))
+        pipe.expire(key, self.result_ttl)
+        pipe.execute()
+
+    def get_result(self, job, timeout=None):
+        return self._pop(self._results_key(job), timeout)
+
+
+def _end_config(conf):
+    """the config of the last operator of a pipeline config"""
+    if conf.get('format') == 'flat':
+        return conf['operators'][conf['pipelines'][0]['content']]
+    return conf['content']
+
+
+def _operator_configs(conf):
+    """
+    the configs of the operators in a pipeline config,
+    from the last one back to the first
+    """
+    chain = _end_config(conf)
+    while chain is not None:
+        yield chain
+        chain = chain.get('input')
+        if chain is not None and conf.get('format') == 'flat':
+            chain = conf['operators'][chain]
+
+
+def find_source(conf):
+    """
+    _find_source_
+
+    return the PipelineSource config at the root of
+    a pipeline config, or None if there isnt one
+    """
+    for chain in _operator_configs(conf):
+        if chain['type'] == 'PipelineSource':
+            return chain
+    return None
+
+
+def check_partitionable(conf):
+    """
+    _check_partitionable_
+
+    raise ValueError if the results of the pipeline config
+    cant be computed from the results of its partitions
+    """
+    for index, chain in enumerate(_operator_configs(conf)):
+        last = index == 0
+        if chain['type'] in UNSPLITTABLE_TYPES or (
+                not last and
+                chain['type'] in AGGREGATING_TYPES + RERUN_TYPES):
+            msg = "{} {} cant be run across partitions".format(
+                chain['type'], chain['label']
+            )
+            if chain['type'] not in UNSPLITTABLE_TYPES:
+                msg += " unless it is the last operator"
+            raise ValueError(msg)
+
+
+def partition_pipeline(conf, partitions):
+    """
+    _partition_pipeline_
+
+    Return a list of copies of the pipeline config, each with the
+    source restricted to one partition of the data and any
+    aggregating final operator switched to partial mode.
+    Raises ValueError if the pipeline cant be partitioned,
+    see check_partitionable
+    """
+    check_partitionable(conf)
+    source = find_source(conf)
+    if source is None:
+        configs = [source]
+    else:
+        factory = pluggage.registry.get_factory(
+            'data_pipelines.sources',
+            load_modules=['data_pipelines.sources']
+        )
+        plugin = factory.get(source['plugin'])
+        configs = plugin.partition_configs(source['config'], partitions)
+    result = []
+    for source_conf in configs:
+        part = copy.deepcopy(conf)
+        if source_conf is not None:
+            find_source(part)['config'] = source_conf
+        end = _end_config(part)
+        if end['type'] in AGGREGATING_TYPES:
+            end['partial'] = True
+        result.append(part)
+    return result
+
+
+class Coordinator(object):
+    """
+    _Coordinator_
+
+    Split pipelines into partition tasks, publish them to
+    the work queue and merge the results reported by workers
+    """
+    def __init__(self, queue, partitions=4, timeout=None):
+        self.queue = queue
+        self.partitions = partitions
+        self.timeout = timeout
+        self._jobs = {}
+
+    def submit(self, conf):
+        """
+        publish the tasks for a pipeline config
+        and return the job id
+        """
+        job = short_uuid()
+        parts = partition_pipeline(conf, self.partitions)
+        for index, part in enumerate(parts):
+            self.queue.put_task(
+                {'job': job, 'partition': index, 'pipeline': part}
+            )
+        self._jobs[job] = (conf, len(parts))
+        return job
+
+    def results(self, job):
+        """
+        wait for the results of all the tasks in the job
+        and return the merged results
+        """
+        conf, count = self._jobs.pop(job)
+        outputs = [None] * count
+        for _ in range(count):
+            result = self.queue.get_result(job, timeout=self.timeout)
+            if result is None:
+                msg = "Timed out waiting for results of job {}".format(job)
+                raise RuntimeError(msg)
+            if result.get('error'):
+                msg = "Partition {} of job {} failed:\n{}".format(
+                    result['partition'], job, result['error']
+                )
+                raise RuntimeError(msg)
+            outputs[result['partition']] = result['results']
+        return merge_results(conf, outputs)
+
+    def run(self, conf):
+        """run the pipeline config across the workers"""
+        return self.results(self.submit(conf))
+
+
+def merge_results(conf, outputs):
+    """
+    _merge_results_
+
+    Combine the per partition result lists for a pipeline config
+    """
+    end_conf = _end_config(conf)
+    if end_conf['type'] in AGGREGATING_TYPES:
+        end = build_pipeline(conf).end
+        return end.merge_partials(outputs)
+    result = []
+    for output in outputs:
+        result.extend(output)
+    if end_conf['type'] in RERUN_TYPES:
+        end = make_operator(end_conf)
+        if end_conf['type'] == 'PipelineDistinct':
+            # the workers have already used and saved the state
+            end.state_file = None
+        end.chain(iter(result))
+        result = end.execute()
+    return result
+
+
+class Worker(object):
+    """
+    _Worker_
+
+    Take partition tasks from the work queue, run them
+    and report the results
+    """
+    def __init__(self, queue):
+        self.queue = queue
+
+    def process(self, task):
+        """run a task and return the result message"""
+        result = {'job': task['job'], 'partition': task['partition']}
+        try:
+            pipeline = Pipeline.from_configuration(task['pipeline'])
+            result['results'] = pipeline.execute()
+        except Exception:
+            result['error'] = traceback.format_exc()
+        return result
+
+    def run(self, max_tasks=None, timeout=None):
+        """
+        process tasks until max_tasks have been processed or no
+        task arrives within timeout seconds, if either is set
+        """
+        processed = 0
+        while max_tasks is None or processed < max_tasks:
+            task = self.queue.get_task(timeout=timeout)
+            if task is None:
+                if timeout is not None:
+                    break
+                continue
+            self.queue.put_result(task['job'], self.process(task))
+            processed += 1
+        return processed
+
+
+def main(argv=None):
+    """run a worker process against a redis work queue"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=0)
+    parser.add_argument('--prefix', default='data_pipelines')
+    parser.add_argument('--codec', default=DEFAULT_CODEC)
+    parser.add_argument('--max-tasks', type=int, default=None)
+    opts = parser.parse_args(argv)
+    queue = RedisWorkQueue(
+        host=opts.host,
+        port=opts.port,
+        db=opts.db,
+        prefix=opts.prefix,
+        codec=opts.codec
+    )
+    Worker(queue).run(max_tasks=opts.max_tasks)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
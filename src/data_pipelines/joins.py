@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+joins
+
+Lookup tables used by the PipelineJoin operator to enrich
+stream elements with matching data.
+
+Tables are described by a JSON config so they can be serialized
+with the operator:
+
+{
+    "type": "hash",
+    "plugin": "MmapLines",
+    "config": {"filename": "/data/users.json"},
+    "key": "module.get_user_id",
+    "action": "module.parse_line"
+}
+{
+    "type": "redis",
+    "host": "localhost",
+    "prefix": "user:",
+    "codec": "json",
+    "cache": {"type": "lru", "max_entries": 10000}
+}
+
+Hash tables load every row of a data source plugin into memory,
+keyed by the key action (after the optional action is applied
+to each row). Redis tables look keys up with MGET, a batch at a
+time, with a cache in front so repeated keys dont cause round trips.
+
+Both implement lookup(keys) which returns a dict mapping each
+key to a list of the matching rows, empty if there are none, and
+close() to release the rows, connections and caches they hold.
+The key and action of a hash table are resolved to functions by
+PipelineJoin before the table is made.
+
+"""
+import redis
+import pluggage.registry
+
+from .caching import LRUCache, get_cache, input_key, MISSING
+from .serialization import get_codec
+
+
+class HashTable(object):
+    """
+    _HashTable_
+
+    In memory table of key: [rows] built from a data source
+    """
+    def __init__(self, plugin, config=None, key=None, action=None):
+        self.plugin = plugin
+        self.config = config or {}
+        self.key = key
+        self.action = action
+        self.rows = None
+
+    def load(self):
+        """read the whole data source into the table"""
+        factory = pluggage.registry.get_factory(
+            'data_pipelines.sources',
+            load_modules=['data_pipelines.sources']
+        )
+        source = factory(self.plugin, **self.config)
+        source.connect()
+        rows = {}
+        try:
+            for row in source:
+                if self.action is not None:
+                    row = self.action(row)
+                key = row if self.key is None else self.key(row)
+                rows.setdefault(key, []).append(row)
+        finally:
+            source.disconnect()
+        self.rows = rows
+
+    def lookup(self, keys):
+        if self.rows is None:
+            self.load()
+        return dict((key, self.rows.get(key, [])) for key in keys)
+
+    def close(self):
+        self.rows = None
+
+
+class RedisTable(object):
+    """
+    _RedisTable_
+
+    Table of values stored in redis under prefix + key,
+    decoded with the named codec if there is one.
+    Lookups fetch all the keys that arent cached with a single
+    MGET, and cache the results, including misses.
+    The cache config is passed to caching.get_cache, defaulting
+    to an LRU cache private to the table. Cache keys are hashes of
+    the redis server and key, so they are safe to use as file names
+    in a disk cache and tables on different servers dont collide
+    """
+    def __init__(self, host='localhost', port=6379, db=0, prefix='',
+                 codec=None, cache=None, connect_options=None):
+        self.prefix = prefix
+        self.codec = get_codec(codec) if codec is not None else None
+        self._private_cache = cache is None
+        if cache is None:
+            self.cache = LRUCache()
+        else:
+            self.cache = get_cache(cache)
+        self._server = '{}:{}/{}'.format(host, port, db)
+        self._redis = redis.Redis(
+            host=host, port=port, db=db, **(connect_options or {})
+        )
+
+    def _redis_key(self, key):
+        return '{}{}'.format(self.prefix, key)
+
+    def _cache_key(self, redis_key):
+        return input_key(self._server, redis_key)
+
+    def lookup(self, keys):
+        result = {}
+        missing = []
+        for key in keys:
+            if key in result:
+                continue
+            value = self.cache.get(self._cache_key(self._redis_key(key)))
+            if value is MISSING:
+                missing.append(key)
+                result[key] = None
+            else:
+                result[key] = value
+        if missing:
+            redis_keys = [self._redis_key(key) for key in missing]
+            values = self._redis.mget(redis_keys)
+            for key, redis_key, value in zip(missing, redis_keys, values):
+                if value is not None and self.codec is not None:
+                    value = self.codec.decode(value)
+                self.cache.set(self._cache_key(redis_key), value)
+                result[key] = value
+        return dict(
+            (key, [] if value is None else [value])
+            for key, value in result.iteritems()
+        )
+
+    def close(self):
+        """disconnect, and drop the cache if it is private to the table"""
+        if self._redis is not None:
+            self._redis.connection_pool.disconnect()
+        if self._private_cache and self.cache is not None:
+            self.cache.clear()
+        self._redis = None
+        self.cache = None
+
+
+TABLE_TYPES = {
+    'hash': HashTable,
+    'redis': RedisTable,
+}
+
+
+def make_table(config):
+    """
+    _make_table_
+
+    Create a lookup table from its config
+    """
+    options = dict(config)
+    table_type = options.pop('type', 'hash')
+    try:
+        cls = TABLE_TYPES[table_type]
+    except KeyError:
+        raise ValueError("Unsupported table type: {}".format(table_type))
+    return cls(**options)
@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+"""
+optimizer
+
+Cost based reordering of the filters and transforms in a pipeline,
+so chains can be written in whatever order reads naturally, eg an
+expensive enrichment transform before a cheap, selective filter.
+
+Operators are only moved when their actions declare it is safe:
+
+@pure
+def is_active(record):
+    return record['active']
+
+@commutes
+def enrich(record):
+    return dict(record, profile=lookup(record['id']))
+
+pure - the action has no side effects and only depends on its
+    input, so consecutive filters with pure actions can run in any
+    order
+commutes - a pure transform that doesnt change anything that
+    filters look at, so filtering its output is the same as
+    filtering its input and pure filters can be moved ahead of it
+
+Within each run of consecutive pure filters and commuting
+transforms the filters are moved first, ordered by increasing
+cost / (1 - selectivity), so cheap and selective filters drop
+elements before anything else is spent on them.
+
+The cost (seconds per element) and selectivity (fraction of
+elements passed) of each operator are measured on the first
+sample elements, or those read in max_time seconds, read through
+a copy of the pipeline built from its config, or taken from the
+statistics saved by an earlier run in a TuningStore.
+The copy reads from the same source as the pipeline, so only
+sources that declare they are rereadable are sampled, with any
+settings that save state removed from their config (eg RedisScan
+fingerprints) and the state_file of distinct operators dropped.
+For other sources, like a RedisStream consumer group or a
+RedisKeyspace source that waits for changes, measure raises
+ValueError and their statistics have to be given.
+
+Filters are also pushed into the source after reordering:
+filters declared with columnar.predicate into a ColumnarFile
+source (see columnar.push_down_predicates), and a filter declared
+with key_pattern into the match setting of a RedisScan source.
+
+pipeline = Pipeline.from_configuration(conf)
+print(explain(pipeline))
+optimize(pipeline)
+
+"""
+import time
+
+from .utilities import object_name
+from .columnar import push_down_predicates
+from .pipelines import (
+    Pipeline,
+    PipelineMap,
+    PipelineSource,
+    PipelineFilter,
+    PipelineTransform,
+    operator_chain,
+    serialize
+)
+
+
+def pure(func):
+    """declare an action has no side effects"""
+    func.pure = True
+    return func
+
+
+def commutes(func):
+    """declare a transform action doesnt change what filters test"""
+    func.pure = True
+    func.commutes = True
+    return func
+
+
+def key_pattern(pattern):
+    """
+    _key_pattern_
+
+    Decorator for PipelineFilter actions that declares the filter
+    passes exactly the values of redis keys matching the glob
+    pattern, so it can be replaced by the match setting of a
+    RedisScan source. The function itself must still implement the
+    same test for the elements it is given.
+    """
+    def decorator(func):
+        func.pure = True
+        func.key_pattern = pattern
+        return func
+    return decorator
+
+
+def _movable(oper):
+    """True for operators that can be part of a reordered run"""
+    if type(oper) is PipelineFilter:
+        return getattr(oper.action, 'pure', False)
+    if type(oper) is PipelineTransform:
+        return getattr(oper.action, 'commutes', False)
+    return False
+
+
+def segments(chain):
+    """
+    the runs of at least two consecutive movable operators
+    in a chain, as (start, stop) index ranges
+    """
+    result = []
+    start = None
+    for index, oper in enumerate(chain + [None]):
+        if oper is not None and _movable(oper):
+            if start is None:
+                start = index
+            continue
+        if start is not None and index - start > 1:
+            result.append((start, index))
+        start = None
+    return result
+
+
+def _upstream(oper):
+    """oper and every operator upstream of it, including maps"""
+    stack = [oper]
+    while stack:
+        oper = stack.pop()
+        if oper is None:
+            continue
+        yield oper
+        stack.append(oper.input)
+        if isinstance(oper, PipelineMap):
+            stack.extend(p.end for p in oper.inputs)
+
+
+def _sample(pipeline, label, count, max_time):
+    """
+    the first count elements seen by the operator after label,
+    or those seen in max_time seconds, read through a copy of the
+    pipeline that doesnt save any state
+    """
+    copy = Pipeline.from_configuration(serialize(pipeline))
+    oper = copy.end
+    while oper.label != label:
+        oper = oper.input
+    for upstream in _upstream(oper):
+        if isinstance(upstream, PipelineSource):
+            if not upstream.rereadable:
+                msg = "{} cant be read again to sample it, give its stats"
+                raise ValueError(msg.format(upstream.plugin))
+            upstream._config = upstream.sample_config()
+        elif hasattr(upstream, 'state_file'):
+            upstream.state_file = None
+    values = []
+    deadline = time.time() + max_time
+    try:
+        for value in oper:
+            values.append(value)
+            if len(values) >= count or time.time() >= deadline:
+                break
+    finally:
+        copy.close()
+    return values
+
+
+def measure(pipeline, sample=1000, max_time=10):
+    """
+    _measure_
+
+    Measure the cost and selectivity of the operators in the
+    reorderable runs of a pipeline on up to sample elements, or
+    those read in max_time seconds, returns
+    {operator label: {'cost': seconds, 'selectivity': fraction}}
+
+    The elements are read through a copy of the pipeline, so
+    ValueError is raised if a source it reads isnt rereadable
+    """
+    stats = {}
+    chain = operator_chain(pipeline)
+    for start, stop in segments(chain):
+        if start == 0:
+            # nothing upstream to sample from
+            continue
+        values = _sample(
+            pipeline, chain[start - 1].label, sample, max_time
+        )
+        if not values:
+            continue
+        for oper in chain[start:stop]:
+            began = time.time()
+            if type(oper) is PipelineFilter:
+                passed = sum(1 for value in values if oper.action(value))
+            else:
+                values = [oper.action(value) for value in values]
+                passed = len(values)
+            stats[oper.label] = {
+                'cost': (time.time() - began) / len(values),
+                'selectivity': float(passed) / len(values)
+            }
+    return stats
+
+
+def _rank(oper, stats, source):
+    """sort key for the filters in a run, lowest first"""
+    if _pushable(oper, source):
+        return -1
+    measured = stats.get(oper.label)
+    if measured is None or measured['selectivity'] >= 1:
+        return float('inf')
+    return measured['cost'] / (1 - measured['selectivity'])
+
+
+def _pushable(oper, source):
+    """True if a filter could be pushed into the source"""
+    if source is None:
+        return False
+    if source.plugin == 'ColumnarFile':
+        return hasattr(oper.action, 'predicate')
+    if source.plugin == 'RedisScan':
+        return (
+            hasattr(oper.action, 'key_pattern') and
+            not source._config.get('match')
+        )
+    return False
+
+
+def _rechain(pipeline, chain, start, stop, ordered):
+    """replace chain[start:stop] with the operators in ordered"""
+    upstream = chain[start - 1] if start else chain[start].input
+    for oper in ordered:
+        if upstream is not None:
+            oper.chain(upstream)
+        upstream = oper
+    if stop < len(chain):
+        chain[stop].chain(upstream)
+    else:
+        pipeline.end = upstream
+    if pipeline.start is chain[start]:
+        pipeline.start = ordered[0] if ordered else upstream
+    chain[start:stop] = ordered
+
+
+def _push_key_pattern(pipeline, chain):
+    """
+    move a key_pattern filter after a RedisScan into its match,
+    unless it is the only operator of a pipeline chained to the
+    source, which has to keep an operator to chain
+    """
+    source = chain[0]
+    if len(chain) < 2 or not isinstance(source, PipelineSource):
+        return None
+    oper = chain[1]
+    if len(chain) == 2 and pipeline.start is oper:
+        return None
+    if type(oper) is not PipelineFilter or not _pushable(oper, source):
+        return None
+    if source.plugin != 'RedisScan':
+        return None
+    source._config = dict(source._config, match=oper.action.key_pattern)
+    _rechain(pipeline, chain, 1, 2, [])
+    return oper.action.key_pattern
+
+
+def optimize(pipeline, sample=1000, stats=None, store=None, max_time=10):
+    """
+    _optimize_
+
+    Reorder the filters in the pipeline and push them into its
+    source where possible, changing the pipeline in place.
+
+    sample, max_time - limits on the elements measured, see measure
+    stats - measured statistics to use, see measure
+    store - TuningStore holding the statistics of earlier runs,
+        they are measured and saved if there arent any
+
+    Returns the statistics used
+    """
+    if stats is None and store is not None:
+        stats = store.load(_costs_job(pipeline))
+    if not stats:
+        stats = measure(pipeline, sample, max_time)
+        if store is not None and stats:
+            store.save(_costs_job(pipeline), stats)
+    chain = operator_chain(pipeline)
+    source = chain[0] if isinstance(chain[0], PipelineSource) else None
+    for start, stop in segments(chain):
+        run = chain[start:stop]
+        # only filters straight after the source can be pushed into it
+        target = source if start == 1 else None
+        filters = sorted(
+            [oper for oper in run if type(oper) is PipelineFilter],
+            key=lambda oper: _rank(oper, stats, target)
+        )
+        transforms = [oper for oper in run if oper not in filters]
+        _rechain(pipeline, chain, start, stop, filters + transforms)
+    _push_key_pattern(pipeline, chain)
+    push_down_predicates(pipeline)
+    return stats
+
+
+def _costs_job(pipeline):
+    """name the statistics of a pipeline are saved under"""
+    return '{}.costs'.format(pipeline.label)
+
+
+def plan(pipeline, stats):
+    """
+    _plan_
+
+    The steps of a pipeline with their statistics and the
+    estimated cost of each per element read from the source,
+    as a list of dicts, plus the total estimated cost
+    """
+    steps = []
+    rows = 1.0
+    total = 0.0
+    for oper in operator_chain(pipeline):
+        measured = stats.get(oper.label, {})
+        step = {
+            'type': type(oper).__name__,
+            'label': oper.label,
+            'cost': measured.get('cost'),
+            'selectivity': measured.get('selectivity'),
+            'rows': rows
+        }
+        if isinstance(oper, PipelineSource):
+            step['name'] = oper.plugin
+            step['config'] = oper._config
+        elif oper.action is None:
+            # eg limits and timeouts
+            step['name'] = step['type']
+        else:
+            step['name'] = object_name(oper.action)
+        if step['cost'] is not None:
+            total += rows * step['cost']
+            rows *= step['selectivity']
+        steps.append(step)
+    return steps, total
+
+
+def _format_plan(title, steps, total):
+    lines = [
+        '{} (estimated {:.3f}us per source element):'.format(
+            title, total * 1e6
+        )
+    ]
+    for step in steps:
+        line = '  {type}'.format(**step)
+        if step['name'] != step['type']:
+            line += ' {}'.format(step['name'])
+        if 'config' in step:
+            line += ' {}'.format(step['config'])
+        if step['cost'] is not None:
+            line += ' cost={:.3f}us selectivity={:.2f} rows={:.2f}'.format(
+                step['cost'] * 1e6, step['selectivity'], step['rows']
+            )
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def explain(pipeline, sample=1000, stats=None, store=None, max_time=10):
+    """
+    _explain_
+
+    Describe the original plan of the pipeline and the plan
+    optimize would turn it into, with the estimated costs,
+    without changing the pipeline. Like optimize, the statistics
+    are measured on a copy of the pipeline if they arent given
+    """
+    if stats is None and store is not None:
+        stats = store.load(_costs_job(pipeline))
+    if not stats:
+        stats = measure(pipeline, sample, max_time)
+    optimized = Pipeline.from_configuration(serialize(pipeline))
+    optimize(optimized, stats=stats)
+    return '\n'.join([
+        _format_plan('original plan', *plan(pipeline, stats)),
+        _format_plan('optimized plan', *plan(optimized, stats))
+    ])
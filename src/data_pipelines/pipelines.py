@@ -9,8 +9,22 @@ to be a bit more generator friendly
 
 """
 import json
+import time
+import inspect
+import heapq
+import functools
 import itertools
+import collections
 from .utilities import object_name, short_uuid
+from .serialization import get_codec, DEFAULT_CODEC
+from .caching import get_cache, input_key, MISSING
+from .aggregations import make_aggregator, restore_aggregator, GroupTable
+from .windows import make_windower, arrival_time
+from .sorting import ExternalSorter, identity
+from .distinct import make_seen_set
+from .joins import make_table
+from .prefetch import make_prefetcher
+from .tuning import make_tuner
 from pluggage.plugins import Plugins
 import pluggage.registry
 
@@ -28,6 +42,8 @@ class Pipeline(object):
     as a PipelineOperator
 
     """
+    __slots__ = ('start', 'end', 'label')
+
     def __init__(self, first, last, label=None):
         self.start = first
         self.end = last
@@ -42,11 +58,35 @@ class Pipeline(object):
     def execute(self):
         return self.end.execute()
 
-    def to_json(self):
+    def close(self, abort=False):
+        """
+        stop iteration and release the resources held by
+        the operators, see PipelineOperator.close
+        """
+        self.end.close(abort)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # leaving because of an exception aborts the pipeline so
+        # elements that never finished arent committed
+        self.close(abort=exc_type is not None)
+        return False
+
+    def to_json(self, flat=False):
         """
         create a JSON configuration representing
         this pipeline and its content
+
+        The default format nests each operator in the
+        input field of the next, which is limited by
+        the recursion depth of JSON encoders and decoders,
+        flat=True creates a flat list based format for very
+        large pipelines instead (see serialize)
         """
+        if flat:
+            return serialize(self, flat=True)
         return {
             'type': type(self).__name__,
             'label': self.label,
@@ -92,6 +132,8 @@ class PipelineOperator(object):
     results = pipeline.execute()
 
     """
+    __slots__ = ('action', 'input', 'label')
+
     def __init__(self, action=lambda x: x):
         super(PipelineOperator, self).__init__()
         self.action = action
@@ -121,6 +163,74 @@ class PipelineOperator(object):
         """
         self.input = oper
 
+    def configure(self, conf):
+        """
+        _configure_
+
+        Apply operator specific settings from a to_json config,
+        called when building a pipeline from configuration
+        """
+        pass
+
+    def close(self, abort=False):
+        """
+        _close_
+
+        Stop iteration early, closing this operator and every
+        operator upstream of it, including the sub pipelines of
+        PipelineMaps, so that sources disconnect straight away
+        instead of when they run out of data.
+        Inputs that arent operators are closed if they can be.
+
+        abort - the pipeline is closed because of an error, so
+            sources and operators dont commit state (acknowledge
+            entries, save fingerprints or seen keys) for elements
+            that may not have been processed
+        """
+        seen = set()
+        stack = [self]
+        while stack:
+            oper = stack.pop()
+            if id(oper) in seen:
+                continue
+            seen.add(id(oper))
+            if not isinstance(oper, PipelineOperator):
+                if hasattr(oper, 'close'):
+                    oper.close()
+                continue
+            oper._close(abort)
+            if oper.input is not None:
+                stack.append(oper.input)
+            if isinstance(oper, PipelineMap):
+                stack.extend(p.end for p in oper.inputs)
+
+    def _close(self, abort=False):
+        """
+        _close_
+
+        release anything held by this operator when the pipeline
+        is closed, override in operators that hold resources
+        """
+        pass
+
+    def tuning(self):
+        """
+        _tuning_
+
+        Settings chosen by any tuners in this operator and their
+        statistics, as {'settings': {...}, 'stats': {...}}, or None
+        if nothing is tuned (see data_pipelines.tuning)
+        """
+        return None
+
+    def apply_tuning(self, settings):
+        """
+        _apply_tuning_
+
+        Start from settings saved by an earlier run
+        """
+        pass
+
     def execute(self):
         """
         _execute_
@@ -135,22 +245,35 @@ class PipelineOperator(object):
         """
         _to_json_
 
+        JSON configuration for this operator and its inputs
+        """
+        return serialize(self)
+
+    def _json(self):
         """
-        result = {
+        _json_
+
+        JSON configuration of this operator alone,
+        override to add operator specific settings
+        """
+        return {
             "type": type(self).__name__,
             "action": object_name(self.action),
             "label": self.label
         }
-        if isinstance(self.input, PipelineOperator):
-            result['input'] = self.input.to_json()
-        return result
 
 
 class PipelineSource(PipelineOperator):
     """
     Wrapper for a first step operator that loads
     a data source plugin and calls its hooks
+
+    If the config contains a prefetch setting the plugin is run
+    in a background thread or process that reads ahead of the
+    pipeline (see data_pipelines.prefetch)
     """
+    __slots__ = ('plugin', '_plugin', '_config', '_finished', '_tuning')
+
     def __init__(self, plugin=None, config=None):
         super(PipelineSource, self).__init__()
         self.input = None
@@ -158,21 +281,82 @@ class PipelineSource(PipelineOperator):
         self.plugin = plugin
         self._plugin = None
         self._config = config or dict()
+        self._finished = False
+        self._tuning = None
 
-    def _begin(self):
-        """prep for iteration"""
-        factory = pluggage.registry.get_factory(
+    @staticmethod
+    def _factory():
+        return pluggage.registry.get_factory(
             'data_pipelines.sources',
             load_modules=['data_pipelines.sources']
         )
-        self._plugin = factory(self.plugin, **self._config)
+
+    @property
+    def acknowledges(self):
+        """True if the plugin acknowledges the entries it reads"""
+        plugin = self._factory().get(self.plugin)
+        return getattr(plugin, 'acknowledges', False)
+
+    @property
+    def rereadable(self):
+        """True if the plugin can be read again to sample it"""
+        plugin = self._factory().get(self.plugin)
+        return getattr(plugin, 'rereadable', False)
+
+    def sample_config(self):
+        """the config of a copy of the source read to sample it"""
+        plugin = self._factory().get(self.plugin)
+        return plugin.sample_config(dict(self._config))
+
+    def _begin(self):
+        """prep for iteration"""
+        factory = self._factory()
+        config = dict(self._config)
+        prefetch = config.pop('prefetch', None)
+        if prefetch:
+            if self.acknowledges:
+                msg = "{} acknowledges what it reads and cant be prefetched"
+                raise ValueError(msg.format(self.plugin))
+            self._plugin = make_prefetcher(
+                functools.partial(factory, self.plugin, **config), prefetch
+            )
+        else:
+            self._plugin = factory(self.plugin, **config)
         self._plugin.connect()
 
-    def _end(self):
+    def _end(self, abort=False):
         """call end hook for source iterator to close
-        connections etc
+        connections etc, only the first call has any effect
         """
-        self._plugin.disconnect()
+        self._finished = True
+        plugin, self._plugin = self._plugin, None
+        if plugin is not None:
+            if abort:
+                plugin.abort()
+            else:
+                plugin.disconnect()
+            if hasattr(plugin, 'tuning'):
+                self._tuning = plugin.tuning()
+
+    def tuning(self):
+        return self._tuning
+
+    def apply_tuning(self, settings):
+        """
+        use a saved batch size for prefetching, other settings
+        were tuned by the plugin and are set in its config
+        """
+        settings = dict(settings)
+        prefetch = self._config.get('prefetch')
+        if prefetch and 'batch_size' in settings:
+            prefetch = {} if prefetch is True else dict(prefetch)
+            prefetch['batch_size'] = settings.pop('batch_size')
+            self._config = dict(self._config, prefetch=prefetch)
+        if settings:
+            self._config = dict(self._config, **settings)
+
+    def _close(self, abort=False):
+        self._end(abort)
 
     def chain(self):
         pass
@@ -185,6 +369,8 @@ class PipelineSource(PipelineOperator):
         consume the next value from the input,
         call action on it, return the value
         """
+        if self._finished:
+            raise StopIteration
         if self._plugin is None:
             self._begin()
         try:
@@ -194,8 +380,8 @@ class PipelineSource(PipelineOperator):
             raise
         return value
 
-    def to_json(self):
-        result = super(PipelineSource, self).to_json()
+    def _json(self):
+        result = super(PipelineSource, self)._json()
         result['config'] = self._config
         result['plugin'] = self.plugin
         return result
@@ -208,13 +394,54 @@ class PipelineTransform(PipelineOperator):
     within it, compared to the base class which ignores the
     return value, IE it transforms the element using action,
     rather than just calls the action for each
+
+    If a cache config is provided (see data_pipelines.caching)
+    the results of the action are memoized, keyed by the name
+    of the action and a hash of the input, so the action must
+    only depend on its input to be cached.
+    Lambdas, closures and callable objects dont have names that
+    identify them, so their results are also keyed by the label
+    of the operator and are only shared by copies of it.
     """
-    def __init__(self, action=lambda x: x):
+    __slots__ = ('cache', '_cache', '_action_name')
+
+    def __init__(self, action=lambda x: x, cache=None):
         super(PipelineTransform, self).__init__(action)
+        self.cache = cache
+        self._cache = None
+        self._action_name = None
 
     def next(self):
         value = self.input.next()
-        return self.action(value)
+        if self.cache is None:
+            return self.action(value)
+        if self._cache is None:
+            self._cache = get_cache(self.cache)
+            self._action_name = self._cache_name()
+        key = input_key(self._action_name, value)
+        result = self._cache.get(key)
+        if result is MISSING:
+            result = self.action(value)
+            self._cache.set(key, result)
+        return result
+
+    def _cache_name(self):
+        """name the cached results of the action are keyed by"""
+        name = object_name(self.action)
+        action = self.action
+        if (not inspect.isfunction(action) or
+                action.__name__ == '<lambda>' or action.__closure__):
+            name = '{}:{}'.format(name, self.label)
+        return name
+
+    def configure(self, conf):
+        self.cache = conf.get('cache')
+
+    def _json(self):
+        result = super(PipelineTransform, self)._json()
+        if self.cache is not None:
+            result['cache'] = self.cache
+        return result
 
 
 class PipelineFilter(PipelineOperator):
@@ -226,6 +453,8 @@ class PipelineFilter(PipelineOperator):
     some criteria defined in the action function
 
     """
+    __slots__ = ()
+
     def __init__(self, action=lambda x: True):
         super(PipelineFilter, self).__init__(action)
 
@@ -260,6 +489,8 @@ class PipelineMap(PipelineOperator):
     pipelines iterate in step in a sane way.
 
     """
+    __slots__ = ('inputs', 'fillvalue', '_iter', '_pipeline_names')
+
     def __init__(self, fillvalue=None):
         super(PipelineMap, self).__init__()
         self.inputs = []
@@ -306,19 +537,701 @@ class PipelineMap(PipelineOperator):
             raise RuntimeError(msg)
         self.inputs.append(pipeline)
 
-    def to_json(self):
+    def _json(self):
         """
-        _to_json_
+        _json_
 
+        the sub pipelines are added to inputs by serialize
         """
-        result = {
+        return {
             "type": type(self).__name__,
             "label": self.label,
             "fillvalue": json.dumps(self.fillvalue),
-            "inputs": [p.to_json() for p in self.inputs],
         }
-        if isinstance(self.input, PipelineOperator):
-            result['input'] = self.input.to_json()
+
+
+class PipelineReduce(PipelineOperator):
+    """
+    _PipelineReduce_
+
+    Consume the whole input and return a single dictionary
+    of aggregate results, eg:
+
+    PipelineReduce(aggregations={
+        'total': {'type': 'sum', 'action': get_value},
+        'mean': {'type': 'mean', 'action': 'module.get_value'},
+        'count': {'type': 'count'}
+    })
+
+    Each aggregation has a type from data_pipelines.aggregations
+    and an optional action (function or loadable name) that
+    extracts the value to aggregate from each element.
+
+    If partial is True the aggregator states are returned instead
+    of the results, so that the outputs of several pipelines over
+    parts of the data can be combined with merge_partials
+    """
+    __slots__ = ('aggregations', 'partial', '_results')
+
+    def __init__(self, aggregations=None, partial=False):
+        super(PipelineReduce, self).__init__()
+        self.aggregations = aggregations or {'count': {'type': 'count'}}
+        self.partial = partial
+        self._results = None
+
+    def _specs(self):
+        """sorted aggregation names, specs and value functions"""
+        names = sorted(self.aggregations)
+        specs = [self.aggregations[name] for name in names]
+        actions = []
+        for spec in specs:
+            action = spec.get('action')
+            if isinstance(action, basestring):
+                action = LOADER[action]
+            actions.append(action)
+        return names, specs, actions
+
+    def _begin(self):
+        names, specs, actions = self._specs()
+        aggs = [make_aggregator(spec) for spec in specs]
+        for value in self.input:
+            for agg, action in zip(aggs, actions):
+                agg.add(value if action is None else action(value))
+        self._results = iter([self._output(names, aggs)])
+
+    def _output(self, names, aggs):
+        """result dict, or state dict in partial mode"""
+        if self.partial:
+            return dict(
+                (name, agg.state()) for name, agg in zip(names, aggs)
+            )
+        return dict(
+            (name, agg.result()) for name, agg in zip(names, aggs)
+        )
+
+    def _restore(self, names, specs, partial):
+        return [
+            restore_aggregator(spec, partial[name])
+            for name, spec in zip(names, specs)
+        ]
+
+    def merge_partials(self, partials):
+        """
+        _merge_partials_
+
+        Combine lists of partial mode outputs into the final results
+        """
+        names, specs, _ = self._specs()
+        aggs = [make_aggregator(spec) for spec in specs]
+        for outputs in partials:
+            for partial in outputs:
+                for agg, other in zip(
+                        aggs, self._restore(names, specs, partial)):
+                    agg.merge(other)
+        return [
+            dict((name, agg.result()) for name, agg in zip(names, aggs))
+        ]
+
+    def next(self):
+        if self._results is None:
+            self._begin()
+        return self._results.next()
+
+    def _close(self, abort=False):
+        if hasattr(self._results, 'close'):
+            self._results.close()
+
+    def configure(self, conf):
+        self.aggregations = conf['aggregations']
+        self.partial = conf.get('partial', False)
+
+    def _aggregations_json(self):
+        result = {}
+        for name, spec in self.aggregations.items():
+            spec = dict(spec)
+            if spec.get('action') is not None:
+                action = spec['action']
+                if not isinstance(action, basestring):
+                    spec['action'] = object_name(action)
+            result[name] = spec
+        return result
+
+    def _json(self):
+        result = super(PipelineReduce, self)._json()
+        del result['action']
+        result['aggregations'] = self._aggregations_json()
+        if self.partial:
+            result['partial'] = True
+        return result
+
+
+class PipelineGroupBy(PipelineReduce):
+    """
+    _PipelineGroupBy_
+
+    Consume the whole input, grouping elements by the key returned
+    by action and aggregating each group as described for
+    PipelineReduce. Returns a dictionary per group containing the
+    key and the aggregate results, in no particular order.
+
+    At most max_keys groups are held in memory, beyond that the
+    partial aggregates are spilled to disk in partitions files
+    created in spill_dir (see data_pipelines.aggregations.GroupTable)
+    """
+    __slots__ = ('max_keys', 'partitions', 'spill_dir')
+
+    def __init__(self, action=lambda x: x, aggregations=None,
+                 max_keys=None, partitions=16, spill_dir=None,
+                 partial=False):
+        super(PipelineGroupBy, self).__init__(aggregations, partial)
+        self.action = action
+        self.max_keys = max_keys
+        self.partitions = partitions
+        self.spill_dir = spill_dir
+        if 'key' in self.aggregations:
+            msg = "key is reserved for the group key"
+            raise ValueError(msg)
+
+    def _begin(self):
+        names, specs, actions = self._specs()
+        table = GroupTable(
+            specs,
+            max_keys=self.max_keys,
+            partitions=self.partitions,
+            spill_dir=self.spill_dir
+        )
+        for value in self.input:
+            table.add(
+                self.action(value),
+                [value if a is None else a(value) for a in actions]
+            )
+        self._results = self._group_results(names, table)
+
+    def _group_results(self, names, table):
+        for key, aggs in table.items():
+            result = self._output(names, aggs)
+            result['key'] = key
+            yield result
+
+    def merge_partials(self, partials):
+        """
+        _merge_partials_
+
+        Combine lists of partial mode outputs into the final
+        results per group. Keys that were converted to lists by
+        serialization are grouped as tuples
+        """
+        names, specs, _ = self._specs()
+        groups = {}
+        for outputs in partials:
+            for partial in outputs:
+                key = partial['key']
+                if isinstance(key, list):
+                    key = tuple(key)
+                aggs = self._restore(names, specs, partial)
+                if key in groups:
+                    for agg, other in zip(groups[key], aggs):
+                        agg.merge(other)
+                else:
+                    groups[key] = aggs
+        results = []
+        for key, aggs in groups.iteritems():
+            result = dict(
+                (name, agg.result()) for name, agg in zip(names, aggs)
+            )
+            result['key'] = key
+            results.append(result)
+        return results
+
+    def configure(self, conf):
+        super(PipelineGroupBy, self).configure(conf)
+        self.max_keys = conf.get('max_keys')
+        self.partitions = conf.get('partitions', 16)
+        self.spill_dir = conf.get('spill_dir')
+
+    def _json(self):
+        result = super(PipelineGroupBy, self)._json()
+        result['action'] = object_name(self.action)
+        result['max_keys'] = self.max_keys
+        result['partitions'] = self.partitions
+        result['spill_dir'] = self.spill_dir
+        return result
+
+
+class PipelineWindow(PipelineReduce):
+    """
+    _PipelineWindow_
+
+    Aggregate a stream over windows, returning a dictionary of
+    aggregate results plus the window start and end for each
+    window as it completes (see data_pipelines.windows)
+
+    mode - 'count' for windows measured in elements, or 'time'
+        for windows measured in seconds using the timestamps
+        returned by action, which default to the arrival time
+    kind - 'tumbling', 'sliding' or (time mode only) 'session'
+    size - window length in elements or seconds
+    slide - distance between sliding window starts, defaults to 1
+        element for count windows and size for time windows
+    gap - inactivity in seconds that ends a session window
+    capacity - most elements held by a time sliding window
+    aggregations - count, sum, mean, min and max aggregations,
+        in the same format as PipelineReduce
+    """
+    __slots__ = (
+        'mode', 'kind', 'size', 'slide', 'gap', 'capacity',
+        '_windower', '_pending', '_finished'
+    )
+
+    def __init__(self, action=arrival_time, aggregations=None, mode='count',
+                 kind='tumbling', size=100, slide=None, gap=None,
+                 capacity=10000):
+        super(PipelineWindow, self).__init__(aggregations)
+        self.action = action
+        self.mode = mode
+        self.kind = kind
+        self.size = size
+        self.slide = slide
+        self.gap = gap
+        self.capacity = capacity
+        self._windower = None
+        self._pending = collections.deque()
+        self._finished = False
+
+    def _begin(self):
+        names, specs, actions = self._specs()
+        options = {'size': self.size, 'gap': self.gap}
+        if self.slide is not None:
+            options['slide'] = self.slide
+        if self.mode == 'time':
+            options['capacity'] = self.capacity
+        self._windower = make_windower(
+            self.mode, self.kind, names, specs, actions, **options
+        )
+
+    def next(self):
+        if self._windower is None:
+            self._begin()
+        while not self._pending:
+            if self._finished:
+                raise StopIteration
+            try:
+                value = self.input.next()
+            except StopIteration:
+                self._finished = True
+                self._pending.extend(self._windower.flush())
+                continue
+            timestamp = None
+            if self.mode == 'time':
+                timestamp = self.action(value)
+            self._pending.extend(self._windower.add(value, timestamp))
+        return self._pending.popleft()
+
+    def configure(self, conf):
+        super(PipelineWindow, self).configure(conf)
+        for attr in ('mode', 'kind', 'size', 'slide', 'gap', 'capacity'):
+            setattr(self, attr, conf.get(attr, getattr(self, attr)))
+
+    def _json(self):
+        result = super(PipelineWindow, self)._json()
+        result['action'] = object_name(self.action)
+        for attr in ('mode', 'kind', 'size', 'slide', 'gap', 'capacity'):
+            result[attr] = getattr(self, attr)
+        return result
+
+
+class PipelineSort(PipelineOperator):
+    """
+    _PipelineSort_
+
+    Consume the whole input and return the elements sorted by
+    the key returned by action, or by the elements themselves.
+    The sort is stable and runs in bounded memory, holding at most
+    max_items elements before spilling sorted runs to files in
+    spill_dir that are merged lazily as the output is read
+    (see data_pipelines.sorting.ExternalSorter)
+    """
+    __slots__ = ('reverse', 'max_items', 'fan_in', 'spill_dir', '_results')
+
+    def __init__(self, action=identity, reverse=False, max_items=100000,
+                 fan_in=64, spill_dir=None):
+        super(PipelineSort, self).__init__(action)
+        self.reverse = reverse
+        self.max_items = max_items
+        self.fan_in = fan_in
+        self.spill_dir = spill_dir
+        self._results = None
+
+    def _begin(self):
+        sorter = ExternalSorter(
+            key=self.action,
+            reverse=self.reverse,
+            max_items=self.max_items,
+            fan_in=self.fan_in,
+            spill_dir=self.spill_dir
+        )
+        try:
+            for value in self.input:
+                sorter.add(value)
+        except Exception:
+            sorter.close()
+            raise
+        self._results = sorter.items()
+
+    def next(self):
+        if self._results is None:
+            self._begin()
+        return self._results.next()
+
+    def _close(self, abort=False):
+        if self._results is not None:
+            self._results.close()
+
+    def configure(self, conf):
+        for attr in ('reverse', 'max_items', 'fan_in', 'spill_dir'):
+            setattr(self, attr, conf.get(attr, getattr(self, attr)))
+
+    def _json(self):
+        result = super(PipelineSort, self)._json()
+        for attr in ('reverse', 'max_items', 'fan_in', 'spill_dir'):
+            result[attr] = getattr(self, attr)
+        return result
+
+
+class PipelineTopK(PipelineOperator):
+    """
+    _PipelineTopK_
+
+    Consume the whole input and return the k elements with
+    the largest keys returned by action, largest first, or the
+    k smallest, smallest first, if smallest is True.
+    Only k elements are held in memory, in a heap.
+    """
+    __slots__ = ('k', 'smallest', '_results')
+
+    def __init__(self, action=identity, k=10, smallest=False):
+        super(PipelineTopK, self).__init__(action)
+        self.k = k
+        self.smallest = smallest
+        self._results = None
+
+    def next(self):
+        if self._results is None:
+            select = heapq.nsmallest if self.smallest else heapq.nlargest
+            self._results = iter(select(self.k, self.input, key=self.action))
+        return self._results.next()
+
+    def configure(self, conf):
+        self.k = conf.get('k', self.k)
+        self.smallest = conf.get('smallest', self.smallest)
+
+    def _json(self):
+        result = super(PipelineTopK, self)._json()
+        result['k'] = self.k
+        result['smallest'] = self.smallest
+        return result
+
+
+class PipelineDistinct(PipelineOperator):
+    """
+    _PipelineDistinct_
+
+    Pass on only the first element seen for each key returned
+    by action, or for each element if there is no action.
+    To drop keys returned more than once by a RedisScan, scan
+    with output='items' and use distinct.item_key as the action,
+    the values of different keys can be equal.
+
+    mode - 'exact' to remember keys in a set, holding at most
+        max_keys of the most recent keys if max_keys is set, or
+        'bloom' to remember them in a Bloom filter sized for
+        capacity keys with a false positive rate of error_rate,
+        which occasionally drops a new element as a duplicate
+    state_file - if set, the seen keys are loaded from this file
+        when iteration starts and saved to it when it ends, so that
+        continuous runs skip keys seen by earlier runs
+
+    See data_pipelines.distinct
+    """
+    __slots__ = (
+        'mode', 'max_keys', 'capacity', 'error_rate', 'state_file', '_seen'
+    )
+
+    def __init__(self, action=identity, mode='exact', max_keys=None,
+                 capacity=1000000, error_rate=0.001, state_file=None):
+        super(PipelineDistinct, self).__init__(action)
+        self.mode = mode
+        self.max_keys = max_keys
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.state_file = state_file
+        self._seen = None
+
+    def _begin(self):
+        self._seen = make_seen_set(
+            self.mode,
+            max_keys=self.max_keys,
+            capacity=self.capacity,
+            error_rate=self.error_rate
+        )
+        if self.state_file is not None:
+            self._seen.load(self.state_file)
+
+    def next(self):
+        if self._seen is None:
+            self._begin()
+        while True:
+            try:
+                value = self.input.next()
+            except StopIteration:
+                self._save()
+                raise
+            if self._seen.add(self.action(value)):
+                return value
+
+    def _save(self):
+        if self._seen is not None and self.state_file is not None:
+            self._seen.save(self.state_file)
+
+    def _close(self, abort=False):
+        """
+        save the seen keys when a downstream operator stops early,
+        but not when the pipeline is aborted
+        """
+        if not abort:
+            self._save()
+
+    def configure(self, conf):
+        for attr in ('mode', 'max_keys', 'capacity', 'error_rate',
+                     'state_file'):
+            setattr(self, attr, conf.get(attr, getattr(self, attr)))
+
+    def _json(self):
+        result = super(PipelineDistinct, self)._json()
+        for attr in ('mode', 'max_keys', 'capacity', 'error_rate',
+                     'state_file'):
+            result[attr] = getattr(self, attr)
+        return result
+
+
+class PipelineLimit(PipelineOperator):
+    """
+    _PipelineLimit_
+
+    Pass on at most count elements, then close the operators
+    upstream so that the source stops fetching and disconnects
+    without reading the rest of its data
+    """
+    __slots__ = ('count', '_taken')
+
+    def __init__(self, count=10):
+        super(PipelineLimit, self).__init__()
+        self.action = None
+        self.count = count
+        self._taken = 0
+
+    def next(self):
+        if self._taken >= self.count:
+            self.close()
+            raise StopIteration
+        value = self.input.next()
+        self._taken += 1
+        if self._taken >= self.count:
+            self.close()
+        return value
+
+    def configure(self, conf):
+        self.count = conf.get('count', self.count)
+
+    def _json(self):
+        return {
+            "type": type(self).__name__,
+            "label": self.label,
+            "count": self.count
+        }
+
+
+class PipelineTakeWhile(PipelineOperator):
+    """
+    _PipelineTakeWhile_
+
+    Pass on elements while the action evaluates to True, at the
+    first element that fails the iteration ends and the operators
+    upstream are closed
+    """
+    __slots__ = ('_done',)
+
+    def __init__(self, action=lambda x: True):
+        super(PipelineTakeWhile, self).__init__(action)
+        self._done = False
+
+    def next(self):
+        if not self._done:
+            value = self.input.next()
+            if self.action(value):
+                return value
+            self._done = True
+        self.close()
+        raise StopIteration
+
+
+class PipelineTimeout(PipelineOperator):
+    """
+    _PipelineTimeout_
+
+    End the iteration once seconds have passed since the first
+    element was requested, closing the operators upstream.
+    The time is checked between elements, so an upstream operator
+    that blocks (eg a stream source waiting for entries) is not
+    interrupted until it returns its next element
+    """
+    __slots__ = ('seconds', '_deadline')
+
+    def __init__(self, seconds=60):
+        super(PipelineTimeout, self).__init__()
+        self.action = None
+        self.seconds = seconds
+        self._deadline = None
+
+    def next(self):
+        now = time.time()
+        if self._deadline is None:
+            self._deadline = now + self.seconds
+        if now >= self._deadline:
+            self.close()
+            raise StopIteration
+        return self.input.next()
+
+    def configure(self, conf):
+        self.seconds = conf.get('seconds', self.seconds)
+
+    def _json(self):
+        return {
+            "type": type(self).__name__,
+            "label": self.label,
+            "seconds": self.seconds
+        }
+
+
+def join_pair(value, match):
+    """default PipelineJoin output, the element and its match"""
+    return {'value': value, 'match': match}
+
+
+class PipelineJoin(PipelineOperator):
+    """
+    _PipelineJoin_
+
+    Join each element with the rows of a lookup table that match
+    the key returned by action, returning combine(element, row)
+    for each matching row (see data_pipelines.joins for the table
+    configs). combine defaults to a dict of the value and match.
+
+    Elements are looked up batch_size at a time, so a redis table
+    fetches a batch of keys with a single MGET.
+
+    how - 'inner' to drop elements without a match, or 'left'
+        to return them combined with None
+    tune - tuner options to adapt batch_size to the time taken
+        by each lookup (see data_pipelines.tuning)
+    """
+    __slots__ = (
+        'table', 'how', 'batch_size', 'combine', 'tune', '_table',
+        '_pending', '_finished', '_tuner'
+    )
+
+    def __init__(self, action=identity, table=None, how='inner',
+                 batch_size=100, combine=join_pair, tune=None):
+        super(PipelineJoin, self).__init__(action)
+        self.table = table
+        self.how = how
+        self.batch_size = batch_size
+        self.combine = combine
+        self.tune = tune
+        self._tuner = None
+        self._table = None
+        self._pending = collections.deque()
+        self._finished = False
+
+    def _fill(self):
+        """join the next batch of elements into the pending output"""
+        batch = []
+        try:
+            while len(batch) < self.batch_size:
+                batch.append(self.input.next())
+        except StopIteration:
+            self._finished = True
+        keys = [self.action(value) for value in batch]
+        started = time.time()
+        matches = self._table.lookup(keys)
+        if self._tuner is not None and len(batch) == self.batch_size:
+            self.batch_size = self._tuner.observe(
+                len(batch), time.time() - started
+            )
+        for key, value in zip(keys, batch):
+            rows = matches.get(key)
+            if rows:
+                self._pending.extend(self.combine(value, r) for r in rows)
+            elif self.how == 'left':
+                self._pending.append(self.combine(value, None))
+
+    def next(self):
+        if self._table is None:
+            if self.how not in ('inner', 'left'):
+                raise ValueError("Unsupported join: {}".format(self.how))
+            self._table = make_table(self._table_config())
+            self._tuner = make_tuner(self.tune, self.batch_size)
+        while not self._pending:
+            if self._finished:
+                raise StopIteration
+            self._fill()
+        return self._pending.popleft()
+
+    def _table_config(self):
+        """the table config with its key and action resolved"""
+        table = dict(self.table)
+        for field in ('key', 'action'):
+            if isinstance(table.get(field), basestring):
+                table[field] = LOADER[table[field]]
+        return table
+
+    def _close(self, abort=False):
+        if self._table is not None:
+            self._table.close()
+        self._table = None
+        self._pending.clear()
+
+    def configure(self, conf):
+        self.table = conf['table']
+        self.how = conf.get('how', self.how)
+        self.batch_size = conf.get('batch_size', self.batch_size)
+        self.combine = LOADER[conf['combine']]
+        self.tune = conf.get('tune')
+
+    def tuning(self):
+        if self._tuner is None:
+            return None
+        return {
+            'settings': {'batch_size': self.batch_size},
+            'stats': self._tuner.stats()
+        }
+
+    def apply_tuning(self, settings):
+        self.batch_size = settings.get('batch_size', self.batch_size)
+
+    def _json(self):
+        result = super(PipelineJoin, self)._json()
+        table = dict(self.table or {})
+        for field in ('key', 'action'):
+            if table.get(field) is not None:
+                if not isinstance(table[field], basestring):
+                    table[field] = object_name(table[field])
+        result['table'] = table
+        result['how'] = self.how
+        result['batch_size'] = self.batch_size
+        result['combine'] = object_name(self.combine)
+        if self.tune is not None:
+            result['tune'] = self.tune
         return result
 
 
@@ -328,79 +1241,275 @@ MAKERS = {
     'PipelineOperator': lambda: PipelineOperator(),
     'PipelineTransform': lambda: PipelineTransform(),
     'PipelineFilter': lambda: PipelineFilter(),
-    'PipelineMap': lambda: PipelineMap()
+    'PipelineMap': lambda: PipelineMap(),
+    'PipelineReduce': lambda: PipelineReduce(),
+    'PipelineGroupBy': lambda: PipelineGroupBy(),
+    'PipelineWindow': lambda: PipelineWindow(),
+    'PipelineSort': lambda: PipelineSort(),
+    'PipelineTopK': lambda: PipelineTopK(),
+    'PipelineDistinct': lambda: PipelineDistinct(),
+    'PipelineLimit': lambda: PipelineLimit(),
+    'PipelineTakeWhile': lambda: PipelineTakeWhile(),
+    'PipelineTimeout': lambda: PipelineTimeout(),
+    'PipelineJoin': lambda: PipelineJoin()
 }
 
 
-def build_pipeline(conf):
+def serialize(root, flat=False):
     """
-    _build_pipeline_
-
-    Build a new pipeline instance from the config
-    provided, and build out its content recursively
+    _serialize_
+
+    Create the JSON configuration for a Pipeline or an operator
+    chain, iteratively so that very long chains and deeply
+    nested PipelineMaps dont hit the recursion limit.
+
+    The default nested format puts each operator config in the input
+    field of the next and each PipelineMap's pipelines in its inputs.
+
+    The flat format, for configs too deep for JSON encoders, is
+    {
+        "type": "Pipeline",
+        "format": "flat",
+        "pipelines": [pipeline, ...],
+        "operators": [operator, ...]
+    }
+    where the first pipeline is the top level one, each pipeline
+    refers to its first and last operators by index with first and
+    content, operator inputs are operator indexes and PipelineMap
+    inputs are lists of pipeline indexes.
+    """
+    if flat and not isinstance(root, Pipeline):
+        first = root
+        while isinstance(first.input, PipelineOperator):
+            first = first.input
+        root = Pipeline(first, root)
+    shallow = {}
+    order = []
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in shallow:
+            continue
+        if isinstance(obj, Pipeline):
+            conf = {
+                'type': type(obj).__name__,
+                'label': obj.label,
+                'start': obj.start.label,
+                'end': obj.end.label
+            }
+            stack.append(obj.end)
+            stack.append(obj.start)
+        else:
+            conf = obj._json()
+            if isinstance(obj.input, PipelineOperator):
+                stack.append(obj.input)
+            if isinstance(obj, PipelineMap):
+                stack.extend(obj.inputs)
+        shallow[id(obj)] = conf
+        order.append(obj)
+
+    if flat:
+        return _flat_config(root, shallow, order)
+
+    for obj in order:
+        conf = shallow[id(obj)]
+        if isinstance(obj, Pipeline):
+            conf['content'] = shallow[id(obj.end)]
+            continue
+        if isinstance(obj.input, PipelineOperator):
+            conf['input'] = shallow[id(obj.input)]
+        if isinstance(obj, PipelineMap):
+            conf['inputs'] = [shallow[id(p)] for p in obj.inputs]
+    return shallow[id(root)]
+
+
+def _flat_config(root, shallow, order):
+    """link the shallow configs into the flat format"""
+    pipelines = [obj for obj in order if isinstance(obj, Pipeline)]
+    operators = [obj for obj in order if not isinstance(obj, Pipeline)]
+    pipe_index = dict((id(obj), i) for i, obj in enumerate(pipelines))
+    oper_index = dict((id(obj), i) for i, obj in enumerate(operators))
+    for obj in pipelines:
+        conf = shallow[id(obj)]
+        conf['content'] = oper_index[id(obj.end)]
+        conf['first'] = oper_index[id(obj.start)]
+    for obj in operators:
+        conf = shallow[id(obj)]
+        if isinstance(obj.input, PipelineOperator):
+            conf['input'] = oper_index[id(obj.input)]
+        if isinstance(obj, PipelineMap):
+            conf['inputs'] = [pipe_index[id(p)] for p in obj.inputs]
+    return {
+        'type': 'Pipeline',
+        'format': 'flat',
+        'pipelines': [shallow[id(obj)] for obj in pipelines],
+        'operators': [shallow[id(obj)] for obj in operators],
+    }
+
+
+def make_operator(conf):
+    """
+    _make_operator_
 
+    Create an operator from its config, without
+    building or chaining its inputs
     """
     t = conf['type']
     ref = MAKERS[t]()
     ref.label = conf['label']
-    content = build_pipeline_chain(conf['content'])
-    ref.start = find_label(content, conf['start'])
-    ref.end = content
+    if t == 'PipelineMap':
+        ref.fillvalue = json.loads(conf['fillvalue'])
+    elif t == 'PipelineSource':
+        ref.action = None
+        ref.plugin = conf['plugin']
+        ref._config = conf['config']
+    else:
+        action = conf.get('action')
+        if action is not None:
+            ref.action = LOADER[action]
+        ref.configure(conf)
     return ref
 
 
+def build_pipeline(conf):
+    """
+    _build_pipeline_
+
+    Build a new pipeline instance from the config
+    provided, and build out its content
+
+    """
+    if conf.get('format') == 'flat':
+        return _build_flat(conf)
+    return _build_nested(conf)
+
+
+def _build_flat(conf):
+    """build a pipeline from the flat config format"""
+    operators = [make_operator(c) for c in conf['operators']]
+    pipelines = []
+    for pconf in conf['pipelines']:
+        ref = MAKERS[pconf['type']]()
+        ref.label = pconf['label']
+        ref.start = operators[pconf['first']]
+        ref.end = operators[pconf['content']]
+        pipelines.append(ref)
+    for oper, oconf in zip(operators, conf['operators']):
+        if oconf.get('input') is not None:
+            oper.chain(operators[oconf['input']])
+        for index in oconf.get('inputs', []):
+            oper.add_pipeline(pipelines[index])
+    return pipelines[0]
+
+
+def _build_nested(conf):
+    """
+    build a pipeline, or an operator chain, from the nested
+    config format, iteratively with an explicit stack.
+    Each operator is indexed by label in the chain it belongs
+    to as it is built so the start of each pipeline can be
+    looked up directly
+    """
+    built = {}
+    indexes = {}
+    links = []
+    pipelines = []
+    stack = [(conf, None)]
+    while stack:
+        item, chain = stack.pop()
+        if 'content' in item:
+            # a pipeline, its content starts a new chain
+            index = indexes[id(item)] = {}
+            pipelines.append(item)
+            stack.append((item['content'], index))
+            continue
+        ref = make_operator(item)
+        built[id(item)] = ref
+        if chain is not None:
+            chain.setdefault(ref.label, ref)
+        if item.get('input'):
+            links.append((ref, item['input']))
+            stack.append((item['input'], chain))
+        for inp in item.get('inputs', []):
+            links.append((ref, inp))
+            stack.append((inp, None))
+
+    for item in pipelines:
+        ref = MAKERS[item['type']]()
+        ref.label = item['label']
+        ref.end = built[id(item['content'])]
+        ref.start = indexes[id(item)].get(item['start'])
+        if ref.start is None:
+            ref.start = find_label(ref.end, item['start'])
+        built[id(item)] = ref
+
+    # pipelines are added to maps in the order they were listed
+    for ref, item in links:
+        if 'content' in item:
+            ref.add_pipeline(built[id(item)])
+        else:
+            ref.chain(built[id(item)])
+    return built[id(conf)]
+
+
 def find_label(chain, label):
     """
     _find_label_
 
     traverse a chain and look for a particular label
     """
-    if chain.label == label:
-        return chain
-    else:
+    while chain is not None:
+        if chain.label == label:
+            return chain
         if isinstance(chain, PipelineMap):
             # pipeline maps are their own start and end
             return chain
-        else:
-            return find_label(chain.input, label)
+        chain = getattr(chain, 'input', None)
+    return None
+
+
+def operator_chain(pipeline):
+    """
+    _operator_chain_
+
+    the operators of a pipeline, first to last
+    """
+    chain = []
+    oper = pipeline.end
+    while isinstance(oper, PipelineOperator):
+        chain.append(oper)
+        oper = oper.input
+    chain.reverse()
+    return chain
 
 
 def build_pipeline_chain(conf):
     """
     build a pipeline of operators from config
-    by recursing through the config
+    and return the last operator in the chain
 
     """
-    t = conf['type']
-    ref = MAKERS[t]()
-    if t == 'PipelineMap':
-        ref.fillvalue = json.loads(conf['fillvalue'])
-        for inp in conf["inputs"]:
-            pipe = build_pipeline(inp)
-            ref.add_pipeline(pipe)
-    elif t == 'PipelineSource':
-        ref.label = conf['label']
-        ref.action = None
-        ref.plugin = conf['plugin']
-        ref._config = conf['config']
-    else:
-        ref.label = conf['label']
-        action = conf['action']
-        action_ref = LOADER[action]
-        ref.action = action_ref
-        if conf.get('input'):
-            inp = build_pipeline_chain(conf['input'])
-            ref.chain(inp)
-    return ref
+    return _build_nested(conf)
 
 
-def run_pipeline(config):
+def run_pipeline(config, codec=DEFAULT_CODEC, tuning=None):
     """
     run_pipeline
 
-    Given a JSON config, instantiate a pipeline object
+    Given an encoded config, instantiate a pipeline object
     from the config and execute it.
+    The config is decoded with the named codec, JSON by default.
+    If a TuningStore is passed as tuning, the pipeline starts from
+    the settings tuned by its last run, and the settings tuned by
+    this run are recorded when it ends
     """
-    json_config = json.loads(config)
+    json_config = get_codec(codec).decode(config)
     pipeline = Pipeline.from_configuration(json_config)
-    return pipeline.execute()
+    if tuning is None:
+        return pipeline.execute()
+    tuning.apply(pipeline)
+    try:
+        with pipeline:
+            return pipeline.execute()
+    finally:
+        tuning.record(pipeline)
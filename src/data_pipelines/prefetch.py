@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+"""
+prefetch
+
+Read ahead wrapper that runs a DataSource in a background thread
+or process, so that fetching elements overlaps with the work done
+on them by the rest of the pipeline.
+
+Prefetching is enabled by adding a prefetch setting to the config
+of a PipelineSource, which is removed before the config is passed
+to the plugin:
+
+{
+    "type": "PipelineSource",
+    "plugin": "RedisScan",
+    "config": {
+        "match": "user:*",
+        "prefetch": {"mode": "thread", "batch_size": 100, "queue_size": 4}
+    }
+}
+
+prefetch can also be true to use the defaults. A tune option
+adapts the batch size while the source runs, see
+data_pipelines.tuning. queue_size is not tuned.
+
+The background worker creates and connects the source. It calls
+disconnect once the pipeline has read everything and disconnected
+from the prefetcher, so sources that release or commit what they
+have read when they disconnect (eg the mmap sources or RedisScan
+fingerprints) dont do so for elements still waiting in the queue.
+If the pipeline stops before reading everything the worker read,
+the source fails or the pipeline is aborted, abort is called
+instead.
+Elements are passed over a bounded queue in batches of batch_size,
+at most queue_size batches ahead of the pipeline.
+
+Sources that acknowledge elements as they are read, like
+RedisStream, cant be prefetched: the worker would acknowledge
+elements still waiting in the queue, which are lost if the pipeline
+stops before reading them. PipelineSource raises a ValueError if
+prefetch is set for them.
+
+In process mode elements must be picklable, so zero copy sources
+like the mmap sources should use thread mode. Threads help
+with sources that wait on I/O, processes with sources that spend
+their time decoding data.
+
+"""
+import time
+import Queue
+import threading
+import traceback
+import multiprocessing
+
+from .tuning import make_tuner
+
+
+class PrefetchError(RuntimeError):
+    """
+    a source running in a background process failed,
+    the message includes the traceback from that process
+    """
+
+
+def _put(queue, stop, item):
+    """put an item on the queue unless asked to stop while waiting"""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return
+        except Queue.Full:
+            continue
+
+
+def _produce(make_source, queue, stop, abort, batch_size, in_process,
+             tune):
+    """
+    connect the source and feed batches of its elements
+    to the queue, followed by an end or error message.
+    Each batch message includes the tuner statistics if
+    the batch size is being tuned, and the tuning of the source
+    if it tunes its own settings.
+    The source is only disconnected once the consumer has
+    disconnected, so it doesnt commit or release what it read
+    while elements are still queued or being worked on. It is
+    aborted instead if it failed or abort is set
+    """
+    tuner = make_tuner(tune, batch_size)
+    stats = None
+    source = None
+    failed = True
+    try:
+        connecting = make_source()
+        connecting.connect()
+        source = connecting
+        batch = []
+        started = time.time()
+        while not stop.is_set():
+            try:
+                batch.append(source.next())
+            except StopIteration:
+                break
+            if len(batch) >= batch_size:
+                if tuner is not None:
+                    batch_size = tuner.observe(
+                        len(batch), time.time() - started
+                    )
+                    stats = tuner.stats()
+                _put(queue, stop, ('batch', (batch, stats, _tuning(source))))
+                batch = []
+                started = time.time()
+        if batch:
+            _put(queue, stop, ('batch', (batch, stats, _tuning(source))))
+        failed = False
+        _put(queue, stop, ('end', None))
+    except Exception as ex:
+        _put(queue, stop, ('error', _error(ex, in_process)))
+    stop.wait()
+    if source is not None:
+        try:
+            if failed or abort.is_set():
+                source.abort()
+            else:
+                source.disconnect()
+        except Exception as ex:
+            # the consumer has drained the queue and reads this
+            # once the worker has finished
+            queue.put(('error', _error(ex, in_process)))
+            return
+    if in_process:
+        # dont wait to flush batches nobody will read before exiting
+        queue.cancel_join_thread()
+
+
+def _tuning(source):
+    """the tuning of a source, if it tunes its own settings"""
+    if hasattr(source, 'tuning'):
+        return source.tuning()
+    return None
+
+
+def _error(ex, in_process):
+    """exceptions cant always be pickled, send their traceback"""
+    if in_process:
+        return traceback.format_exc()
+    return ex
+
+
+class Prefetcher(object):
+    """
+    _Prefetcher_
+
+    Wraps a data source in a background thread or process,
+    exposing the same connect, next and disconnect API.
+    make_source is called in the background worker to create
+    the source.
+    If tune is set the batch size is adjusted by an AIMDTuner
+    (see data_pipelines.tuning) from the time taken to fetch
+    each batch. The settings tuned by the source itself, eg
+    the RedisScan count, are passed back with each batch and
+    included in tuning.
+    """
+    def __init__(self, make_source, mode='thread', batch_size=100,
+                 queue_size=4, tune=None):
+        if mode not in ('thread', 'process'):
+            raise ValueError("Unsupported prefetch mode: {}".format(mode))
+        self.make_source = make_source
+        self.mode = mode
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.tune = tune
+        self.stats = None
+        self.source_tuning = None
+        self._worker = None
+        self._queue = None
+        self._stop = None
+        self._abort = None
+        self._batch = None
+        self._index = 0
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def connect(self):
+        if self.mode == 'process':
+            self._queue = multiprocessing.Queue(self.queue_size)
+            self._stop = multiprocessing.Event()
+            self._abort = multiprocessing.Event()
+            worker = multiprocessing.Process
+        else:
+            self._queue = Queue.Queue(self.queue_size)
+            self._stop = threading.Event()
+            self._abort = threading.Event()
+            worker = threading.Thread
+        self._worker = worker(
+            target=_produce,
+            args=(
+                self.make_source, self._queue, self._stop, self._abort,
+                self.batch_size, self.mode == 'process', self.tune
+            )
+        )
+        self._worker.daemon = True
+        self._worker.start()
+        self._batch = []
+        self._index = 0
+        self._finished = False
+
+    def next(self):
+        while self._index >= len(self._batch):
+            if self._finished:
+                raise StopIteration
+            kind, payload = self._get()
+            if kind == 'end':
+                self._finished = True
+            elif kind == 'error':
+                self._finished = True
+                _raise(payload)
+            else:
+                self._batch, stats, source_tuning = payload
+                self.stats = stats or self.stats
+                self.source_tuning = source_tuning or self.source_tuning
+                self._index = 0
+        value = self._batch[self._index]
+        self._index += 1
+        return value
+
+    def _get(self):
+        """wait for the next message from the worker"""
+        while True:
+            try:
+                return self._queue.get(timeout=1)
+            except Queue.Empty:
+                if self._worker.is_alive():
+                    continue
+            # the worker has exited, anything it sent has arrived
+            try:
+                return self._queue.get(timeout=0.1)
+            except Queue.Empty:
+                return ('error', "prefetch worker exited unexpectedly")
+
+    def tuning(self):
+        """
+        the tuned batch size and source settings with their
+        statistics, if tuning. If both are tuned the statistics
+        are split into prefetch and source
+        """
+        prefetch = None
+        if self.stats is not None:
+            prefetch = {
+                'settings': {'batch_size': self.stats['value']},
+                'stats': self.stats
+            }
+        if self.source_tuning is None or prefetch is None:
+            return prefetch or self.source_tuning
+        settings = dict(self.source_tuning['settings'])
+        settings.update(prefetch['settings'])
+        return {
+            'settings': settings,
+            'stats': {
+                'prefetch': prefetch['stats'],
+                'source': self.source_tuning['stats']
+            }
+        }
+
+    def abort(self):
+        """stop the worker, aborting the source"""
+        self.disconnect(abort=True)
+
+    def disconnect(self, abort=False):
+        """
+        stop the background worker, which disconnects the source,
+        and wait for it to finish. If the pipeline stopped before
+        reading everything the worker read, the source is aborted,
+        as some of what it read was never used
+        """
+        if self._worker is None:
+            return
+        if abort or not self._finished:
+            self._abort.set()
+        self._stop.set()
+        # unblock a worker waiting for space on the queue
+        try:
+            while True:
+                self._queue.get_nowait()
+        except Queue.Empty:
+            pass
+        self._worker.join(5)
+        error = None
+        try:
+            while True:
+                kind, payload = self._queue.get(timeout=0.1)
+                if kind == 'error':
+                    error = payload
+        except Queue.Empty:
+            pass
+        if self.mode == 'process':
+            if self._worker.is_alive():
+                self._worker.terminate()
+            self._queue.close()
+        self._worker = None
+        self._queue = None
+        self._batch = None
+        if error is not None:
+            _raise(error)
+
+
+def _raise(error):
+    """raise an error sent by the worker"""
+    if isinstance(error, Exception):
+        raise error
+    raise PrefetchError("Prefetching source failed:\n{}".format(error))
+
+
+def make_prefetcher(make_source, options):
+    """
+    _make_prefetcher_
+
+    Create a Prefetcher from the prefetch setting of a
+    source config, either True or a dict of options
+    """
+    if options is True:
+        options = {}
+    return Prefetcher(make_source, **options)
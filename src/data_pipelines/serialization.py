@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+"""
+serialization
+
+Pluggable codecs for encoding and decoding element payloads
+and pipeline configurations.
+
+Codecs are plugins registered with the data_pipelines.codecs
+factory under a short name, get_codec returns a shared instance:
+
+codec = get_codec('msgpack')
+data = codec.encode({'a': 1})
+codec.decode(data)
+
+Codecs that depend on optional packages (orjson, ujson, msgpack)
+are always registered but raise a RuntimeError when used if the
+package isnt installed, available_codecs lists the usable ones.
+
+The encode_<name> and decode_<name> functions can be used as
+PipelineTransform actions to decode or encode elements in a pipeline.
+
+"""
+import json
+import struct
+
+from pluggage.factory_plugin import PluggagePlugin
+import pluggage.registry
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+FACTORY_NAME = 'data_pipelines.codecs'
+DEFAULT_CODEC = 'json'
+
+_CODECS = {}
+
+
+def _as_bytes(data):
+    """
+    convert buffer like inputs, eg records from the mmap sources,
+    into a string for libraries that only accept strings
+    """
+    if isinstance(data, basestring):
+        return data
+    return bytes(data)
+
+
+class Codec(PluggagePlugin):
+    """
+    Codec
+
+    Base class for codec plugins, override encode and decode
+    """
+    PLUGGAGE_FACTORY_NAME = FACTORY_NAME
+    PLUGGAGE_OBJECT_NAME = 'codec'
+    MODULE = True
+
+    def __init__(self):
+        super(Codec, self).__init__()
+        if self.MODULE is None:
+            msg = "Codec {} requires a package that is not installed".format(
+                self.PLUGGAGE_OBJECT_NAME
+            )
+            raise RuntimeError(msg)
+
+    def encode(self, obj):
+        raise NotImplementedError()
+
+    def decode(self, data):
+        raise NotImplementedError()
+
+
+class JsonCodec(Codec):
+    """stdlib json"""
+    PLUGGAGE_OBJECT_NAME = 'json'
+
+    def encode(self, obj):
+        return json.dumps(obj, separators=(',', ':'))
+
+    def decode(self, data):
+        return json.loads(_as_bytes(data))
+
+
+class OrjsonCodec(Codec):
+    """orjson, encodes to utf-8 bytes"""
+    PLUGGAGE_OBJECT_NAME = 'orjson'
+    MODULE = orjson
+
+    def encode(self, obj):
+        return orjson.dumps(obj)
+
+    def decode(self, data):
+        return orjson.loads(data)
+
+
+class UjsonCodec(Codec):
+    """ujson"""
+    PLUGGAGE_OBJECT_NAME = 'ujson'
+    MODULE = ujson
+
+    def encode(self, obj):
+        return ujson.dumps(obj)
+
+    def decode(self, data):
+        return ujson.loads(_as_bytes(data))
+
+
+class MsgpackCodec(Codec):
+    """msgpack binary encoding"""
+    PLUGGAGE_OBJECT_NAME = 'msgpack'
+    MODULE = msgpack
+
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+class PickleCodec(Codec):
+    """
+    pickle using the highest available protocol.
+
+    With protocol 5 (python 3.8+) objects that support out of band
+    buffers, such as numpy arrays and PickleBuffers, have their data
+    written after the pickle stream and are decoded as zero copy
+    views of the input.
+    The framing is:
+      4 byte buffer count, 8 byte length per buffer,
+      8 byte pickle length, pickle data, buffers
+    """
+    PLUGGAGE_OBJECT_NAME = 'pickle'
+    OUT_OF_BAND = pickle.HIGHEST_PROTOCOL >= 5
+
+    def encode(self, obj):
+        if not self.OUT_OF_BAND:
+            return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        buffers = []
+        data = pickle.dumps(obj, 5, buffer_callback=buffers.append)
+        raws = [b.raw() for b in buffers]
+        header = struct.pack(
+            '<I{}QQ'.format(len(raws)),
+            len(raws),
+            *([r.nbytes for r in raws] + [len(data)])
+        )
+        return b''.join([header, data] + [r.tobytes() for r in raws])
+
+    def decode(self, data):
+        if not self.OUT_OF_BAND:
+            return pickle.loads(_as_bytes(data))
+        view = memoryview(data)
+        count, = struct.unpack_from('<I', view, 0)
+        lengths = struct.unpack_from('<{}Q'.format(count + 1), view, 4)
+        offset = 4 + 8 * (count + 1)
+        end = offset + lengths[-1]
+        stream = view[offset:end]
+        buffers = []
+        for length in lengths[:-1]:
+            buffers.append(view[end:end + length])
+            end += length
+        return pickle.loads(stream, buffers=buffers)
+
+
+def get_codec(name=DEFAULT_CODEC):
+    """
+    _get_codec_
+
+    Return the shared codec instance for the name provided
+    """
+    if name not in _CODECS:
+        factory = pluggage.registry.get_factory(
+            FACTORY_NAME,
+            load_modules=['data_pipelines.serialization']
+        )
+        _CODECS[name] = factory(name)
+    return _CODECS[name]
+
+
+def available_codecs():
+    """
+    _available_codecs_
+
+    list the names of codecs whose dependencies are installed
+    """
+    registry = pluggage.registry.get_factory(FACTORY_NAME).registry
+    return sorted(
+        name for name, cls in registry.items()
+        if cls is not Codec and cls.MODULE is not None
+    )
+
+
+def encode_json(value):
+    return get_codec('json').encode(value)
+
+
+def decode_json(value):
+    return get_codec('json').decode(value)
+
+
+def encode_orjson(value):
+    return get_codec('orjson').encode(value)
+
+
+def decode_orjson(value):
+    return get_codec('orjson').decode(value)
+
+
+def encode_ujson(value):
+    return get_codec('ujson').encode(value)
+
+
+def decode_ujson(value):
+    return get_codec('ujson').decode(value)
+
+
+def encode_msgpack(value):
+    return get_codec('msgpack').encode(value)
+
+
+def decode_msgpack(value):
+    return get_codec('msgpack').decode(value)
+
+
+def encode_pickle(value):
+    return get_codec('pickle').encode(value)
+
+
+def decode_pickle(value):
+    return get_codec('pickle').decode(value)
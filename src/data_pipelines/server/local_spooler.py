@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+local_spooler
+
+In process stand-in for the uwsgi spooler, used by the pipeline
+server when it isnt running under uwsgi, eg for load testing and
+development.
+
+It provides the parts of the uwsgi API the server uses: the spool
+and spoolforever decorators, spooler_jobs and opt['spooler'].
+Like uwsgi each spooled job is a file in the spool directory, and
+a spoolforever job keeps running until its file is removed.
+Jobs are run by a pool of worker threads.
+
+The pipeline server only uses it when uwsgi isnt available and
+the DATA_PIPELINES_LOCAL_SPOOLER environment variable is set.
+The shared spooler and its spool directory are created on first
+use, see get_spooler.
+
+"""
+import os
+import time
+import Queue
+import tempfile
+import threading
+import traceback
+import collections
+
+from data_pipelines.utilities import short_uuid
+from . import get_logger
+
+
+LOGGER = get_logger()
+
+
+class LocalSpooler(object):
+    """
+    _LocalSpooler_
+
+    Queue of spooled jobs run by workers threads, with
+    a record of the submit, start and finish times of each job.
+    The records are shared by the request and worker threads, so
+    they are only read and changed holding the lock, use record
+    to get a copy of one
+    """
+    def __init__(self, workers=4, spool_dir=None):
+        self.workers = workers
+        self._spool_dir = spool_dir
+        self.records = collections.OrderedDict()
+        self._tasks = Queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    @property
+    def spool_dir(self):
+        """the spool directory, a temporary one is made if not set"""
+        if self._spool_dir is None:
+            self._spool_dir = tempfile.mkdtemp(prefix='data_pipelines_spool')
+        return self._spool_dir
+
+    @property
+    def opt(self):
+        return {'spooler': self.spool_dir}
+
+    def _start(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, func, arguments, forever=False):
+        """spool a call to func(arguments) and return the job id"""
+        self._start()
+        job = os.path.join(
+            self.spool_dir, 'uwsgi_spoolfile_{}'.format(short_uuid())
+        )
+        open(job, 'w').close()
+        with self._lock:
+            self.records[job] = {
+                'submitted': time.time(),
+                'started': None,
+                'finished': None,
+                'runs': 0,
+                'errors': 0,
+            }
+        self._tasks.put((job, func, arguments, forever))
+        return job
+
+    def _work(self):
+        while True:
+            job, func, arguments, forever = self._tasks.get()
+            if not os.path.exists(job):
+                # removed while waiting, like a deleted spool file
+                continue
+            with self._lock:
+                record = self.records[job]
+                if record['started'] is None:
+                    record['started'] = time.time()
+            failed = False
+            try:
+                func(arguments)
+            except Exception:
+                failed = True
+                LOGGER.error(traceback.format_exc())
+            with self._lock:
+                if failed:
+                    record['errors'] += 1
+                record['runs'] += 1
+                record['finished'] = time.time()
+            if forever and os.path.exists(job):
+                self._tasks.put((job, func, arguments, forever))
+            elif os.path.exists(job):
+                os.remove(job)
+
+    def record(self, job):
+        """a copy of the record of a job, or None if it isnt known"""
+        with self._lock:
+            record = self.records.get(job)
+            return None if record is None else dict(record)
+
+    def spooler_jobs(self):
+        """ids of the jobs that are still spooled"""
+        with self._lock:
+            jobs = list(self.records)
+        return [job for job in jobs if os.path.exists(job)]
+
+    def pending(self):
+        """number of job runs waiting for a worker"""
+        return self._tasks.qsize()
+
+    def wait(self, timeout=None):
+        """
+        wait for the jobs that dont run forever to finish,
+        returns False if they didnt within timeout seconds
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            running = [
+                job for job in self.spooler_jobs()
+                if not self.record(job)['runs']
+            ]
+            if not running:
+                return True
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.01)
+
+    def spool(self, func):
+        """decorator that spools calls to func to run once"""
+        def spooled(**arguments):
+            return self.submit(func, arguments)
+        spooled.__name__ = func.__name__
+        return spooled
+
+    def spoolforever(self, func):
+        """decorator that spools calls to func to run repeatedly"""
+        def spooled(**arguments):
+            return self.submit(func, arguments, forever=True)
+        spooled.__name__ = func.__name__
+        return spooled
+
+
+_SPOOLER = None
+
+
+def get_spooler():
+    """the spooler shared by the process, created on first use"""
+    global _SPOOLER
+    if _SPOOLER is None:
+        _SPOOLER = LocalSpooler()
+    return _SPOOLER
+
+
+def spool(func):
+    """uwsgidecorators.spool stand-in using the shared spooler"""
+    return get_spooler().spool(func)
+
+
+def spoolforever(func):
+    """uwsgidecorators.spoolforever stand-in using the shared spooler"""
+    return get_spooler().spoolforever(func)
@@ -5,7 +5,7 @@ pipeline_server
 uwsgi spooler application for queueing and executing pipelines
 
 
-this module uses the uwsgi API so it needs to be run
+this module uses the uwsgi API and is meant to be run
 under uwsgi.
 For example:
 
@@ -14,42 +14,94 @@ uwsgi --spooler=/tmp/spooler \
       --http-socket 127.0.0.1:3031 \
       -w data_pipelines.server.pipeline_server:APP
 
+Importing it fails without uwsgi, unless the
+DATA_PIPELINES_LOCAL_SPOOLER environment variable is set to 1, in
+which case jobs are run by an in process stand-in for the spooler
+(see local_spooler), which is meant for testing, eg with
+data_pipelines.benchmarks.server_load
+
 """
-import json
 import os
-import uwsgi
 from flask import Flask, request
 from werkzeug.exceptions import BadRequest
 from flask.ext.restful import Api, Resource, reqparse
 from data_pipelines.pipelines import run_pipeline
+from data_pipelines.dag import run_pipelines
+from data_pipelines.serialization import get_codec
+from data_pipelines.tuning import TuningStore
 
-from uwsgidecorators import spool, spoolforever
 from . import get_logger
 
+try:
+    import uwsgi
+    from uwsgidecorators import spool, spoolforever
+except ImportError:
+    if os.environ.get('DATA_PIPELINES_LOCAL_SPOOLER') != '1':
+        raise
+    from .local_spooler import get_spooler, spool, spoolforever
+    uwsgi = get_spooler()
+    get_logger().warning("uwsgi not available, using the local spooler")
+
 
 LOGGER = get_logger()
 
+#
+# codec used to encode pipeline configs in the spooler files
+#
+SPOOLER_CODEC = os.environ.get('DATA_PIPELINES_SPOOLER_CODEC', 'json')
+
+#
+# directory where continuous jobs record their tuned settings
+#
+TUNING_DIR = os.environ.get('DATA_PIPELINES_TUNING_DIR')
+
+
+def _run(arguments, tuning=None):
+    """
+    run the pipeline, or the list of pipelines as a DAG
+    sharing their common operators, in the spooler arguments
+    """
+    codec = arguments.get('codec', 'json')
+    if 'pipelines' in arguments:
+        run_pipelines(arguments['pipelines'], codec)
+    else:
+        run_pipeline(arguments['pipeline'], codec, tuning=tuning)
+
 
 @spool
 def execute_pipeline(arguments):
     LOGGER.info("consume_feed starting {}".format(arguments))
-    run_pipeline(arguments['pipeline'])
+    _run(arguments)
     LOGGER.info("consume_feed exiting...")
 
 
 @spoolforever
 def execute_pipeline_continuously(arguments):
     LOGGER.info("consume_feed_continuously starting {}".format(arguments))
-    run_pipeline(arguments['pipeline'])
+    tuning = TuningStore(TUNING_DIR) if TUNING_DIR else None
+    _run(arguments, tuning)
     LOGGER.info("consume_feed_continuously exiting...")
 
 
 def _parse_request():
+    """
+    return the pipeline config, or list of pipeline
+    configs, from the request
+    """
     if not request.json:
         raise BadRequest("JSON is required")
-    if 'pipeline' not in request.json:
-        raise BadRequest("pipeline field not found")
-    return request.json['pipeline']
+    for field in ('pipeline', 'pipelines'):
+        if field in request.json:
+            return field, request.json[field]
+    raise BadRequest("pipeline field not found")
+
+
+def _spooler_args(field, pipeline):
+    """encode the pipeline config as spooler arguments"""
+    return {
+        field: get_codec(SPOOLER_CODEC).encode(pipeline),
+        'codec': SPOOLER_CODEC
+    }
 
 
 class SpoolerAPI(Resource):
@@ -67,6 +119,10 @@ class SpoolerAPI(Resource):
     The following curl command will run once using the
     execute_pipeline call defined above.
 
+    A list of configs can be sent as "pipelines" instead, they are
+    run together, evaluating any operators they share only once
+    (see data_pipelines.dag).
+
     curl -H Content-Type:application/json \
          -X POST \
          -d@data.json \
@@ -75,8 +131,8 @@ class SpoolerAPI(Resource):
     """
     def post(self):
         LOGGER.info(u"post()")
-        args = _parse_request()
-        resp = execute_pipeline(pipeline=json.dumps(args))
+        field, args = _parse_request()
+        resp = execute_pipeline(**_spooler_args(field, args))
         LOGGER.info(resp)
         return {"ok": True, 'spooled': resp}, 202
 
@@ -146,8 +202,8 @@ class ContinuousSpoolerAPI(Resource):
         Response includes the uwsgi job id that was spawned
         """
         LOGGER.info(u"post()")
-        args = _parse_request()
-        resp = execute_pipeline_continuously(pipeline=json.dumps(args))
+        field, args = _parse_request()
+        resp = execute_pipeline_continuously(**_spooler_args(field, args))
         LOGGER.info(resp)
         return {"ok": True, 'spooled': resp}, 202
 
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+sorting
+
+External merge sort used by the PipelineSort operator.
+
+Elements are buffered in memory up to max_items, each full buffer
+is sorted and spilled to a run file on disk, and the runs are
+merged lazily with heapq.merge when the results are read, so only
+the buffer plus one element per run is held in memory.
+
+"""
+import os
+import heapq
+import shutil
+import tempfile
+import itertools
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+def identity(value):
+    """default sort key, the element itself"""
+    return value
+
+
+class Descending(object):
+    """
+    wrapper that inverts the ordering of a sort key, heapq.merge
+    in python 2 has no reverse option so descending runs are merged
+    in ascending order of wrapped keys
+    """
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+class ExternalSorter(object):
+    """
+    _ExternalSorter_
+
+    Sort any number of elements by key(element) in bounded memory.
+    Elements are stored as (key, sequence, element) so that the sort
+    is stable and elements themselves are never compared.
+
+    max_items - most elements buffered in memory before a run is
+        spilled, None to never spill
+    fan_in - most runs merged at once, if there are more the runs
+        are merged in passes to keep the number of open files down
+    spill_dir - directory for the temporary run files
+    """
+    def __init__(self, key=identity, reverse=False, max_items=100000,
+                 fan_in=64, spill_dir=None):
+        self.key = key
+        self.reverse = reverse
+        self.max_items = max_items
+        self.fan_in = max(fan_in, 2)
+        self.spill_dir = spill_dir
+        self.buffer = []
+        self.runs = []
+        self._seq = itertools.count()
+        self._run_names = itertools.count()
+        self._tmpdir = None
+
+    def add(self, value):
+        """add an element to be sorted"""
+        self.buffer.append((self.key(value), self._seq.next(), value))
+        if self.max_items and len(self.buffer) >= self.max_items:
+            self.spill()
+
+    def _sort_key(self, item):
+        if self.reverse:
+            return (Descending(item[0]), item[1])
+        return item[:2]
+
+    def _new_run(self):
+        if self._tmpdir is None:
+            self._tmpdir = tempfile.mkdtemp(
+                prefix='data_pipelines_sort', dir=self.spill_dir
+            )
+        return open(
+            os.path.join(self._tmpdir, str(self._run_names.next())), 'w+b'
+        )
+
+    def _write_run(self, items):
+        handle = self._new_run()
+        for item in items:
+            pickle.dump(item, handle, pickle.HIGHEST_PROTOCOL)
+        handle.flush()
+        return handle
+
+    def spill(self):
+        """sort the buffered elements and write them out as a run"""
+        if not self.buffer:
+            return
+        self.buffer.sort(key=self._sort_key)
+        self.runs.append(self._write_run(self.buffer))
+        self.buffer = []
+
+    def _read_run(self, handle):
+        """iterate over the (sort key, item) pairs in a run file"""
+        handle.seek(0)
+        while True:
+            try:
+                item = pickle.load(handle)
+            except EOFError:
+                break
+            yield self._sort_key(item), item
+
+    def _merge(self, runs):
+        """lazily merge sorted runs, yielding the items in order"""
+        merged = heapq.merge(*[self._read_run(run) for run in runs])
+        for _, item in merged:
+            yield item
+
+    def items(self):
+        """iterate over the elements in sorted order"""
+        if not self.runs:
+            self.buffer.sort(key=self._sort_key)
+            buffered, self.buffer = self.buffer, []
+            for item in buffered:
+                yield item[2]
+            return
+        self.spill()
+        try:
+            while len(self.runs) > self.fan_in:
+                group = self.runs[:self.fan_in]
+                merged = self._write_run(self._merge(group))
+                for run in group:
+                    run.close()
+                self.runs = self.runs[self.fan_in:] + [merged]
+            for item in self._merge(self.runs):
+                yield item[2]
+        finally:
+            self.close()
+
+    def close(self):
+        """remove any run files"""
+        for handle in self.runs:
+            handle.close()
+        self.runs = []
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+        self.buffer = []
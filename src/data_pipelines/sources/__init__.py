@@ -8,3 +8,7 @@ Source plugins
 
 import integers
 import redis_scan
+import mmap_files
+import columnar_files
+import redis_stream
+import redis_keyspace
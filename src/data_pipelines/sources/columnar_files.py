@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+columnar_files
+
+Data Source that reads columnar files a chunk of rows at a time,
+decoding only the columns that are needed.
+
+Supports directories of .npy column files written by
+data_pipelines.columnar.write_columns, which are memory mapped,
+and Parquet files, read a row group at a time, if pyarrow is
+installed.
+
+"""
+import os
+import json
+from collections import OrderedDict
+
+from data_pipelines.data_source import DataSource
+from data_pipelines.columnar import (
+    META_FILE,
+    RecordBatch,
+    evaluate,
+    may_match,
+    numpy,
+    require_numpy
+)
+
+try:
+    import pyarrow.parquet as parquet
+except ImportError:
+    parquet = None
+
+
+class ColumnarFile(DataSource):
+    """
+    Columnar file data source
+
+    Settings:
+     path - .npy column directory or Parquet file
+     columns - list of columns to return, defaults to all
+     filters - list of [column, op, value] predicates, rows that
+        dont satisfy all of them are dropped before they are returned.
+        Filters declared with data_pipelines.columnar.predicate can be
+        moved here with push_down_predicates
+     batch_size - rows per chunk for .npy directories, default 65536.
+        Parquet files are read a row group at a time
+     output - 'batches' to return a RecordBatch per chunk or
+        'rows' (the default) to return a dict per row
+    """
+    rereadable = True
+
+    def __init__(self, **kwargs):
+        super(ColumnarFile, self).__init__()
+        self.path = kwargs.pop('path')
+        self.columns = kwargs.pop('columns', None)
+        self.filters = kwargs.pop('filters', [])
+        self.batch_size = kwargs.pop('batch_size', 65536)
+        self.output = kwargs.pop('output', 'rows')
+        self._batches = None
+        self._rows = None
+
+    def _read_columns(self):
+        """columns that need to be decoded for output and filters"""
+        needed = list(self.columns) if self.columns else None
+        if needed is None:
+            return None
+        for column, _, _ in self.filters:
+            if column not in needed:
+                needed.append(column)
+        return needed
+
+    def _npy_batches(self):
+        """iterate over chunks of a .npy column directory"""
+        with open(os.path.join(self.path, META_FILE)) as handle:
+            meta = json.load(handle)
+        names = self._read_columns() or meta['columns']
+        arrays = [
+            numpy.load(
+                os.path.join(self.path, '{}.npy'.format(name)),
+                mmap_mode='r'
+            )
+            for name in names
+        ]
+        for start in range(0, meta['num_rows'], self.batch_size):
+            stop = start + self.batch_size
+            yield RecordBatch(
+                OrderedDict(
+                    (name, arr[start:stop])
+                    for name, arr in zip(names, arrays)
+                )
+            )
+
+    def _parquet_batches(self):
+        """iterate over the row groups of a parquet file"""
+        if parquet is None:
+            msg = "pyarrow is required to read parquet files"
+            raise RuntimeError(msg)
+        reader = parquet.ParquetFile(self.path)
+        names = self._read_columns()
+        for index in range(reader.num_row_groups):
+            if self.filters and not may_match(
+                    self._row_group_stats(reader, index), self.filters):
+                continue
+            table = reader.read_row_group(index, columns=names)
+            yield RecordBatch.from_arrow(table)
+
+    def _row_group_stats(self, reader, index):
+        """min/max statistics for the filtered columns of a row group"""
+        filtered = set(f[0] for f in self.filters)
+        group = reader.metadata.row_group(index)
+        stats = {}
+        for col in range(group.num_columns):
+            meta = group.column(col)
+            if meta.path_in_schema not in filtered:
+                continue
+            col_stats = meta.statistics
+            if col_stats is not None and col_stats.has_min_max:
+                stats[meta.path_in_schema] = (col_stats.min, col_stats.max)
+        return stats
+
+    def _filtered(self, batches):
+        """apply filters and projection to each batch"""
+        for batch in batches:
+            if self.filters:
+                batch = batch.filter(evaluate(batch, self.filters))
+                if not len(batch):
+                    continue
+            if self.columns:
+                batch = batch.select(self.columns)
+            yield batch
+
+    def connect(self):
+        require_numpy()
+        if os.path.isdir(self.path):
+            batches = self._npy_batches()
+        else:
+            batches = self._parquet_batches()
+        self._batches = self._filtered(batches)
+        self._rows = None
+
+    def disconnect(self):
+        self._batches = None
+        self._rows = None
+
+    def next(self):
+        if self.output == 'batches':
+            return self._batches.next()
+        while True:
+            if self._rows is not None:
+                try:
+                    return self._rows.next()
+                except StopIteration:
+                    self._rows = None
+            self._rows = self._batches.next().rows()
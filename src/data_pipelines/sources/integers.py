@@ -15,6 +15,8 @@ class Integers(DataSource):
     with an optional match and count and iterates over the results
 
     """
+    rereadable = True
+
     def __init__(self, **kwargs):
         super(DataSource, self).__init__()
         self.limit = kwargs.pop('limit', 1000)
@@ -28,3 +30,17 @@ class Integers(DataSource):
 
     def next(self):
         return self._iter.next()
+
+    @classmethod
+    def partition_configs(cls, config, partitions):
+        """split the skip/limit range into contiguous ranges"""
+        skip = config.get('skip', 0)
+        limit = config.get('limit', 1000)
+        step = max(-(-(limit - skip) // partitions), 1)
+        result = []
+        for start in range(skip, limit, step):
+            part = dict(config)
+            part['skip'] = start
+            part['limit'] = min(start + step, limit)
+            result.append(part)
+        return result or [config]
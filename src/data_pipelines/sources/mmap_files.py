@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+"""
+mmap_files
+
+Data Sources that memory map a file and iterate over the
+records in it without copying them, either newline (or other
+delimiter) separated records or fixed width binary records.
+
+Each source can be restricted to a byte range of the file
+via start and end settings so that several workers can process
+disjoint regions of the same file, see byte_ranges for a helper
+that computes the ranges.
+
+Records are returned as zero copy slices of the mapped file,
+call bytes(record) (or str(record)) to get a copy of the data.
+The mapping stays open while any records are referenced, so they
+are still usable after the source disconnects, eg in the results
+of Pipeline.execute.
+
+"""
+import os
+import mmap
+
+from data_pipelines.data_source import DataSource
+
+
+def byte_ranges(filename, partitions):
+    """
+    _byte_ranges_
+
+    Split the file into the given number of contiguous
+    (start, end) byte ranges that can be passed to the
+    start and end settings of the mmap sources.
+    Records are assigned to the range that contains their
+    first byte, so the ranges dont need to be aligned
+    to record boundaries.
+    """
+    configs = MmapSource.partition_configs(
+        {'filename': filename}, partitions
+    )
+    return [(conf['start'], conf['end']) for conf in configs]
+
+
+class MmapSource(DataSource):
+    """
+    Base class for the mmap sources, handles mapping and
+    unmapping the file and the byte range and block settings.
+
+    Settings:
+     filename - path of the file to map
+     start - byte offset to start at, default 0
+     end - byte offset to stop at, defaults to end of file
+     block_size - if set, return blocks of whole records
+        of approximately this many bytes instead of
+        single records
+    """
+    rereadable = True
+
+    def __init__(self, **kwargs):
+        super(MmapSource, self).__init__()
+        self.filename = kwargs.pop('filename')
+        self.start = kwargs.pop('start', 0)
+        self.end = kwargs.pop('end', None)
+        self.block_size = kwargs.pop('block_size', None)
+        self._handle = None
+        self._mmap = None
+        self._view = None
+        self._pos = None
+        self._stop = None
+
+    def connect(self):
+        self._handle = open(self.filename, 'rb')
+        size = os.fstat(self._handle.fileno()).st_size
+        self._stop = size if self.end is None else min(self.end, size)
+        if size == 0:
+            # cant map an empty file, nothing to iterate
+            self._pos = self._stop
+            return
+        self._mmap = mmap.mmap(
+            self._handle.fileno(), 0, access=mmap.ACCESS_READ
+        )
+        try:
+            self._view = memoryview(self._mmap)
+        except TypeError:
+            # python 2 mmaps only support the old buffer interface
+            self._view = _BufferView(self._mmap)
+        self._pos = self._first_record(min(self.start, self._stop))
+
+    def disconnect(self):
+        view, self._view = self._view, None
+        if view is not None and hasattr(view, 'release'):
+            view.release()
+        if self._mmap is not None:
+            if not isinstance(view, _BufferView):
+                try:
+                    self._mmap.close()
+                except BufferError:
+                    # records are still referenced downstream, the
+                    # mapping will be released when they are
+                    pass
+            # python 2 buffers dont stop the mmap being closed but
+            # keep a reference to it, so it is unmapped when the
+            # last record is released instead
+            self._mmap = None
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def next(self):
+        if self._pos is None or self._pos >= self._stop:
+            raise StopIteration
+        if self.block_size:
+            begin = self._pos
+            last = self._record_end(begin)
+            while last < self._stop and last - begin < self.block_size:
+                last = self._record_end(last)
+            self._pos = last
+            return self._view[begin:last]
+        begin = self._pos
+        self._pos = self._record_end(begin)
+        return self._record(begin, self._pos)
+
+    @classmethod
+    def partition_configs(cls, config, partitions):
+        """split the byte range into contiguous ranges"""
+        start = config.get('start', 0)
+        end = config.get('end')
+        if end is None:
+            end = os.path.getsize(config['filename'])
+        size = end - start
+        partitions = max(1, min(partitions, size))
+        step, extra = divmod(size, partitions)
+        result = []
+        for i in range(partitions):
+            stop = start + step + (1 if i < extra else 0)
+            part = dict(config)
+            part['start'] = start
+            part['end'] = stop
+            result.append(part)
+            start = stop
+        return result
+
+    def _first_record(self, offset):
+        """
+        return the offset of the first record that starts
+        at or after offset
+        """
+        raise NotImplementedError()
+
+    def _record_end(self, offset):
+        """
+        return the offset just past the record starting at offset
+        """
+        raise NotImplementedError()
+
+    def _record(self, begin, end):
+        """
+        return the slice for the record between begin and end
+        """
+        return self._view[begin:end]
+
+
+class MmapLines(MmapSource):
+    """
+    Data source for delimiter separated records, eg
+    newline delimited JSON or CSV.
+    Records are returned without the trailing delimiter, in
+    block mode the blocks include the delimiters.
+
+    Additional Settings:
+     delimiter - record separator, default newline
+     skip_header - skip the first line of the file, default False
+    """
+    def __init__(self, **kwargs):
+        self.delimiter = kwargs.pop('delimiter', '\n')
+        self.skip_header = kwargs.pop('skip_header', False)
+        super(MmapLines, self).__init__(**kwargs)
+
+    def _first_record(self, offset):
+        if offset == 0:
+            if self.skip_header:
+                return self._record_end(0)
+            return 0
+        # a record starting exactly at offset belongs to this range,
+        # otherwise it belongs to the range that contains its start
+        before = offset - len(self.delimiter)
+        if before >= 0 and self._mmap[before:offset] == self.delimiter:
+            return offset
+        return self._record_end(offset)
+
+    def _record_end(self, offset):
+        found = self._mmap.find(self.delimiter, offset)
+        if found == -1:
+            return len(self._mmap)
+        return found + len(self.delimiter)
+
+    def _record(self, begin, end):
+        if self._mmap[end - len(self.delimiter):end] == self.delimiter:
+            end -= len(self.delimiter)
+        return self._view[begin:end]
+
+
+class MmapRecords(MmapSource):
+    """
+    Data source for fixed width binary records.
+
+    Additional Settings:
+     record_size - size of each record in bytes
+     header_size - number of bytes to skip at the start of
+        the file before the first record, default 0
+    """
+    def __init__(self, **kwargs):
+        self.record_size = kwargs.pop('record_size')
+        self.header_size = kwargs.pop('header_size', 0)
+        super(MmapRecords, self).__init__(**kwargs)
+
+    def connect(self):
+        super(MmapRecords, self).connect()
+        if self._mmap is None:
+            return
+        # ignore any trailing partial record
+        whole = max(len(self._mmap) - self.header_size, 0)
+        whole = whole // self.record_size
+        limit = self.header_size + whole * self.record_size - (
+            self.record_size - 1
+        )
+        self._stop = min(self._stop, max(limit, 0))
+
+    def _first_record(self, offset):
+        offset = max(offset, self.header_size) - self.header_size
+        index = -(-offset // self.record_size)
+        return self.header_size + index * self.record_size
+
+    def _record_end(self, offset):
+        return offset + self.record_size
+
+
+class _BufferView(object):
+    """
+    minimal zero copy slicing wrapper for python 2 mmaps
+    that dont support memoryview
+    """
+    def __init__(self, mapped):
+        self._mapped = mapped
+
+    def __getitem__(self, item):
+        return buffer(self._mapped, item.start, item.stop - item.start)
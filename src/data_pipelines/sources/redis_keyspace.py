@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+redis_keyspace
+
+Data Source that follows changes to redis keys with keyspace
+notifications, instead of rescanning the whole keyspace
+
+"""
+import time
+import itertools
+import collections
+
+import redis
+from data_pipelines.data_source import DataSource
+from data_pipelines.pipelines import LOADER
+
+
+class RedisKeyspace(DataSource):
+    """
+    Subscribe to the keyspace notifications for keys matching a
+    pattern, optionally after a full SCAN of the matching keys, and
+    return the current value of each string key that changes.
+    Each element is a dict of the key and its value, which is
+    None if the key was deleted or expired. Changes to keys of
+    other types are skipped.
+
+    Bursts of events for the same key are coalesced: once an event
+    arrives the source keeps collecting events for up to coalesce
+    milliseconds, or until count distinct keys have changed, and
+    fetches the values of the changed keys with batched MGETs, so
+    a key that is written many times in a burst is read once.
+
+    The subscription is made before the initial scan so no changes
+    are missed, keys that change during the scan are returned again.
+    Every run of a pipeline connects a new source, which makes its
+    own initial scan, so by default the source keeps waiting for
+    changes rather than stopping when idle: a job should keep one
+    run going instead of starting a new run, and a new full scan,
+    each cycle. Changes made while no source is subscribed are not
+    seen.
+
+    Redis only publishes keyspace notifications when the
+    notify-keyspace-events setting enables them, eg 'K$gx' for
+    string commands, generic commands like DEL and expiry. The
+    notify_events setting sets it when connecting.
+
+    Settings:
+     match - glob pattern of the keys to follow, default '*'
+     initial_scan - return every matching key first, default True
+     count - SCAN count and keys per MGET, default 100
+     block - milliseconds to wait for a notification, default 1000
+     coalesce - milliseconds to collect a burst of events, default 100
+     stop_when_idle - end iteration if nothing changes in block ms,
+        default False, keep waiting
+     max_entries - end iteration after this many elements
+     include_deleted - return deleted keys with a None value,
+        default True
+     notify_events - value to set notify-keyspace-events to
+     client_factory - name of a function called with the connection
+        settings to create the client instead of redis.Redis, as for
+        RedisScan
+    """
+    def __init__(self, **kwargs):
+        super(RedisKeyspace, self).__init__()
+        self.host = kwargs.pop('host', 'localhost')
+        self.port = kwargs.pop('port', 6379)
+        self.db = kwargs.pop('db', 0)
+        self.connect_args = kwargs.pop('connect_options', {})
+        self.match = kwargs.pop('match', '*')
+        self.initial_scan = kwargs.pop('initial_scan', True)
+        self.count = kwargs.pop('count', 100)
+        self.block = kwargs.pop('block', 1000)
+        self.coalesce = kwargs.pop('coalesce', 100)
+        self.stop_when_idle = kwargs.pop('stop_when_idle', False)
+        self.max_entries = kwargs.pop('max_entries', None)
+        self.include_deleted = kwargs.pop('include_deleted', True)
+        self.notify_events = kwargs.pop('notify_events', None)
+        self.client_factory = kwargs.pop('client_factory', None)
+        self._redis = None
+        self._pubsub = None
+        self._scan = None
+        self._buffer = None
+        self._entries = 0
+
+    @property
+    def channel_prefix(self):
+        return '__keyspace@{}__:'.format(self.db)
+
+    def connect(self):
+        client = redis.Redis
+        if self.client_factory is not None:
+            client = LOADER[self.client_factory]
+        self._redis = client(
+            host=self.host,
+            port=self.port,
+            db=self.db,
+            **self.connect_args
+        )
+        if self.notify_events is not None:
+            self._redis.config_set(
+                'notify-keyspace-events', self.notify_events
+            )
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(self.channel_prefix + self.match)
+        self._scan = None
+        if self.initial_scan:
+            self._scan = self._redis.scan_iter(
+                match=self.match, count=self.count
+            )
+        self._buffer = collections.deque()
+        self._entries = 0
+
+    def disconnect(self):
+        if self._pubsub is not None:
+            self._pubsub.close()
+        self._redis = None
+        self._pubsub = None
+        self._scan = None
+        self._buffer = None
+
+    def next(self):
+        if self.max_entries is not None and self._entries >= self.max_entries:
+            raise StopIteration
+        while not self._buffer:
+            if self._scan is not None:
+                keys = list(itertools.islice(self._scan, self.count))
+                if len(keys) < self.count:
+                    self._scan = None
+                self._fetch(keys)
+                continue
+            keys = self._changed()
+            if not keys and self.stop_when_idle:
+                raise StopIteration
+            self._fetch(keys)
+        self._entries += 1
+        key, value = self._buffer.popleft()
+        return {'key': key, 'value': value}
+
+    def _changed(self):
+        """
+        wait for a notification, then collect the distinct keys
+        changed in the burst that follows it
+        """
+        message = self._message(time.time() + self.block / 1000.0)
+        if message is None:
+            return []
+        keys = collections.OrderedDict()
+        deadline = time.time() + self.coalesce / 1000.0
+        while message is not None:
+            if message['type'] == 'pmessage':
+                keys[message['channel'][len(self.channel_prefix):]] = None
+            if len(keys) >= self.count:
+                break
+            message = self._message(deadline)
+        return keys.keys()
+
+    def _message(self, deadline):
+        """
+        the next notification before the deadline or None,
+        get_message also returns None for the subscribe confirmation
+        """
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            message = self._pubsub.get_message(timeout=remaining)
+            if message is not None:
+                return message
+
+    def _fetch(self, keys):
+        """
+        add the current values of keys to the buffer, MGET also
+        returns None for keys that arent strings so those are
+        checked with EXISTS and skipped if they are still there
+        """
+        for i in range(0, len(keys), self.count):
+            chunk = keys[i:i + self.count]
+            values = self._redis.mget(chunk)
+            missing = [
+                key for key, value in zip(chunk, values) if value is None
+            ]
+            deleted = set()
+            if missing and self.include_deleted:
+                pipe = self._redis.pipeline(transaction=False)
+                for key in missing:
+                    pipe.exists(key)
+                deleted = set(
+                    key for key, exists in zip(missing, pipe.execute())
+                    if not exists
+                )
+            for key, value in zip(chunk, values):
+                if value is None and key not in deleted:
+                    continue
+                self._buffer.append((key, value))
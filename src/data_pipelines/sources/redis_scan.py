@@ -6,8 +6,13 @@ Data Source that uses a redis scan command to generate
 a data source
 
 """
+import time
+import zlib
+import fnmatch
 import redis
 from data_pipelines.data_source import DataSource
+from data_pipelines.pipelines import LOADER
+from data_pipelines.tuning import make_tuner
 
 
 class RedisScan(DataSource):
@@ -15,34 +20,223 @@ class RedisScan(DataSource):
     Simple data source that runs a redis SCAN operation
     with an optional match and count and iterates over the results
 
+    The output setting chooses what is returned for each key:
+     'values' - the value of the key, the default
+     'items' - a dict of the key and its value, like RedisKeyspace,
+        eg to drop keys that SCAN returns more than once with a
+        PipelineDistinct using distinct.item_key
+
+    Change detection:
+    If the fingerprints setting names a redis hash, a fingerprint
+    of each value is compared with the one stored in that hash by the
+    previous run and only values that changed are returned.
+    The new fingerprints are stored when the source disconnects,
+    unless the pipeline is aborted by an error, so a failed run will
+    reprocess its changes next time.
+    When a scan completes, the fingerprints of keys in its match
+    and partition that it didnt see, ie deleted keys, are removed
+    from the hash so it doesnt keep growing.
+    The fingerprint setting chooses how fingerprints are computed:
+     'value' - crc32 of the value, which is fetched for every key
+     'digest' - server side DEBUG DIGEST-VALUE, which avoids
+        transferring unchanged values but needs the DEBUG command
+        to be enabled
+
+    Partitioning:
+    SCAN cursors cant be split into ranges, so partitions are
+    made by hashing keys instead: with the partition and partitions
+    settings each source scans the whole keyspace but only fetches
+    the values of keys where crc32(key) % partitions == partition.
+
+    Tuning:
+    With a tune setting the count passed to each SCAN call is
+    adjusted by an AIMDTuner (see data_pipelines.tuning) from the
+    number of keys each call returns and the time it takes,
+    starting from count, or the redis default of 10 if count
+    isnt set.
+
+    The client_factory setting names a function that is called with
+    the connection settings to create the client instead of
+    redis.Redis, eg to read from a fake redis in tests.
     """
+    rereadable = True
+
     def __init__(self, **kwargs):
         self.host = kwargs.pop('host', 'localhost')
         self.port = kwargs.pop('port', 6379)
         self.db = kwargs.pop('db', 0)
         self.connect_args = kwargs.pop('connect_options', {})
+        self.client_factory = kwargs.pop('client_factory', None)
         self.match = kwargs.pop('match', None)
         self.count = kwargs.pop('count', None)
+        self.tune = kwargs.pop('tune', None)
+        self.output = kwargs.pop('output', 'values')
+        if self.output not in ('values', 'items'):
+            raise ValueError(
+                "Unsupported RedisScan output: {}".format(self.output)
+            )
+        self.fingerprints = kwargs.pop('fingerprints', None)
+        self.fingerprint = kwargs.pop('fingerprint', 'value')
+        self.partition = kwargs.pop('partition', 0)
+        self.partitions = kwargs.pop('partitions', 1)
         self._redis = None
         self._iter = None
+        self._changed = None
+        self._seen = None
+        self._complete = False
+        self._tuner = None
 
     def connect(self):
-        self._redis = redis.Redis(
+        client = redis.Redis
+        if self.client_factory is not None:
+            client = LOADER[self.client_factory]
+        self._redis = client(
             host=self.host,
             port=self.port,
             db=self.db,
             **self.connect_args
         )
-        self._iter = self._redis.scan_iter(
-            match=self.match,
-            count=self.count
-        )
+        self._tuner = make_tuner(self.tune, self.count or 10)
+        if self._tuner is not None:
+            self._iter = self._tuned_scan()
+        else:
+            self._iter = self._redis.scan_iter(
+                match=self.match,
+                count=self.count
+            )
+        self._changed = {}
+        self._seen = set()
+        self._complete = False
 
     def disconnect(self):
+        if self._changed and self._redis is not None:
+            self._save_fingerprints()
+        if self._complete and self.fingerprints is not None:
+            self._prune_fingerprints()
+        self.abort()
+
+    def abort(self):
+        """disconnect without saving or pruning fingerprints"""
         del self._redis
         self._redis = None
         self._iter = None
+        self._changed = None
+        self._seen = None
 
     def next(self):
-        val = self._iter.next()
-        return self._redis.get(val)
+        if self.fingerprints is not None:
+            key, value = self._next_changed()
+        else:
+            key = self._next_key()
+            value = self._redis.get(key)
+        if self.output == 'items':
+            return {'key': key, 'value': value}
+        return value
+
+    def _next_key(self):
+        """next key from the scan that is in this partition"""
+        while True:
+            try:
+                key = self._iter.next()
+            except StopIteration:
+                self._complete = True
+                raise
+            if self._in_partition(key):
+                return key
+
+    def _tuned_scan(self):
+        """
+        iterate over the keys returned by SCAN, passing the
+        tuned count to each call
+        """
+        cursor = '0'
+        while cursor != 0:
+            started = time.time()
+            cursor, keys = self._redis.scan(
+                cursor, match=self.match, count=self._tuner.value
+            )
+            self._tuner.observe(len(keys), time.time() - started)
+            for key in keys:
+                yield key
+
+    def tuning(self):
+        """the tuned count and statistics, if tuning"""
+        if self._tuner is None:
+            return None
+        return {
+            'settings': {'count': self._tuner.value},
+            'stats': self._tuner.stats()
+        }
+
+    def _in_partition(self, key):
+        if self.partitions == 1:
+            return True
+        hashed = zlib.crc32(key) & 0xffffffff
+        return hashed % self.partitions == self.partition
+
+    @classmethod
+    def partition_configs(cls, config, partitions):
+        """split the keyspace by key hash"""
+        result = []
+        for i in range(partitions):
+            part = dict(config)
+            part['partition'] = i
+            part['partitions'] = partitions
+            result.append(part)
+        return result
+
+    @classmethod
+    def sample_config(cls, config):
+        """sample every value without touching the fingerprints"""
+        config = dict(config)
+        config.pop('fingerprints', None)
+        return config
+
+    def _next_changed(self):
+        """
+        return the next key and value whose fingerprint differs
+        from the stored fingerprint
+        """
+        while True:
+            key = self._next_key()
+            self._seen.add(key)
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.hget(self.fingerprints, key)
+            if self.fingerprint == 'digest':
+                pipe.execute_command('DEBUG', 'DIGEST-VALUE', key)
+                previous, digest = pipe.execute()
+                current = str(digest[0] if isinstance(digest, list) else digest)
+                if current == previous:
+                    continue
+                value = self._redis.get(key)
+            else:
+                pipe.get(key)
+                previous, value = pipe.execute()
+                current = str(zlib.crc32(value or '') & 0xffffffff)
+                if current == previous:
+                    continue
+            self._changed[key] = current
+            return key, value
+
+    def _save_fingerprints(self, chunk=1000):
+        """write the fingerprints of changed values"""
+        items = self._changed.items()
+        for i in range(0, len(items), chunk):
+            pipe = self._redis.pipeline(transaction=False)
+            for key, fingerprint in items[i:i + chunk]:
+                pipe.hset(self.fingerprints, key, fingerprint)
+            pipe.execute()
+        self._changed = {}
+
+    def _prune_fingerprints(self, chunk=1000):
+        """
+        remove the fingerprints of keys covered by this scan
+        that it didnt see because they have been deleted
+        """
+        stale = [
+            key for key, _ in self._redis.hscan_iter(self.fingerprints)
+            if key not in self._seen and self._in_partition(key) and
+            (self.match is None or fnmatch.fnmatchcase(key, self.match))
+        ]
+        for i in range(0, len(stale), chunk):
+            self._redis.hdel(self.fingerprints, *stale[i:i + chunk])
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+"""
+redis_stream
+
+Data Source that reads entries from a redis stream as
+a member of a consumer group
+
+"""
+import os
+import time
+import socket
+import collections
+
+import redis
+from data_pipelines.data_source import DataSource
+from data_pipelines.utilities import short_uuid
+
+
+class RedisStream(DataSource):
+    """
+    Read a redis stream with XREADGROUP in batches of count entries,
+    blocking for up to block milliseconds for new entries.
+    Each element is a dict containing the entry id and fields.
+
+    Several pipelines can share the work of a stream by using the
+    same group with different consumer names, consumer defaults
+    to a name unique to the process.
+
+    Entries are acknowledged a batch at a time: when the source is
+    asked for an entry after handing out every entry of the current
+    batch, which means they have passed through the rest of the
+    pipeline, the XACK for that batch is sent in the same round trip
+    as the next XREADGROUP. The last batch is acknowledged when the
+    iteration ends. Operators that hold on to elements past the next
+    read (eg group by) should use ack_on_end so entries are only
+    acknowledged once the pipeline has finished.
+    If the pipeline is closed before the stream ends, or aborted by
+    an error, the last entry handed out may still be in flight, so it
+    is left pending to be read again, and with ack_on_end nothing is
+    acknowledged when the pipeline is aborted.
+
+    Entries left pending by consumers that died are claimed once
+    they have been idle for claim_idle milliseconds, and entries
+    pending for this consumer from an earlier run are read first.
+
+    Settings:
+     stream - name of the stream
+     group - consumer group name, created if needed
+     consumer - consumer name, defaults to host-pid-uuid
+     start_id - where a newly created group starts, default '$'
+     count - entries per XREADGROUP, default 100
+     block - milliseconds to wait for new entries, default 1000
+     stop_when_idle - end iteration if nothing arrives in block ms,
+        default True, otherwise keep waiting
+     max_entries - end iteration after this many entries
+     claim_idle - milliseconds after which pending entries of other
+        consumers are claimed, None to disable. Default 60000
+     ack_on_end - only acknowledge entries when iteration ends
+    """
+    acknowledges = True
+
+    def __init__(self, **kwargs):
+        super(RedisStream, self).__init__()
+        self.host = kwargs.pop('host', 'localhost')
+        self.port = kwargs.pop('port', 6379)
+        self.db = kwargs.pop('db', 0)
+        self.connect_args = kwargs.pop('connect_options', {})
+        self.stream = kwargs.pop('stream')
+        self.group = kwargs.pop('group')
+        self.consumer = kwargs.pop('consumer', None) or '{}-{}-{}'.format(
+            socket.gethostname(), os.getpid(), short_uuid()
+        )
+        self.start_id = kwargs.pop('start_id', '$')
+        self.count = kwargs.pop('count', 100)
+        self.block = kwargs.pop('block', 1000)
+        self.stop_when_idle = kwargs.pop('stop_when_idle', True)
+        self.max_entries = kwargs.pop('max_entries', None)
+        self.claim_idle = kwargs.pop('claim_idle', 60000)
+        self.ack_on_end = kwargs.pop('ack_on_end', False)
+        self._redis = None
+        self._buffer = None
+        self._delivered = None
+        self._in_flight = None
+        self._ended = False
+        self._pending_id = '0'
+        self._last_claim = 0
+        self._entries = 0
+
+    def connect(self):
+        self._redis = redis.Redis(
+            host=self.host,
+            port=self.port,
+            db=self.db,
+            **self.connect_args
+        )
+        try:
+            self._redis.xgroup_create(
+                self.stream, self.group, id=self.start_id, mkstream=True
+            )
+        except redis.ResponseError as ex:
+            if 'BUSYGROUP' not in str(ex):
+                raise
+        self._buffer = collections.deque()
+        self._delivered = []
+        self._in_flight = None
+        self._ended = False
+        self._pending_id = '0'
+        self._last_claim = 0
+        self._entries = 0
+
+    def disconnect(self):
+        """
+        acknowledge the delivered entries, except the one in
+        flight if the stream didnt end
+        """
+        self._release(True)
+
+    def abort(self):
+        """
+        acknowledge the entries that were fully consumed, unless
+        they are only acknowledged at the end
+        """
+        self._release(not self.ack_on_end)
+
+    def _release(self, ack):
+        if self._redis is not None and ack:
+            consumed = [
+                entry_id for entry_id in self._delivered
+                if self._ended or entry_id != self._in_flight
+            ]
+            if consumed:
+                self._redis.xack(self.stream, self.group, *consumed)
+        self._redis = None
+        self._buffer = None
+        self._delivered = None
+        self._in_flight = None
+
+    def next(self):
+        if self.max_entries is not None and self._entries >= self.max_entries:
+            self._ended = True
+            raise StopIteration
+        while not self._buffer:
+            if not self._fetch() and self.stop_when_idle:
+                self._ended = True
+                raise StopIteration
+        entry_id, fields = self._buffer.popleft()
+        self._delivered.append(entry_id)
+        self._in_flight = entry_id
+        self._entries += 1
+        return {'id': entry_id, 'fields': fields}
+
+    def _fetch(self):
+        """
+        acknowledge the delivered batch and read the next one,
+        returns True if any entries were read
+        """
+        claimed = self._claim()
+        if claimed:
+            self._buffer.extend(claimed)
+            return True
+        count = self.count
+        if self.max_entries is not None:
+            count = min(count, self.max_entries - self._entries)
+        pipe = self._redis.pipeline(transaction=False)
+        if self._delivered and not self.ack_on_end:
+            pipe.xack(self.stream, self.group, *self._delivered)
+        if self._pending_id is not None:
+            # entries delivered to this consumer by an earlier run
+            pipe.xreadgroup(
+                self.group, self.consumer, {self.stream: self._pending_id},
+                count=count
+            )
+        else:
+            pipe.xreadgroup(
+                self.group, self.consumer, {self.stream: '>'},
+                count=count, block=self.block
+            )
+        response = pipe.execute()
+        if self._delivered and not self.ack_on_end:
+            self._delivered = []
+        entries = []
+        if response[-1]:
+            entries = response[-1][0][1]
+        if self._pending_id is not None:
+            if not entries:
+                self._pending_id = None
+                return self._fetch()
+            self._pending_id = entries[-1][0]
+        entries = self._live(entries)
+        self._buffer.extend(entries)
+        return bool(entries) or self._pending_id is not None
+
+    def _live(self, entries):
+        """
+        drop entries that were deleted while pending,
+        they are acknowledged with the next batch
+        """
+        live = []
+        for entry_id, fields in entries:
+            if fields:
+                live.append((entry_id, fields))
+            else:
+                self._delivered.append(entry_id)
+        return live
+
+    def _claim(self):
+        """claim entries left pending by other consumers for too long"""
+        if self.claim_idle is None:
+            return []
+        now = time.time()
+        if (now - self._last_claim) * 1000 < self.claim_idle:
+            return []
+        self._last_claim = now
+        pending = self._redis.xpending_range(
+            self.stream, self.group, '-', '+', self.count
+        )
+        stale = [
+            p['message_id'] for p in pending
+            if p['consumer'] != self.consumer and
+            p['time_since_delivered'] >= self.claim_idle
+        ]
+        if not stale:
+            return []
+        claimed = self._redis.xclaim(
+            self.stream, self.group, self.consumer, self.claim_idle, stale
+        )
+        return self._live(claimed)
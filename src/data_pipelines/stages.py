@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+"""
+stages
+
+Run the operators of a pipeline as concurrent stages in separate
+processes, so that eg decoding, a heavy transform and a sink can
+each use a different core.
+
+The chain of operators is split into stages at the given operator
+labels, or between every operator by default. Each stage except
+the last runs in a forked child process, and the last runs in the
+calling process. Consecutive stages are connected by SharedRing
+buffers: fixed size slots in an anonymous shared memory map,
+with semaphores counting the free and filled slots, which carry
+batches of elements from one stage to the next.
+
+Batches made up of byte strings (eg RedisScan values, or the
+records of the mmap sources) are written to the ring as
+length prefixed raw bytes, so they arent pickled; any other batch
+is pickled. Messages bigger than a slot span several slots.
+
+Each run builds its stages from a copy of the pipeline made from
+its config, so the pipeline itself isnt rewired and the staged
+pipeline can be run again.
+
+pipeline = Pipeline.from_configuration(conf)
+results = StagedPipeline(pipeline, boundaries=[heavy.label]).execute()
+
+"""
+import os
+import mmap
+import struct
+import traceback
+import multiprocessing
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from .pipelines import Pipeline, operator_chain, serialize
+
+
+SLOT_HEADER = struct.Struct('<IB')
+COUNT = struct.Struct('<I')
+
+BYTES = 'B'
+PICKLED = 'P'
+END = 'E'
+ERROR = 'X'
+
+
+class StageError(RuntimeError):
+    """
+    a stage running in another process failed, the message
+    includes the traceback from that process
+    """
+
+
+class StageStopped(Exception):
+    """the staged pipeline was closed while waiting on a ring"""
+
+
+class SharedRing(object):
+    """
+    _SharedRing_
+
+    Single producer, single consumer ring of slots in shared
+    memory. It must be created before forking the processes that
+    use it. Each slot holds a header of the number of bytes used
+    and whether the message continues in the next slot.
+    If a stop event is given, waiting to read or write raises
+    StageStopped once it is set.
+    """
+    def __init__(self, slots=64, slot_size=65536, stop=None):
+        if slot_size <= SLOT_HEADER.size:
+            raise ValueError("SharedRing slot_size is too small")
+        self.slots = slots
+        self.slot_size = slot_size
+        self.capacity = slot_size - SLOT_HEADER.size
+        self._mmap = mmap.mmap(-1, slots * slot_size)
+        self._free = multiprocessing.Semaphore(slots)
+        self._filled = multiprocessing.Semaphore(0)
+        self._stop = stop
+        self._write_slot = 0
+        self._read_slot = 0
+
+    def write(self, message):
+        """write a message, waiting for free slots as needed"""
+        offset = 0
+        while True:
+            chunk = message[offset:offset + self.capacity]
+            offset += len(chunk)
+            more = offset < len(message)
+            self._acquire(self._free)
+            start = self._write_slot * self.slot_size
+            SLOT_HEADER.pack_into(self._mmap, start, len(chunk), more)
+            body = start + SLOT_HEADER.size
+            self._mmap[body:body + len(chunk)] = chunk
+            self._write_slot = (self._write_slot + 1) % self.slots
+            self._filled.release()
+            if not more:
+                return
+
+    def _acquire(self, semaphore, alive=None):
+        """
+        wait for a slot while the other process is alive
+        and the pipeline hasnt been stopped
+        """
+        while not semaphore.acquire(True, 0.1):
+            if self._stop is not None and self._stop.is_set():
+                raise StageStopped()
+            if alive is not None and not alive():
+                if semaphore.acquire(True, 0.1):
+                    return
+                raise StageError("stage process exited unexpectedly")
+
+    def read(self, alive=None):
+        """
+        read the next message, waiting for it to be written.
+        alive is called while waiting to check the writer is running
+        """
+        chunks = []
+        more = True
+        while more:
+            self._acquire(self._filled, alive)
+            start = self._read_slot * self.slot_size
+            size, more = SLOT_HEADER.unpack_from(self._mmap, start)
+            body = start + SLOT_HEADER.size
+            chunks.append(self._mmap[body:body + size])
+            self._read_slot = (self._read_slot + 1) % self.slots
+            self._free.release()
+        return ''.join(chunks)
+
+    def close(self):
+        self._mmap.close()
+
+
+def _is_bytes(value):
+    return isinstance(value, (str, buffer, bytearray, memoryview))
+
+
+def encode_batch(batch):
+    """
+    encode a batch of elements, byte strings are framed
+    with their lengths and anything else is pickled
+    """
+    if batch and all(_is_bytes(value) for value in batch):
+        values = [bytes(value) for value in batch]
+        lengths = struct.pack(
+            '<{}I'.format(len(values)), *[len(v) for v in values]
+        )
+        return ''.join(
+            [BYTES, COUNT.pack(len(values)), lengths] + values
+        )
+    return PICKLED + pickle.dumps(batch, pickle.HIGHEST_PROTOCOL)
+
+
+def decode_batch(message):
+    """decode a batch encoded by encode_batch"""
+    if message[0] == PICKLED:
+        return pickle.loads(message[1:])
+    count, = COUNT.unpack_from(message, 1)
+    offset = 1 + COUNT.size
+    lengths = struct.unpack_from('<{}I'.format(count), message, offset)
+    offset += 4 * count
+    batch = []
+    for length in lengths:
+        batch.append(message[offset:offset + length])
+        offset += length
+    return batch
+
+
+class RingReader(object):
+    """
+    iterator over the elements of the batches written to a ring
+    by the previous stage, raising StageError if it failed.
+    alive checks the stages writing to the ring are running, it is
+    only called in the process that created the reader
+    """
+    def __init__(self, ring, alive=None):
+        self.ring = ring
+        self.alive = alive
+        self._pid = os.getpid()
+        self._batch = []
+        self._index = 0
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while self._index >= len(self._batch):
+            if self._finished:
+                raise StopIteration
+            alive = self.alive if os.getpid() == self._pid else None
+            message = self.ring.read(alive)
+            if message[0] == END:
+                self._finished = True
+            elif message[0] == ERROR:
+                self._finished = True
+                raise StageError(message[1:])
+            else:
+                self._batch = decode_batch(message)
+                self._index = 0
+        value = self._batch[self._index]
+        self._index += 1
+        return value
+
+
+def _run_stage(end, ring, batch_size, stop, abort):
+    """
+    child process body, run a stage and write its output
+    to the ring in batches followed by an end or error message.
+    When the pipeline is stopped the operators of the stage and
+    those upstream of it in this process are closed, so sources
+    disconnect cleanly before the process exits, they are aborted
+    if the stage failed or the pipeline was aborted
+    """
+    message = END
+    failed = False
+    try:
+        batch = []
+        for value in end:
+            batch.append(value)
+            if len(batch) >= batch_size:
+                ring.write(encode_batch(batch))
+                batch = []
+            if stop.is_set():
+                raise StageStopped()
+        if batch:
+            ring.write(encode_batch(batch))
+    except StageStopped:
+        message = None
+    except Exception:
+        message = ERROR + traceback.format_exc()
+        failed = True
+    finally:
+        end.close(abort=failed or abort.is_set())
+    if message is not None:
+        try:
+            ring.write(message)
+        except StageStopped:
+            pass
+
+
+class StagedPipeline(object):
+    """
+    _StagedPipeline_
+
+    Execute a pipeline with its operators split into stages that
+    run concurrently in separate processes.
+
+    boundaries - labels of the operators that start a new stage,
+        by default every operator is its own stage
+    batch_size - elements sent between stages at a time
+    slots, slot_size - number and size in bytes of the slots in
+        the ring between each pair of stages, so a fast stage can
+        get at most slots batches ahead of the next one
+    stop_timeout - seconds to wait for the stage processes to close
+        their operators when the pipeline is closed before they are
+        terminated
+    """
+    def __init__(self, pipeline, boundaries=None, batch_size=100,
+                 slots=64, slot_size=65536, stop_timeout=5):
+        self.pipeline = pipeline
+        self.boundaries = boundaries
+        self.batch_size = batch_size
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stop_timeout = stop_timeout
+        self._processes = []
+        self._rings = []
+        self._stop = None
+        self._abort = None
+        self._end = None
+
+    def stages(self, pipeline=None):
+        """
+        the operator chain of the pipeline, or of the given copy
+        of it, split into a list of stages
+        """
+        chain = operator_chain(pipeline or self.pipeline)
+        stages = [[chain[0]]]
+        for oper in chain[1:]:
+            if self.boundaries is None or oper.label in self.boundaries:
+                stages.append([])
+            stages[-1].append(oper)
+        return stages
+
+    def _start(self):
+        """
+        fork the processes for every stage but the last,
+        wiring up the stages of a copy of the pipeline
+        """
+        stages = self.stages(
+            Pipeline.from_configuration(serialize(self.pipeline))
+        )
+        self._stop = multiprocessing.Event()
+        self._abort = multiprocessing.Event()
+        for stage, following in zip(stages, stages[1:]):
+            ring = SharedRing(self.slots, self.slot_size, self._stop)
+            process = multiprocessing.Process(
+                target=_run_stage,
+                args=(
+                    stage[-1], ring, self.batch_size, self._stop, self._abort
+                )
+            )
+            process.daemon = True
+            process.start()
+            # the parent only reads from the ring
+            self._rings.append(ring)
+            self._processes.append(process)
+            following[0].chain(RingReader(ring, self._alive))
+        self._end = stages[-1][-1]
+        return self._end
+
+    def _alive(self):
+        """
+        False once the last stage process has exited, or any of
+        them has failed without reporting it
+        """
+        if not self._processes[-1].is_alive():
+            return False
+        return not any(p.exitcode for p in self._processes)
+
+    def __iter__(self):
+        end = self._start()
+        try:
+            for value in end:
+                yield value
+        except Exception:
+            self.close(abort=True)
+            raise
+        finally:
+            self.close()
+
+    def execute(self):
+        return [value for value in self]
+
+    def close(self, abort=False):
+        """
+        stop the stage processes, letting them close their
+        operators, and release the rings. Processes that dont
+        stop within stop_timeout seconds are terminated.
+        abort is passed on to the operators of every stage, see
+        PipelineOperator.close
+        """
+        if self._end is not None:
+            self._end.close(abort)
+        if self._stop is not None:
+            if abort:
+                self._abort.set()
+            self._stop.set()
+        for process in self._processes:
+            process.join(self.stop_timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for ring in self._rings:
+            ring.close()
+        self._processes = []
+        self._rings = []
+        self._end = None
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+tuning
+
+Adaptive tuning of batch sizes while a pipeline runs.
+
+An AIMDTuner adjusts a setting from the throughput and latency of
+each batch. The tuned settings are:
+ - the number of keys a PipelineJoin looks up at once (batch_size)
+ - the batch size of a prefetching source (prefetch batch_size)
+ - the count passed to each SCAN call by RedisScan (count)
+The tuner works one batch at a time:
+the setting grows additively while throughput holds up and
+latency stays under the target, and shrinks multiplicatively when
+a batch takes longer than the target or throughput drops.
+
+The number of batches a prefetching source reads ahead
+(queue_size) and the number of workers of staged or distributed
+pipelines are not tuned, they stay as configured.
+
+Tuning is enabled with a tune setting on the operator or the
+RedisScan config, or in the prefetch options of a source, eg:
+
+"tune": {"minimum": 10, "maximum": 10000, "target_latency": 0.5}
+
+A TuningStore records the tuned values and batch statistics of
+each operator in a pipeline when a run ends and applies them to
+the next run of the same pipeline, identified by its label, so
+continuous pipelines start from the last good values.
+
+"""
+import os
+import json
+
+
+class AIMDTuner(object):
+    """
+    _AIMDTuner_
+
+    Additive increase, multiplicative decrease controller
+    for an integer setting between minimum and maximum.
+
+    value - starting value
+    increase - amount added after a good batch
+    decrease - factor applied after a bad batch
+    target_latency - most seconds a batch should take, if set
+    tolerance - fraction below the average throughput that
+        counts as a drop
+    smoothing - weight of each batch in the average throughput
+    """
+    def __init__(self, value=100, minimum=1, maximum=10000, increase=None,
+                 decrease=0.5, target_latency=None, tolerance=0.2,
+                 smoothing=0.3):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.value = self._bound(value)
+        self.increase = increase or max(1, self.value // 10)
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.throughput = None
+        self.batches = 0
+        self.items = 0
+        self.seconds = 0.0
+
+    def _bound(self, value):
+        return int(min(self.maximum, max(self.minimum, value)))
+
+    def observe(self, count, seconds):
+        """
+        record a batch of count items that took seconds
+        and return the new value of the setting
+        """
+        if not count:
+            return self.value
+        self.batches += 1
+        self.items += count
+        self.seconds += seconds
+        throughput = count / max(seconds, 1e-6)
+        slow = (
+            self.target_latency is not None and
+            seconds > self.target_latency
+        )
+        dropped = (
+            self.throughput is not None and
+            throughput < self.throughput * (1 - self.tolerance)
+        )
+        if self.throughput is None:
+            self.throughput = throughput
+        else:
+            self.throughput += self.smoothing * (throughput - self.throughput)
+        if slow or dropped:
+            self.value = self._bound(self.value * self.decrease)
+        else:
+            self.value = self._bound(self.value + self.increase)
+        return self.value
+
+    def stats(self):
+        """summary of the batches observed"""
+        return {
+            'value': self.value,
+            'batches': self.batches,
+            'items': self.items,
+            'seconds': self.seconds,
+            'throughput': self.throughput,
+            'latency': self.seconds / self.batches if self.batches else None
+        }
+
+
+def make_tuner(options, value):
+    """
+    _make_tuner_
+
+    Create a tuner from a tune setting, either True or a
+    dict of AIMDTuner options, starting from value
+    """
+    if not options:
+        return None
+    if options is True:
+        options = {}
+    options = dict(options)
+    options.setdefault('value', value)
+    return AIMDTuner(**options)
+
+
+def operators(pipeline):
+    """
+    _operators_
+
+    iterate over every operator in a pipeline,
+    including the sub pipelines of maps
+    """
+    seen = set()
+    stack = [pipeline.end]
+    while stack:
+        oper = stack.pop()
+        if id(oper) in seen or not hasattr(oper, 'label'):
+            continue
+        seen.add(id(oper))
+        yield oper
+        if getattr(oper, 'input', None) is not None:
+            stack.append(oper.input)
+        stack.extend(p.end for p in getattr(oper, 'inputs', []))
+
+
+class TuningStore(object):
+    """
+    _TuningStore_
+
+    Directory of JSON files, one per pipeline label, holding
+    the tuned settings and statistics of each operator
+    """
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def _filename(self, job):
+        return os.path.join(self.path, '{}.json'.format(job))
+
+    def load(self, job):
+        """saved {operator label: tuning} for the job"""
+        try:
+            with open(self._filename(job)) as handle:
+                return json.load(handle)
+        except (IOError, ValueError):
+            return {}
+
+    def save(self, job, tuning):
+        filename = self._filename(job)
+        temp = '{}.tmp'.format(filename)
+        with open(temp, 'w') as handle:
+            json.dump(tuning, handle, indent=2, sort_keys=True)
+        os.rename(temp, filename)
+
+    def apply(self, pipeline):
+        """set the saved values on the operators of the pipeline"""
+        saved = self.load(pipeline.label)
+        for oper in operators(pipeline):
+            if oper.label in saved:
+                oper.apply_tuning(saved[oper.label]['settings'])
+
+    def record(self, pipeline):
+        """save the tuned values of the operators of the pipeline"""
+        tuning = self.load(pipeline.label)
+        for oper in operators(pipeline):
+            result = oper.tuning()
+            if result:
+                tuning[oper.label] = result
+        self.save(pipeline.label, tuning)
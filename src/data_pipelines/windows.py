@@ -0,0 +1,443 @@
+#!/usr/bin/env python
+"""
+windows
+
+Window state for the PipelineWindow operator: tumbling,
+sliding and session windows over a stream of elements, either
+counted in elements or measured using element timestamps.
+
+Window contents are held in fixed capacity ring buffers and the
+aggregates are updated incrementally as elements enter and leave
+a window, so the cost per element is O(1) (amortized for min/max)
+rather than a recomputation over the window.
+
+Window aggregations use the same spec format as the reduce
+operators, supporting the count, sum, mean, min and max types:
+
+{"total": {"type": "sum", "action": "module.get_value"}}
+
+"""
+import time
+
+
+MISSING = object()
+
+
+def arrival_time(value):
+    """
+    timestamp function that uses the time an element
+    was processed, for streams without timestamps
+    """
+    return time.time()
+
+
+class RingBuffer(object):
+    """
+    _RingBuffer_
+
+    Fixed capacity double ended queue backed by a
+    preallocated list. Appending to a full buffer evicts and
+    returns the oldest item, otherwise MISSING is returned
+    """
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("RingBuffer capacity must be positive")
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._head = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self._items[(self._head + i) % self.capacity]
+
+    def append(self, item):
+        evicted = MISSING
+        if self._size == self.capacity:
+            evicted = self.popleft()
+        self._items[(self._head + self._size) % self.capacity] = item
+        self._size += 1
+        return evicted
+
+    def popleft(self):
+        if not self._size:
+            raise IndexError("pop from an empty RingBuffer")
+        item = self._items[self._head]
+        self._items[self._head] = None
+        self._head = (self._head + 1) % self.capacity
+        self._size -= 1
+        return item
+
+    def pop(self):
+        if not self._size:
+            raise IndexError("pop from an empty RingBuffer")
+        index = (self._head + self._size - 1) % self.capacity
+        item = self._items[index]
+        self._items[index] = None
+        self._size -= 1
+        return item
+
+    def first(self):
+        if not self._size:
+            raise IndexError("RingBuffer is empty")
+        return self._items[self._head]
+
+    def last(self):
+        if not self._size:
+            raise IndexError("RingBuffer is empty")
+        return self._items[(self._head + self._size - 1) % self.capacity]
+
+    def clear(self):
+        while self._size:
+            self.popleft()
+
+
+class WindowAggregate(object):
+    """
+    Base class for incrementally maintained window aggregates,
+    elements are identified by a sequence number so that
+    they can be removed in the order they were added.
+    capacity is the most elements the window can hold, or None
+    if elements are never removed
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.reset()
+
+    def reset(self):
+        self.total = 0
+        self.count = 0
+
+    def add(self, seq, value):
+        self.total += value
+        self.count += 1
+
+    def remove(self, seq, value):
+        self.total -= value
+        self.count -= 1
+
+    def result(self):
+        return self.total
+
+
+class WindowCount(WindowAggregate):
+    """number of elements in the window"""
+    def add(self, seq, value):
+        self.count += 1
+
+    def remove(self, seq, value):
+        self.count -= 1
+
+    def result(self):
+        return self.count
+
+
+class WindowSum(WindowAggregate):
+    """sum of values in the window"""
+
+
+class WindowMean(WindowAggregate):
+    """mean of values in the window"""
+    def result(self):
+        if not self.count:
+            return None
+        return float(self.total) / self.count
+
+
+class WindowMin(WindowAggregate):
+    """
+    minimum of the window, using a monotonic queue
+    of candidate (seq, value) pairs if elements can be removed
+    """
+    def reset(self):
+        self.best = None
+        self.candidates = None
+        if self.capacity is not None:
+            self.candidates = RingBuffer(self.capacity)
+
+    def _replaces(self, new, old):
+        return new <= old
+
+    def add(self, seq, value):
+        if self.candidates is None:
+            if self.best is None or self._replaces(value, self.best):
+                self.best = value
+            return
+        while self.candidates and self._replaces(
+                value, self.candidates.last()[1]):
+            self.candidates.pop()
+        self.candidates.append((seq, value))
+
+    def remove(self, seq, value):
+        if self.candidates and self.candidates.first()[0] == seq:
+            self.candidates.popleft()
+
+    def result(self):
+        if self.candidates is None:
+            return self.best
+        if not self.candidates:
+            return None
+        return self.candidates.first()[1]
+
+
+class WindowMax(WindowMin):
+    """maximum of the window, using a monotonic queue"""
+    def _replaces(self, new, old):
+        return new >= old
+
+
+WINDOW_AGGREGATES = {
+    'count': WindowCount,
+    'sum': WindowSum,
+    'mean': WindowMean,
+    'min': WindowMin,
+    'max': WindowMax,
+}
+
+
+class Windower(object):
+    """
+    _Windower_
+
+    Base class for window state machines, add takes an
+    element and its timestamp (or None for count windows)
+    and returns a list of any windows completed by it,
+    flush returns the remaining windows at the end of the stream.
+
+    Completed windows are dicts containing start, end and
+    the aggregate results.
+    Count windows report start and end as element positions,
+    time windows report them as timestamps.
+    """
+    def __init__(self, names, specs, actions, capacity):
+        self.names = names
+        self.actions = actions
+        self.aggs = [
+            WINDOW_AGGREGATES[spec['type']](capacity) for spec in specs
+        ]
+        self.seq = 0
+
+    def _values(self, value):
+        return [value if a is None else a(value) for a in self.actions]
+
+    def _add(self, values):
+        for agg, value in zip(self.aggs, values):
+            agg.add(self.seq, value)
+        self.seq += 1
+
+    def _remove(self, seq, values):
+        for agg, value in zip(self.aggs, values):
+            agg.remove(seq, value)
+
+    def _reset(self):
+        for agg in self.aggs:
+            agg.reset()
+
+    def _window(self, start, end):
+        result = dict(
+            (name, agg.result()) for name, agg in zip(self.names, self.aggs)
+        )
+        result['start'] = start
+        result['end'] = end
+        return result
+
+    def add(self, value, timestamp):
+        raise NotImplementedError()
+
+    def flush(self):
+        raise NotImplementedError()
+
+
+class CountTumbling(Windower):
+    """consecutive non overlapping windows of size elements"""
+    def __init__(self, names, specs, actions, size, **options):
+        super(CountTumbling, self).__init__(names, specs, actions, None)
+        self.size = size
+        self.start = 0
+
+    def add(self, value, timestamp):
+        self._add(self._values(value))
+        if self.seq - self.start < self.size:
+            return []
+        window = self._window(self.start, self.seq)
+        self.start = self.seq
+        self._reset()
+        return [window]
+
+    def flush(self):
+        if self.seq == self.start:
+            return []
+        return [self._window(self.start, self.seq)]
+
+
+class CountSliding(Windower):
+    """
+    windows of the last size elements, produced
+    every slide elements once the first window is full
+    """
+    def __init__(self, names, specs, actions, size, slide=1, **options):
+        super(CountSliding, self).__init__(names, specs, actions, size)
+        self.size = size
+        self.slide = slide
+        self.buffer = RingBuffer(size)
+
+    def add(self, value, timestamp):
+        values = self._values(value)
+        evicted = self.buffer.append((self.seq, values))
+        if evicted is not MISSING:
+            self._remove(*evicted)
+        self._add(values)
+        if self.seq < self.size or (self.seq - self.size) % self.slide:
+            return []
+        return [self._window(self.seq - self.size, self.seq)]
+
+    def flush(self):
+        if self.seq and self.seq < self.size:
+            # the stream was shorter than one window
+            return [self._window(0, self.seq)]
+        return []
+
+
+class TimeTumbling(Windower):
+    """
+    non overlapping windows of size seconds, aligned to
+    multiples of size, timestamps are expected to be in order
+    and late elements are counted in the current window
+    """
+    def __init__(self, names, specs, actions, size, **options):
+        super(TimeTumbling, self).__init__(names, specs, actions, None)
+        self.size = size
+        self.start = None
+
+    def add(self, value, timestamp):
+        result = []
+        if self.start is None:
+            self.start = timestamp - timestamp % self.size
+        elif timestamp >= self.start + self.size:
+            result.append(self._window(self.start, self.start + self.size))
+            self._reset()
+            self.start = timestamp - timestamp % self.size
+        self._add(self._values(value))
+        return result
+
+    def flush(self):
+        if self.start is None:
+            return []
+        window = self._window(self.start, self.start + self.size)
+        self.start = None
+        return [window]
+
+
+class TimeSliding(Windower):
+    """
+    windows of size seconds starting every slide seconds,
+    aligned to multiples of slide. Windows without elements
+    are skipped.
+    The window contents are held in a ring buffer of capacity
+    elements, if a window holds more than that the oldest
+    elements are dropped from it early.
+    """
+    def __init__(self, names, specs, actions, size, slide=None,
+                 capacity=10000, **options):
+        super(TimeSliding, self).__init__(names, specs, actions, capacity)
+        self.size = size
+        self.slide = slide or size
+        self.buffer = RingBuffer(capacity)
+        self.next_end = None
+
+    def _first_end(self, timestamp):
+        """end of the first window containing timestamp"""
+        return timestamp - timestamp % self.slide + self.slide
+
+    def _evict_before(self, limit):
+        while self.buffer and self.buffer.first()[1] < limit:
+            seq, _, values = self.buffer.popleft()
+            self._remove(seq, values)
+
+    def _emit_until(self, timestamp):
+        """emit the windows that end at or before timestamp"""
+        result = []
+        while self.next_end is not None and self.next_end <= timestamp:
+            self._evict_before(self.next_end - self.size)
+            if not self.buffer:
+                self.next_end = None
+                break
+            result.append(
+                self._window(self.next_end - self.size, self.next_end)
+            )
+            self.next_end += self.slide
+        return result
+
+    def add(self, value, timestamp):
+        result = self._emit_until(timestamp)
+        if self.next_end is None:
+            self.next_end = self._first_end(timestamp)
+        values = self._values(value)
+        evicted = self.buffer.append((self.seq, timestamp, values))
+        if evicted is not MISSING:
+            self._remove(evicted[0], evicted[2])
+        self._add(values)
+        return result
+
+    def flush(self):
+        if not self.buffer:
+            return []
+        return self._emit_until(self.buffer.last()[1] + self.size)
+
+
+class TimeSession(Windower):
+    """
+    windows of activity separated by gaps of more
+    than gap seconds without elements
+    """
+    def __init__(self, names, specs, actions, gap, **options):
+        super(TimeSession, self).__init__(names, specs, actions, None)
+        self.gap = gap
+        self.start = None
+        self.last = None
+
+    def add(self, value, timestamp):
+        result = []
+        if self.last is not None and timestamp - self.last > self.gap:
+            result.append(self._window(self.start, self.last))
+            self._reset()
+            self.start = None
+        if self.start is None:
+            self.start = timestamp
+        self.last = max(timestamp, self.last)
+        self._add(self._values(value))
+        return result
+
+    def flush(self):
+        if self.start is None:
+            return []
+        window = self._window(self.start, self.last)
+        self.start = None
+        return [window]
+
+
+WINDOWERS = {
+    ('count', 'tumbling'): CountTumbling,
+    ('count', 'sliding'): CountSliding,
+    ('time', 'tumbling'): TimeTumbling,
+    ('time', 'sliding'): TimeSliding,
+    ('time', 'session'): TimeSession,
+}
+
+
+def make_windower(mode, kind, names, specs, actions, **options):
+    """
+    _make_windower_
+
+    Create the windower for the mode (count or time) and kind
+    (tumbling, sliding or session) of window
+    """
+    try:
+        cls = WINDOWERS[(mode, kind)]
+    except KeyError:
+        msg = "Unsupported window: {} {}".format(mode, kind)
+        raise ValueError(msg)
+    return cls(names, specs, actions, **options)
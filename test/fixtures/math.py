@@ -6,6 +6,7 @@ simple math function examples for use in tests
 
 """
 import math
+import time
 
 
 def square(x):
@@ -37,3 +38,50 @@ def even(x):
     if x % 2:
         return True
     return False
+
+
+CALLS = []
+
+
+def counted_square(x):
+    CALLS.append(x)
+    return x*x
+
+
+def mod_three(x):
+    return x % 3
+
+
+def fail(x):
+    raise ValueError("failed on {}".format(x))
+
+
+def fail_from_two(x):
+    """fails for values of two or more"""
+    if x >= 2:
+        raise ValueError("failed on {}".format(x))
+    return True
+
+
+def under_ten(x):
+    return x < 10
+
+
+def slow_double(x):
+    time.sleep(0.001)
+    return x * 2
+
+
+class Tracked(object):
+    """counts the instances that are alive"""
+    alive = 0
+
+    def __init__(self):
+        Tracked.alive += 1
+
+    def __del__(self):
+        Tracked.alive -= 1
+
+
+def tracked_alive(x):
+    return Tracked.alive
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+records
+
+row and record helpers for use in tests
+
+"""
+import json
+import time
+
+from data_pipelines.columnar import predicate
+from data_pipelines.optimizer import pure, commutes, key_pattern
+
+
+@predicate('age', '>', 30)
+def over_thirty(row):
+    return row['age'] > 30
+
+
+@predicate('group', '==', 'b')
+def in_group_b(row):
+    return row['group'] == 'b'
+
+
+def get_age(row):
+    return row['age']
+
+
+def batch_size(batch):
+    return len(batch)
+
+
+def get_group(row):
+    return row['group']
+
+
+def get_id(row):
+    return row['id']
+
+
+def get_ts(row):
+    return row['ts']
+
+
+def get_value(row):
+    return row['value']
+
+
+def parse_line(line):
+    return json.loads(str(line))
+
+
+def merge_group(row, match):
+    result = dict(row)
+    result['group'] = match['group'] if match else None
+    return result
+
+
+def make_row(i):
+    return {'id': i, 'value': i * 10}
+
+
+def slow_row(i):
+    time.sleep(0.001)
+    return make_row(i)
+
+
+@commutes
+def add_label(row):
+    return dict(row, label='row{}'.format(row['id']))
+
+
+@pure
+def id_under_ten(row):
+    return row['id'] < 10
+
+
+@pure
+def even_id(row):
+    return row['id'] % 2 == 0
+
+
+@pure
+def short_value(value):
+    return len(value) < 8
+
+
+@key_pattern('user:*')
+def user_value(value):
+    return value.startswith('user:')
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""
+sources
+
+data source plugins for use in tests
+
+"""
+from data_pipelines.data_source import DataSource
+
+
+class Failing(DataSource):
+    """counts up from 0 and fails after a number of elements"""
+    def __init__(self, **kwargs):
+        super(Failing, self).__init__()
+        self.after = kwargs.pop('after', 5)
+        self._count = 0
+
+    def next(self):
+        if self._count >= self.after:
+            raise ValueError("source failed after {}".format(self.after))
+        self._count += 1
+        return self._count - 1
+
+
+class Counting(DataSource):
+    """
+    counts up from 0 forever, if marker is set the file is
+    created when the source is disconnected
+    """
+    def __init__(self, **kwargs):
+        super(Counting, self).__init__()
+        self.marker = kwargs.pop('marker', None)
+        self._count = 0
+
+    def disconnect(self):
+        if self.marker is not None:
+            open(self.marker, 'w').close()
+
+    def next(self):
+        self._count += 1
+        return self._count - 1
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+columnar source and predicate push down tests
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import data_pipelines.pipelines as p
+import fixtures.records as r
+from data_pipelines.columnar import (
+    RecordBatch,
+    write_columns,
+    push_down_predicates,
+    numpy,
+    pyarrow
+)
+
+
+def make_rows(count):
+    return [
+        {'id': i, 'age': i % 60, 'group': 'abc'[i % 3]}
+        for i in range(count)
+    ]
+
+
+@unittest.skipIf(numpy is None, "numpy not installed")
+class ColumnarSourceTests(unittest.TestCase):
+    """tests for the ColumnarFile source"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.rows = make_rows(1000)
+        self.path = os.path.join(self.dir, 'columns')
+        write_columns(
+            self.path,
+            RecordBatch.from_rows(self.rows, ['id', 'age', 'group'])
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def build(self, config):
+        source = p.PipelineSource(plugin='ColumnarFile', config=config)
+        f1 = p.PipelineFilter(action=r.over_thirty)
+        f2 = p.PipelineFilter(action=r.in_group_b)
+        f2.chain(f1)
+        ages = p.PipelineTransform(action=r.get_age)
+        ages.chain(f2)
+        pipeline = p.Pipeline(f1, ages)
+        pipeline.chain(source)
+        return pipeline, source
+
+    def expected(self):
+        return [
+            row['age'] for row in self.rows
+            if row['age'] > 30 and row['group'] == 'b'
+        ]
+
+    def test_rows(self):
+        """test reading rows through row filters"""
+        pipeline, _ = self.build(
+            {'path': self.path, 'columns': ['age', 'group'], 'batch_size': 128}
+        )
+        self.assertEqual(pipeline.execute(), self.expected())
+
+    def test_push_down(self):
+        """test pushing filters into the source"""
+        pipeline, source = self.build(
+            {'path': self.path, 'columns': ['age'], 'batch_size': 128}
+        )
+        pushed = push_down_predicates(pipeline)
+        self.assertEqual(len(pushed), 2)
+        self.failUnless(pipeline.start.input is source)
+        self.assertEqual(len(source._config['filters']), 2)
+        # survives serialization
+        p2 = p.Pipeline.from_configuration(pipeline.to_json())
+        self.assertEqual(pipeline.execute(), self.expected())
+        self.assertEqual(p2.execute(), self.expected())
+
+    def test_push_down_all(self):
+        """test a pipeline of only pushed filters can still be chained"""
+        source = p.PipelineSource(
+            plugin='ColumnarFile', config={'path': self.path}
+        )
+        f1 = p.PipelineFilter(action=r.over_thirty)
+        f2 = p.PipelineFilter(action=r.in_group_b)
+        f2.chain(f1)
+        pipeline = p.Pipeline(f1, f2)
+        pipeline.chain(source)
+        self.assertEqual(len(push_down_predicates(pipeline)), 1)
+        self.failUnless(pipeline.start is f2)
+        self.failUnless(pipeline.end is f2)
+        other = p.PipelineSource(
+            plugin='ColumnarFile', config={'path': self.path}
+        )
+        pipeline.chain(other)
+        self.assertEqual(
+            [row['age'] for row in pipeline.execute()],
+            [row['age'] for row in self.rows if row['group'] == 'b']
+        )
+
+    def test_batches(self):
+        """test batch output with projection"""
+        source = p.PipelineSource(
+            plugin='ColumnarFile',
+            config={
+                'path': self.path,
+                'columns': ['id'],
+                'batch_size': 300,
+                'output': 'batches',
+                'filters': [['age', '<', 10]]
+            }
+        )
+        sizes = p.PipelineTransform(action=r.batch_size)
+        pipeline = p.Pipeline(sizes, sizes)
+        pipeline.chain(source)
+        result = pipeline.execute()
+        self.assertEqual(len(result), 4)
+        self.assertEqual(
+            sum(result), len([x for x in self.rows if x['age'] < 10])
+        )
+
+    @unittest.skipIf(pyarrow is None, "pyarrow not installed")
+    def test_parquet(self):
+        """test parquet row groups are skipped using statistics"""
+        import pyarrow.parquet as pq
+        path = os.path.join(self.dir, 'data.parquet')
+        ordered = sorted(self.rows, key=lambda x: x['age'])
+        table = pyarrow.Table.from_arrays(
+            [
+                pyarrow.array([x['age'] for x in ordered]),
+                pyarrow.array([x['group'] for x in ordered])
+            ],
+            names=['age', 'group']
+        )
+        pq.write_table(table, path, row_group_size=100)
+        pipeline, source = self.build({'path': path, 'output': 'rows'})
+        push_down_predicates(pipeline)
+        self.assertEqual(sorted(pipeline.execute()), sorted(self.expected()))
+
+
+if __name__ == '__main__':
+    unittest.main()
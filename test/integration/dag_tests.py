@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+DAG pipeline tests
+
+"""
+import json
+import unittest
+
+import data_pipelines.pipelines as p
+import fixtures.math as m
+from data_pipelines.dag import PipelineDAG, run_pipelines
+
+
+def make_pipeline(*opers, **source_config):
+    source = p.PipelineSource(
+        plugin='Integers', config=source_config or {'limit': 20}
+    )
+    last = source
+    for oper in opers:
+        oper.chain(last)
+        last = oper
+    return p.Pipeline(source, last).to_json()
+
+
+def square():
+    return p.PipelineTransform(action=m.counted_square)
+
+
+class DagTests(unittest.TestCase):
+    """tests for running pipelines with shared operators"""
+
+    def setUp(self):
+        del m.CALLS[:]
+
+    def test_shared_prefix(self):
+        """test a shared source and transform are evaluated once"""
+        configs = [
+            make_pipeline(square(), p.PipelineFilter(action=m.even)),
+            make_pipeline(square(), p.PipelineTransform(action=m.double)),
+            make_pipeline(square()),
+        ]
+        dag = PipelineDAG(
+            [p.Pipeline.from_configuration(c) for c in configs]
+        )
+        self.assertEqual(len(list(dag.nodes())), 4)
+        filtered, doubles, squares = dag.execute()
+        expected = [x * x for x in range(20)]
+        self.assertEqual(squares, expected)
+        self.assertEqual(filtered, filter(m.even, expected))
+        self.assertEqual(doubles, [x * 2 for x in expected])
+        self.assertEqual(m.CALLS, range(20))
+
+    def test_different_sources(self):
+        """test pipelines with different sources arent merged"""
+        configs = [
+            make_pipeline(square(), limit=5),
+            make_pipeline(square(), limit=3),
+            make_pipeline(square(), limit=5),
+        ]
+        results = run_pipelines(json.dumps(configs))
+        self.assertEqual(
+            results, [[0, 1, 4, 9, 16], [0, 1, 4], [0, 1, 4, 9, 16]]
+        )
+        self.assertEqual(sorted(m.CALLS), sorted(range(5) + range(3)))
+
+    def test_limit_branch(self):
+        """test a limit in one branch doesnt stop the others"""
+        configs = [
+            make_pipeline(square(), p.PipelineLimit(count=2)),
+            make_pipeline(square()),
+        ]
+        limited, full = run_pipelines(json.dumps(configs))
+        self.assertEqual(limited, [0, 1])
+        self.assertEqual(len(full), 20)
+
+    def test_limit_branch_released(self):
+        """test a stopped branch doesnt keep the tee buffering"""
+        limit = p.PipelineLimit(count=2)
+        alive = p.PipelineTransform(action=m.tracked_alive)
+        dag = PipelineDAG()
+        dag.add(p.Pipeline(limit, limit))
+        dag.add(p.Pipeline(alive, alive))
+        dag.chain(m.Tracked() for _ in range(1000))
+        limited, counts = dag.execute()
+        self.assertEqual(len(limited), 2)
+        self.assertEqual(len(counts), 1000)
+        # tee buffers elements in blocks of 57
+        self.failUnless(max(counts) < 100)
+
+    def test_chained_input(self):
+        """test pipelines without sources share the chained input"""
+        first = p.PipelineTransform(action=m.counted_square)
+        second = p.PipelineTransform(action=m.counted_square)
+        dbl = p.PipelineTransform(action=m.double)
+        dbl.chain(second)
+        dag = PipelineDAG()
+        dag.add(p.Pipeline(first, first))
+        dag.add(p.Pipeline(second, dbl))
+        dag.chain(iter(range(4)))
+        self.assertEqual(dag.execute(), [[0, 1, 4, 9], [0, 2, 8, 18]])
+        self.assertEqual(m.CALLS, range(4))
+
+    def test_lambdas_not_shared(self):
+        first = p.PipelineTransform(action=lambda x: x + 1)
+        second = p.PipelineTransform(action=lambda x: x - 1)
+        dag = PipelineDAG(
+            [p.Pipeline(first, first), p.Pipeline(second, second)]
+        )
+        dag.chain(iter(range(3)))
+        self.assertEqual(dag.execute(), [[1, 2, 3], [-1, 0, 1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
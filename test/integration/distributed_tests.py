@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+distributed execution tests
+
+"""
+import threading
+import unittest
+
+import fakeredis
+
+import data_pipelines.pipelines as p
+import fixtures.math as m
+from data_pipelines.distributed import (
+    Coordinator,
+    LocalWorkQueue,
+    RedisWorkQueue,
+    Worker,
+    partition_pipeline
+)
+
+
+def integers_pipeline(limit=100):
+    source = p.PipelineSource(plugin='Integers', config={'limit': limit})
+    square = p.PipelineTransform(action=m.square)
+    pipeline = p.Pipeline(square, square)
+    pipeline.chain(source)
+    return pipeline
+
+
+def ending_in(*opers, **config):
+    """Integers source followed by the given operators"""
+    config.setdefault('limit', 100)
+    source = p.PipelineSource(plugin='Integers', config=config)
+    last = source
+    for oper in opers:
+        oper.chain(last)
+        last = oper
+    return p.Pipeline(source, last)
+
+
+def group_pipeline(limit=100):
+    source = p.PipelineSource(plugin='Integers', config={'limit': limit})
+    group = p.PipelineGroupBy(
+        action=m.mod_three,
+        aggregations={
+            'count': {'type': 'count'},
+            'mean': {'type': 'mean'},
+            'top': {'type': 'top_k', 'k': 2},
+            'distinct': {'type': 'distinct'},
+        }
+    )
+    pipeline = p.Pipeline(group, group)
+    pipeline.chain(source)
+    return pipeline
+
+
+class DistributedTests(unittest.TestCase):
+    """tests for coordinator and workers"""
+
+    def run_workers(self, queue, count=3):
+        threads = [
+            threading.Thread(target=Worker(queue).run, kwargs={'timeout': 0.5})
+            for _ in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def test_partitions(self):
+        """test source partitions cover the data"""
+        parts = partition_pipeline(integers_pipeline(10).to_json(), 3)
+        ranges = [
+            (x['content']['input']['config']['skip'],
+             x['content']['input']['config']['limit'])
+            for x in parts
+        ]
+        self.assertEqual(ranges, [(0, 4), (4, 8), (8, 10)])
+
+    def test_local_queue(self):
+        """test concatenated results in partition order"""
+        queue = LocalWorkQueue()
+        coordinator = Coordinator(queue, partitions=4, timeout=5)
+        threads = self.run_workers(queue)
+        result = coordinator.run(integers_pipeline().to_json())
+        for thread in threads:
+            thread.join()
+        self.assertEqual(result, [x * x for x in range(100)])
+
+    def test_merged_aggregates(self):
+        """test partial group by results are merged"""
+        queue = LocalWorkQueue()
+        coordinator = Coordinator(queue, partitions=5, timeout=5)
+        threads = self.run_workers(queue)
+        result = coordinator.run(group_pipeline().to_json())
+        for thread in threads:
+            thread.join()
+        expected = group_pipeline().execute()
+        key = lambda x: x['key']
+        self.assertEqual(sorted(result, key=key), sorted(expected, key=key))
+
+    def test_redis_queue(self):
+        """test the redis list work queue"""
+        conn = fakeredis.FakeRedis()
+        queue = RedisWorkQueue(connection=conn, prefix='test')
+        coordinator = Coordinator(queue, partitions=3, timeout=5)
+        job = coordinator.submit(integers_pipeline(30).to_json())
+        self.assertEqual(Worker(queue).run(timeout=1), 3)
+        self.assertEqual(
+            coordinator.results(job), [x * x for x in range(30)]
+        )
+
+    def test_errors(self):
+        """test worker errors are reported"""
+        source = p.PipelineSource(plugin='Integers', config={'limit': 5})
+        broken = p.PipelineTransform(action=m.fail)
+        pipeline = p.Pipeline(broken, broken)
+        pipeline.chain(source)
+        queue = LocalWorkQueue()
+        coordinator = Coordinator(queue, partitions=2, timeout=5)
+        job = coordinator.submit(pipeline.to_json())
+        Worker(queue).run(timeout=0.1)
+        self.assertRaises(RuntimeError, coordinator.results, job)
+
+    def run_local(self, conf, partitions=4):
+        queue = LocalWorkQueue()
+        coordinator = Coordinator(queue, partitions=partitions, timeout=5)
+        threads = self.run_workers(queue)
+        try:
+            return coordinator.run(conf)
+        finally:
+            for thread in threads:
+                thread.join()
+
+    def test_rerun_end(self):
+        """test sort, top k, limit and distinct results are merged"""
+        for make in (
+                lambda: ending_in(p.PipelineSort(action=m.mod_three)),
+                lambda: ending_in(
+                    p.PipelineSort(action=m.mod_three, reverse=True)),
+                lambda: ending_in(p.PipelineTopK(action=m.mod_three, k=5)),
+                lambda: ending_in(p.PipelineLimit(count=7)),
+                lambda: ending_in(
+                    p.PipelineTransform(action=m.mod_three),
+                    p.PipelineDistinct())):
+            result = self.run_local(make().to_json())
+            self.assertEqual(result, make().execute())
+
+    def test_unsplittable(self):
+        """test pipelines that cant be partitioned are rejected"""
+        for pipeline in (
+                ending_in(p.PipelineWindow(
+                    aggregations={'count': {'type': 'count'}}, size=3)),
+                ending_in(p.PipelineTakeWhile(action=m.under_ten)),
+                ending_in(p.PipelineLimit(count=3),
+                          p.PipelineTransform(action=m.square))):
+            self.assertRaises(
+                ValueError, partition_pipeline, pipeline.to_json(), 3
+            )
+
+    def test_flat_config(self):
+        """test flat format configs are partitioned"""
+        conf = ending_in(p.PipelineTopK(k=3)).to_json(flat=True)
+        parts = partition_pipeline(conf, 3)
+        self.assertEqual(len(parts), 3)
+        self.assertEqual(self.run_local(conf), [99, 98, 97])
+        conf = group_pipeline().to_json(flat=True)
+        result = self.run_local(conf)
+        expected = group_pipeline().execute()
+        key = lambda x: x['key']
+        self.assertEqual(sorted(result, key=key), sorted(expected, key=key))
+
+
+if __name__ == '__main__':
+    unittest.main()
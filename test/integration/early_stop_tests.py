@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+limit, take while and timeout tests
+
+"""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import data_pipelines.pipelines as p
+import fixtures.math as m
+from data_pipelines.sources.integers import Integers
+
+
+def source_pipeline(oper, limit=1000000):
+    source = p.PipelineSource(plugin='Integers', config={'limit': limit})
+    oper.chain(source)
+    return source, p.Pipeline(source, oper)
+
+
+def rebuild(pipeline):
+    return p.Pipeline.from_configuration(pipeline.to_json())
+
+
+class EarlyStopTests(unittest.TestCase):
+    """tests for operators that end iteration early"""
+
+    def test_limit(self):
+        """test the source is disconnected as soon as the limit is hit"""
+        source, pipeline = source_pipeline(p.PipelineLimit(count=5))
+        pipeline = rebuild(pipeline)
+        with mock.patch.object(Integers, 'disconnect') as disconnect:
+            self.assertEqual(pipeline.execute(), range(5))
+            self.assertEqual(disconnect.call_count, 1)
+        self.assertEqual(pipeline.execute(), [])
+
+    def test_take_while(self):
+        take = p.PipelineTakeWhile(action=m.under_ten)
+        source, pipeline = source_pipeline(take)
+        pipeline = rebuild(pipeline)
+        self.assertEqual(pipeline.execute(), range(10))
+        self.assertEqual(pipeline.start._plugin, None)
+
+    def test_timeout(self):
+        source, pipeline = source_pipeline(p.PipelineTimeout(seconds=0.05))
+        pipeline = rebuild(pipeline)
+        slow = p.PipelineTransform(action=m.slow_double)
+        slow.chain(pipeline.end)
+        pipeline = p.Pipeline(pipeline.start, slow)
+        start = time.time()
+        result = pipeline.execute()
+        self.failUnless(time.time() - start < 1)
+        self.failUnless(0 < len(result) < 1000)
+        self.assertEqual(pipeline.start._plugin, None)
+
+    def test_limit_map(self):
+        """test closing propagates through the branches of a map"""
+        pmap = p.PipelineMap()
+        sq = p.PipelineTransform(action=m.square)
+        pmap.add_pipeline(p.Pipeline(sq, sq))
+        source, pipeline = source_pipeline(pmap)
+        limit = p.PipelineLimit(count=3)
+        limit.chain(pmap)
+        pipeline = rebuild(p.Pipeline(source, limit))
+        result = pipeline.execute()
+        self.assertEqual(
+            [r.values() for r in result], [[0], [1], [4]]
+        )
+        self.assertEqual(pipeline.start._plugin, None)
+
+    def test_context_manager(self):
+        """test leaving the with block disconnects the source"""
+        source, pipeline = source_pipeline(p.PipelineOperator())
+        with mock.patch.object(Integers, 'disconnect') as disconnect:
+            with pipeline:
+                self.assertEqual(pipeline.end.next(), 0)
+                self.assertEqual(disconnect.call_count, 0)
+            self.assertEqual(disconnect.call_count, 1)
+            pipeline.close()
+            self.assertEqual(disconnect.call_count, 1)
+        self.assertRaises(StopIteration, pipeline.end.next)
+
+    def test_limit_distinct(self):
+        """test distinct state is saved when a limit stops early"""
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        state_file = os.path.join(tempdir, 'seen')
+        distinct = p.PipelineDistinct(
+            action=m.mod_three, state_file=state_file
+        )
+        source, pipeline = source_pipeline(distinct, limit=100)
+        limit = p.PipelineLimit(count=2)
+        limit.chain(distinct)
+        config = p.Pipeline(source, limit).to_json()
+        self.assertEqual(
+            p.Pipeline.from_configuration(config).execute(), [0, 1]
+        )
+        self.failUnless(os.path.exists(state_file))
+        self.assertEqual(
+            p.Pipeline.from_configuration(config).execute(), [2]
+        )
+
+    def test_abort_distinct(self):
+        """test distinct state isnt saved when the pipeline fails"""
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        state_file = os.path.join(tempdir, 'seen')
+        distinct = p.PipelineDistinct(state_file=state_file)
+        source, pipeline = source_pipeline(distinct, limit=100)
+        failing = p.PipelineTransform(action=m.fail)
+        failing.chain(distinct)
+        pipeline = rebuild(p.Pipeline(source, failing))
+        with self.assertRaises(ValueError):
+            with pipeline:
+                pipeline.execute()
+        self.failIf(os.path.exists(state_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+pipeline server load test harness tests
+
+"""
+import os
+import json
+import unittest
+
+import data_pipelines.pipelines as p
+from data_pipelines.benchmarks import server_load
+from data_pipelines.server.local_spooler import get_spooler
+
+# run the server with the local spooler when uwsgi isnt installed
+os.environ.setdefault('DATA_PIPELINES_LOCAL_SPOOLER', '1')
+from data_pipelines.server import pipeline_server
+
+
+class ServerLoadTests(unittest.TestCase):
+
+    def test_percentiles(self):
+        """test latency percentiles are taken from the sorted values"""
+        result = server_load.percentiles(range(1, 101))
+        self.assertEqual(
+            result, {'p50': 50, 'p90': 90, 'p99': 99, 'max': 100}
+        )
+        self.assertEqual(server_load.percentiles([]), {})
+
+    def test_run_local(self):
+        """test jobs posted to the local server all complete"""
+        report = server_load.run_local(
+            requests=20, concurrency=4, workers=2, keys=30, timeout=60
+        )
+        self.assertEqual(report['requests'], 20)
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['completed'], 20)
+        self.assertEqual(report['failed'], 0)
+        self.failUnless(report['latency']['p50'] > 0)
+        self.failUnless(report['time_to_result']['p50'] > 0)
+
+    def test_local_spooler(self):
+        """test the app runs continuous jobs until they are deleted"""
+        client = pipeline_server.build_app().test_client()
+        source = p.PipelineSource(plugin='Integers', config={'limit': 10})
+        body = {'pipeline': p.Pipeline(source, source).to_json()}
+        response = client.post(
+            '/data_pipelines/run_repeatedly',
+            data=json.dumps(body),
+            content_type='application/json'
+        )
+        job = json.loads(response.data)['spooled']
+        jobs = json.loads(client.get('/data_pipelines/run_repeatedly').data)
+        self.failUnless(job in jobs['jobs'])
+        response = client.delete(
+            '/data_pipelines/run_repeatedly',
+            data=json.dumps({'job': job}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.failIf(job in get_spooler().spooler_jobs())
+
+
+if __name__ == '__main__':
+    unittest.main()
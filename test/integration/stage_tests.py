@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+multi process stage tests
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import data_pipelines.pipelines as p
+import fixtures.math as m
+import fixtures.sources
+from data_pipelines.stages import (
+    SharedRing,
+    StagedPipeline,
+    StageError,
+    encode_batch,
+    decode_batch
+)
+
+
+def chain(source_config, *opers):
+    source = p.PipelineSource(plugin='Integers', config=source_config)
+    last = source
+    for oper in opers:
+        oper.chain(last)
+        last = oper
+    return p.Pipeline(source, last)
+
+
+def rebuild(pipeline):
+    return p.Pipeline.from_configuration(pipeline.to_json())
+
+
+class SharedRingTests(unittest.TestCase):
+
+    def test_batches(self):
+        """test byte and pickled batches round trip"""
+        batch = ['a', buffer('bc'), '']
+        self.assertEqual(decode_batch(encode_batch(batch)), ['a', 'bc', ''])
+        batch = [1, 'a', None]
+        self.assertEqual(decode_batch(encode_batch(batch)), batch)
+        self.assertEqual(encode_batch(['ab'])[0], 'B')
+        self.assertEqual(encode_batch([1])[0], 'P')
+
+    def test_spanning_slots(self):
+        """test messages bigger than a slot are split and rejoined"""
+        ring = SharedRing(slots=2, slot_size=16)
+        pid = os.fork()
+        if pid == 0:
+            for size in (1, 11, 100):
+                ring.write('x' * size)
+            os._exit(0)
+        try:
+            for size in (1, 11, 100):
+                self.assertEqual(ring.read(), 'x' * size)
+        finally:
+            os.waitpid(pid, 0)
+            ring.close()
+
+
+class StagedPipelineTests(unittest.TestCase):
+
+    def test_same_results(self):
+        """test staged execution matches in process execution"""
+        pipeline = chain(
+            {'limit': 1000},
+            p.PipelineTransform(action=m.square),
+            p.PipelineFilter(action=m.even),
+            p.PipelineTransform(action=str)
+        )
+        expected = rebuild(pipeline).execute()
+        staged = StagedPipeline(pipeline, batch_size=7, slots=4)
+        self.assertEqual(len(staged.stages()), 4)
+        self.assertEqual(staged.execute(), expected)
+        # the pipeline isnt rewired, so it can run again either way
+        self.assertEqual(staged.execute(), expected)
+        self.assertEqual(pipeline.execute(), expected)
+
+    def test_boundaries(self):
+        """test operators are grouped into stages at the boundaries"""
+        square = p.PipelineTransform(action=m.square)
+        pipeline = rebuild(chain(
+            {'limit': 100}, square, p.PipelineTransform(action=m.double)
+        ))
+        staged = StagedPipeline(
+            pipeline, boundaries=[square.label], slot_size=64
+        )
+        self.assertEqual([len(s) for s in staged.stages()], [1, 2])
+        self.assertEqual(
+            staged.execute(), [2 * x * x for x in range(100)]
+        )
+
+    def test_stage_error(self):
+        """test an error in a stage process is raised by execute"""
+        pipeline = rebuild(
+            chain({'limit': 10}, p.PipelineTransform(action=m.fail),
+                  p.PipelineTransform(action=m.double))
+        )
+        with self.assertRaises(StageError) as context:
+            StagedPipeline(pipeline).execute()
+        self.failUnless('failed on 0' in str(context.exception))
+
+    def test_early_stop(self):
+        """test the stage processes are stopped when the end stops early"""
+        source = p.PipelineSource(plugin='Counting', config={})
+        square = p.PipelineTransform(action=m.square)
+        square.chain(source)
+        limit = p.PipelineLimit(count=5)
+        limit.chain(square)
+        staged = StagedPipeline(
+            rebuild(p.Pipeline(source, limit)), batch_size=1, slots=2
+        )
+        self.assertEqual(staged.execute(), [0, 1, 4, 9, 16])
+        self.assertEqual(staged._processes, [])
+
+    def test_sources_disconnected(self):
+        """test stage processes close their sources when stopped"""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        marker = os.path.join(tmpdir, 'disconnected')
+        source = p.PipelineSource(plugin='Counting', config={'marker': marker})
+        square = p.PipelineTransform(action=m.square)
+        square.chain(source)
+        limit = p.PipelineLimit(count=5)
+        limit.chain(square)
+        staged = StagedPipeline(
+            rebuild(p.Pipeline(source, limit)), batch_size=1, slots=2
+        )
+        self.assertEqual(staged.execute(), [0, 1, 4, 9, 16])
+        self.failUnless(os.path.exists(marker))
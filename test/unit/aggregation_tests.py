@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+reduce and group by tests
+
+"""
+import unittest
+
+import data_pipelines.pipelines as p
+import fixtures.records as r
+from data_pipelines.aggregations import HyperLogLog, TopK, restore_aggregator
+
+
+def make_rows(count):
+    return [
+        {'id': i, 'age': i % 60, 'group': 'g{}'.format(i % 7)}
+        for i in range(count)
+    ]
+
+
+class AggregatorTests(unittest.TestCase):
+    """tests for aggregate functions"""
+
+    def test_hyperloglog(self):
+        """test distinct estimates are close and mergeable"""
+        first = HyperLogLog(precision=12)
+        second = HyperLogLog(precision=12)
+        for i in range(20000):
+            first.add('item{}'.format(i))
+            second.add('item{}'.format(i + 10000))
+        self.failUnless(abs(first.result() - 20000) < 1000)
+        restored = restore_aggregator(
+            {'type': 'distinct', 'precision': 12}, first.state()
+        )
+        restored.merge(second)
+        self.failUnless(abs(restored.result() - 30000) < 1500)
+
+    def test_top_k(self):
+        """test top k keeps the largest values"""
+        agg = TopK(k=3)
+        for i in [5, 1, 9, 3, 7, 8]:
+            agg.add(i)
+        self.assertEqual(agg.result(), [9, 8, 7])
+
+
+class GroupByTests(unittest.TestCase):
+    """tests for the reduce and group by operators"""
+
+    aggregations = {
+        'count': {'type': 'count'},
+        'total': {'type': 'sum', 'action': r.get_age},
+        'oldest': {'type': 'max', 'action': r.get_age},
+        'youngest': {'type': 'min', 'action': 'fixtures.records.get_age'},
+        'mean': {'type': 'mean', 'action': r.get_age},
+        'top': {'type': 'top_k', 'action': r.get_id, 'k': 2},
+    }
+
+    def expected(self, rows):
+        groups = {}
+        for row in rows:
+            groups.setdefault(row['group'], []).append(row)
+        result = {}
+        for key, members in groups.items():
+            ages = [m['age'] for m in members]
+            result[key] = {
+                'key': key,
+                'count': len(members),
+                'total': sum(ages),
+                'oldest': max(ages),
+                'youngest': min(ages),
+                'mean': float(sum(ages)) / len(ages),
+                'top': sorted([m['id'] for m in members], reverse=True)[:2],
+            }
+        return result
+
+    def test_reduce(self):
+        """test reducing to a single result"""
+        rows = make_rows(100)
+        reduce_op = p.PipelineReduce(aggregations=self.aggregations)
+        pipeline = p.Pipeline(reduce_op, reduce_op)
+        pipeline.chain(iter(rows))
+        result = pipeline.execute()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0]['count'], 100)
+        self.assertEqual(result[0]['top'], [99, 98])
+
+    def test_group_by(self):
+        """test grouping with and without spilling"""
+        rows = make_rows(500)
+        for max_keys in (None, 3):
+            group = p.PipelineGroupBy(
+                action=r.get_group,
+                aggregations=self.aggregations,
+                max_keys=max_keys,
+                partitions=2
+            )
+            pipeline = p.Pipeline(group, group)
+            pipeline.chain(iter(rows))
+            result = dict((x['key'], x) for x in pipeline.execute())
+            self.assertEqual(result, self.expected(rows))
+
+    def test_serialization(self):
+        """test group by round trips through json"""
+        group = p.PipelineGroupBy(
+            action=r.get_group,
+            aggregations=self.aggregations,
+            max_keys=2
+        )
+        pipeline = p.Pipeline(group, group)
+        conf = pipeline.to_json()
+        self.assertEqual(
+            conf['content']['aggregations']['total']['action'],
+            'fixtures.records.get_age'
+        )
+        rebuilt = p.Pipeline.from_configuration(conf)
+        rows = make_rows(50)
+        rebuilt.chain(iter(rows))
+        result = dict((x['key'], x) for x in rebuilt.execute())
+        self.assertEqual(result, self.expected(rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+tests for building and serializing very large pipelines
+
+"""
+import json
+import sys
+import unittest
+
+import data_pipelines.pipelines as p
+from data_pipelines.benchmarks.build import linear_pipeline, nested_pipeline
+
+
+DEPTH = sys.getrecursionlimit() * 2
+
+
+def chain_labels(pipeline):
+    labels = []
+    oper = pipeline.end
+    while isinstance(oper, p.PipelineOperator):
+        labels.append(oper.label)
+        oper = oper.input
+    return labels
+
+
+class BuildTests(unittest.TestCase):
+
+    def test_flat_linear(self):
+        """test a deep linear pipeline round trips in the flat format"""
+        pipeline = linear_pipeline(DEPTH)
+        conf = json.loads(json.dumps(pipeline.to_json(flat=True)))
+        self.assertEqual(conf['format'], 'flat')
+        self.assertEqual(len(conf['operators']), DEPTH)
+        built = p.Pipeline.from_configuration(conf)
+        self.assertEqual(built.label, pipeline.label)
+        self.assertEqual(built.start.label, pipeline.start.label)
+        self.assertEqual(chain_labels(built), chain_labels(pipeline))
+        self.assertEqual(built.to_json(flat=True), conf)
+
+    def test_nested_linear(self):
+        """test a deep linear pipeline builds from the nested format"""
+        pipeline = linear_pipeline(DEPTH)
+        conf = pipeline.to_json()
+        built = p.Pipeline.from_configuration(conf)
+        self.assertEqual(built.start.label, pipeline.start.label)
+        self.assertEqual(chain_labels(built), chain_labels(pipeline))
+
+    def test_flat_nested_maps(self):
+        """test deeply nested maps round trip in the flat format"""
+        pipeline = nested_pipeline(DEPTH)
+        conf = json.loads(json.dumps(pipeline.to_json(flat=True)))
+        built = p.Pipeline.from_configuration(conf)
+        self.assertEqual(built.to_json(flat=True), conf)
+        pmap = built.end
+        for _ in range(DEPTH):
+            self.assertTrue(isinstance(pmap, p.PipelineMap))
+            self.assertEqual(len(pmap.inputs), 2)
+            pmap = pmap.inputs[0].end
+        self.assertTrue(isinstance(pmap, p.PipelineTransform))
+
+    def test_flat_operator(self):
+        """test a single operator serializes to the flat format"""
+        pipeline = linear_pipeline(3)
+        conf = pipeline.end.to_json()
+        flat = p.serialize(pipeline.end, flat=True)
+        self.assertEqual(len(flat['operators']), 3)
+        built = p.build_pipeline(flat)
+        self.assertEqual(built.end.to_json(), conf)
+
+    def test_flat_execute(self):
+        """test a pipeline built from the flat format runs"""
+        pipeline = linear_pipeline(10)
+        built = p.Pipeline.from_configuration(pipeline.to_json(flat=True))
+        built.chain(iter(range(5)))
+        self.assertEqual(built.execute(), range(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+result caching and change detection tests
+
+"""
+import mock
+import shutil
+import tempfile
+import unittest
+
+import fakeredis
+
+import data_pipelines.pipelines as p
+import fixtures.math as m
+from data_pipelines.caching import LRUCache, DiskCache, MISSING, get_cache
+
+
+class CacheTests(unittest.TestCase):
+    """tests for the cache classes"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_lru(self):
+        """test lru eviction order"""
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.failUnless(cache.get('b') is MISSING)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(len(cache), 2)
+
+    def test_disk(self):
+        """test disk cache persists and is size bounded"""
+        cache = DiskCache(self.dir, max_bytes=1000)
+        for i in range(20):
+            cache.set(str(i), 'x' * 100)
+        self.failUnless(len(cache) < 20)
+        self.assertEqual(cache.get('19'), 'x' * 100)
+        self.failUnless(cache.get('0') is MISSING)
+        reopened = DiskCache(self.dir, max_bytes=1000)
+        self.assertEqual(len(reopened), len(cache))
+        self.assertEqual(reopened.get('19'), 'x' * 100)
+
+    def test_cached_transform(self):
+        """test memoized transforms across pipeline runs"""
+        config = {'type': 'lru', 'max_entries': 101}
+        get_cache(config).clear()
+        del m.CALLS[:]
+        square = p.PipelineTransform(action=m.counted_square, cache=config)
+        pipeline = p.Pipeline(square, square)
+        pipeline.chain(iter([1, 2, 2, 3]))
+        conf = pipeline.to_json()
+        self.assertEqual(conf['content']['cache'], config)
+        self.assertEqual(pipeline.execute(), [1, 4, 4, 9])
+        self.assertEqual(m.CALLS, [1, 2, 3])
+
+        rebuilt = p.Pipeline.from_configuration(conf)
+        rebuilt.chain(iter([3, 4]))
+        self.assertEqual(rebuilt.execute(), [9, 16])
+        self.assertEqual(m.CALLS, [1, 2, 3, 4])
+
+    def test_unnamed_actions(self):
+        """test lambdas dont share cached results"""
+        config = {'type': 'lru', 'max_entries': 100}
+        results = []
+        for action in (lambda x: x + 1, lambda x: x * 100):
+            source = p.PipelineSource(plugin='Integers', config={'limit': 3})
+            trans = p.PipelineTransform(action=action, cache=config)
+            trans.chain(source)
+            results.append(p.Pipeline(source, trans).execute())
+        self.assertEqual(results, [[1, 2, 3], [0, 100, 200]])
+
+
+class RedisScanChangeTests(unittest.TestCase):
+    """tests for RedisScan fingerprint change detection"""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=self.server)
+        for i in range(10):
+            self.redis.set('key{}'.format(i), 'value{}'.format(i))
+        patcher = mock.patch(
+            'data_pipelines.sources.redis_scan.redis.Redis',
+            lambda **kwargs: fakeredis.FakeRedis(server=self.server)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_scan(self):
+        source = p.PipelineSource(
+            plugin='RedisScan',
+            config={'match': 'key*', 'fingerprints': 'fp:test'}
+        )
+        return sorted(x for x in source)
+
+    def test_changed_only(self):
+        """test only changed values are returned on later runs"""
+        self.assertEqual(len(self.run_scan()), 10)
+        self.assertEqual(self.run_scan(), [])
+        self.redis.set('key3', 'changed')
+        self.redis.set('key11', 'new')
+        self.assertEqual(self.run_scan(), ['changed', 'new'])
+        self.assertEqual(self.run_scan(), [])
+
+    def test_prune_deleted(self):
+        """test fingerprints of deleted keys are removed"""
+        self.redis.hset('fp:test', 'other', '1')
+        self.run_scan()
+        self.redis.delete('key1', 'key2')
+        self.run_scan()
+        expected = ['key0'] + ['key{}'.format(i) for i in range(3, 10)]
+        self.assertEqual(
+            sorted(self.redis.hkeys('fp:test')), expected + ['other']
+        )
+
+    def test_aborted_run(self):
+        """test fingerprints arent saved when the pipeline fails"""
+        source = p.PipelineSource(
+            plugin='RedisScan',
+            config={'match': 'key*', 'fingerprints': 'fp:test'}
+        )
+        failing = p.PipelineTransform(action=m.fail)
+        failing.chain(source)
+        pipeline = p.Pipeline(source, failing)
+        with self.assertRaises(ValueError):
+            with pipeline:
+                pipeline.execute()
+        self.assertEqual(self.redis.hlen('fp:test'), 0)
+        self.assertEqual(len(self.run_scan()), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+codec tests
+
+"""
+import unittest
+
+import data_pipelines.pipelines as p
+import fixtures.math as m
+from data_pipelines.serialization import (
+    available_codecs,
+    get_codec,
+    decode_json
+)
+
+
+class CodecTests(unittest.TestCase):
+    """tests for the codec plugins"""
+
+    def test_round_trip(self):
+        """test each available codec round trips an element"""
+        element = {'a': 1, 'b': [1.5, 2, 3], 'c': 'string', 'd': None}
+        self.failUnless('json' in available_codecs())
+        self.failUnless('pickle' in available_codecs())
+        for name in available_codecs():
+            codec = get_codec(name)
+            self.assertEqual(codec.decode(codec.encode(element)), element)
+
+    def test_decode_buffer(self):
+        """test decoding a zero copy slice"""
+        data = 'xx{"a": 1}xx'
+        self.assertEqual(decode_json(buffer(data, 2, 8)), {'a': 1})
+
+    def test_decode_stage(self):
+        """test using decode as a pipeline transform"""
+        decode = p.PipelineTransform(action=decode_json)
+        pipeline = p.Pipeline(decode, decode)
+        pipeline.chain(iter(['1', '[2]', '{"x": 3}']))
+        config = pipeline.to_json()
+        self.assertEqual(config['content']['action'],
+                         'data_pipelines.serialization.decode_json')
+        self.assertEqual(pipeline.execute(), [1, [2], {'x': 3}])
+
+    def test_run_pipeline_codec(self):
+        """test run_pipeline with a non json config codec"""
+        source = p.PipelineSource(plugin='Integers', config={'limit': 5})
+        oper = p.PipelineTransform(action=m.double)
+        oper.chain(source)
+        config = p.Pipeline(oper, oper).to_json()
+        for name in available_codecs():
+            encoded = get_codec(name).encode(config)
+            self.assertEqual(
+                p.run_pipeline(encoded, name), [0, 2, 4, 6, 8]
+            )
+
+    def test_missing_codec(self):
+        """test unknown codec names fail"""
+        self.assertRaises(Exception, get_codec, 'not_a_codec')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+distinct operator tests
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import fakeredis
+import mock
+
+import data_pipelines.pipelines as p
+import fixtures.records as r
+from data_pipelines.distinct import BloomFilter, ExactSet, item_key
+
+
+def make_rows(count, repeat=3):
+    return [
+        {'id': i % count, 'pass': i // count}
+        for i in range(count * repeat)
+    ]
+
+
+def run(oper, rows):
+    pipeline = p.Pipeline(oper, oper)
+    pipeline = p.Pipeline.from_configuration(pipeline.to_json())
+    pipeline.chain(iter(rows))
+    return pipeline.execute()
+
+
+class SeenSetTests(unittest.TestCase):
+
+    def test_exact_bounded(self):
+        """test only the most recent max_keys keys are remembered"""
+        seen = ExactSet(max_keys=2)
+        self.assertEqual(
+            [seen.add(k) for k in ['a', 'b', 'a', 'c', 'a', 'b']],
+            [True, True, False, True, True, True]
+        )
+        self.assertEqual(len(seen), 2)
+
+    def test_bloom(self):
+        """test no false negatives and a bounded false positive rate"""
+        bloom = BloomFilter(capacity=10000, error_rate=0.01)
+        for i in range(10000):
+            bloom.add('key{}'.format(i))
+        for i in range(10000):
+            self.failUnless('key{}'.format(i) in bloom)
+        false_positives = sum(
+            1 for i in range(10000) if 'other{}'.format(i) in bloom
+        )
+        self.failUnless(false_positives < 200)
+        self.failUnless(len(bloom.bits) < 10000 * 2)
+
+
+class DistinctTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_exact(self):
+        rows = make_rows(100)
+        result = run(p.PipelineDistinct(action=r.get_id), rows)
+        self.assertEqual(result, rows[:100])
+
+    def test_bloom(self):
+        rows = make_rows(1000)
+        oper = p.PipelineDistinct(
+            action=r.get_id, mode='bloom', capacity=1000, error_rate=0.001
+        )
+        result = run(oper, rows)
+        self.failUnless(990 <= len(result) <= 1000)
+        self.failUnless(all(row['pass'] == 0 for row in result))
+
+    def test_elements(self):
+        result = run(p.PipelineDistinct(), [1, 2, 1, 3, 2, 4])
+        self.assertEqual(result, [1, 2, 3, 4])
+
+    def test_state_file(self):
+        """test keys seen by an earlier run are skipped"""
+        for mode in ('exact', 'bloom'):
+            state_file = os.path.join(self.tempdir, mode)
+            oper = p.PipelineDistinct(
+                mode=mode, capacity=100, state_file=state_file
+            )
+            self.assertEqual(run(oper, range(10)), range(10))
+            self.failUnless(os.path.exists(state_file))
+            self.assertEqual(run(oper, range(5, 15)), range(10, 15))
+
+    def test_scan_keys(self):
+        """test repeated scan keys are dropped but equal values arent"""
+        server = fakeredis.FakeServer()
+        conn = fakeredis.FakeRedis(server=server)
+        for key in ('a', 'b', 'c'):
+            conn.set(key, 'same')
+        conn.scan_iter = lambda **kwargs: iter(['a', 'b', 'a', 'c', 'b'])
+        source = p.PipelineSource(
+            plugin='RedisScan', config={'output': 'items'}
+        )
+        distinct = p.PipelineDistinct(action=item_key)
+        distinct.chain(source)
+        pipeline = p.Pipeline.from_configuration(
+            p.Pipeline(source, distinct).to_json()
+        )
+        with mock.patch(
+            'data_pipelines.sources.redis_scan.redis.Redis',
+            lambda **kwargs: conn
+        ):
+            result = pipeline.execute()
+        self.assertEqual(
+            result, [{'key': k, 'value': 'same'} for k in ('a', 'b', 'c')]
+        )
+
+    def test_bad_mode(self):
+        oper = p.PipelineDistinct(mode='cuckoo')
+        oper.chain(iter([1]))
+        self.assertRaises(ValueError, oper.execute)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+join operator tests
+
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import fakeredis
+import mock
+
+import data_pipelines.pipelines as p
+import fixtures.records as r
+
+
+def run(oper, rows):
+    pipeline = p.Pipeline(oper, oper)
+    pipeline = p.Pipeline.from_configuration(pipeline.to_json())
+    pipeline.chain(iter(rows))
+    return pipeline.execute()
+
+
+class HashJoinTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'groups.json')
+        with open(self.filename, 'w') as handle:
+            for i, group in [(1, 'a'), (2, 'b'), (2, 'c'), (4, 'd')]:
+                handle.write(json.dumps({'id': i, 'group': group}))
+                handle.write('\n')
+        self.table = {
+            'type': 'hash',
+            'plugin': 'MmapLines',
+            'config': {'filename': self.filename},
+            'action': r.parse_line,
+            'key': r.get_id,
+        }
+        self.rows = [{'id': i, 'value': i * 10} for i in range(4)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_inner(self):
+        oper = p.PipelineJoin(
+            action=r.get_id, table=self.table, combine=r.merge_group,
+            batch_size=3
+        )
+        result = run(oper, self.rows)
+        self.assertEqual(
+            [(x['id'], x['group']) for x in result],
+            [(1, 'a'), (2, 'b'), (2, 'c')]
+        )
+
+    def test_left(self):
+        oper = p.PipelineJoin(action=r.get_id, table=self.table, how='left')
+        result = run(oper, self.rows)
+        self.assertEqual(
+            [(x['value']['id'], x['match'] and x['match']['group'])
+             for x in result],
+            [(0, None), (1, 'a'), (2, 'b'), (2, 'c'), (3, None)]
+        )
+
+
+class RedisJoinTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=self.server)
+        for i in range(0, 10, 2):
+            self.redis.set('group:{}'.format(i), json.dumps({'group': i}))
+        self.connections = []
+        patcher = mock.patch(
+            'data_pipelines.joins.redis.Redis', self.connect
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.table = {
+            'type': 'redis', 'prefix': 'group:', 'codec': 'json'
+        }
+
+    def connect(self, **kwargs):
+        conn = mock.Mock(wraps=fakeredis.FakeRedis(server=self.server))
+        self.connections.append(conn)
+        return conn
+
+    def test_batched_lookup(self):
+        """test keys are fetched a batch at a time and cached"""
+        rows = [{'id': i % 10} for i in range(40)]
+        oper = p.PipelineJoin(
+            action=r.get_id, table=self.table, combine=r.merge_group,
+            batch_size=20
+        )
+        result = run(oper, rows)
+        self.assertEqual(
+            [x['id'] for x in result],
+            [x['id'] for x in rows if not x['id'] % 2]
+        )
+        self.assertEqual(result[1], {'id': 2, 'group': 2})
+        conn, = self.connections
+        self.assertEqual(conn.mget.call_count, 1)
+        self.assertEqual(len(conn.mget.call_args[0][0]), 10)
+
+    def test_left(self):
+        rows = [{'id': i} for i in range(3)]
+        oper = p.PipelineJoin(
+            action=r.get_id, table=self.table, how='left',
+            combine=r.merge_group
+        )
+        self.assertEqual(
+            [x['group'] for x in run(oper, rows)], [0, None, 2]
+        )
+
+    def test_close(self):
+        """test a limit downstream releases the redis connection"""
+        join = p.PipelineJoin(
+            action=r.get_id, table=self.table, combine=r.merge_group
+        )
+        join.chain(iter([{'id': i} for i in range(0, 100, 2)]))
+        limit = p.PipelineLimit(count=2)
+        limit.chain(join)
+        self.assertEqual(len(limit.execute()), 2)
+        conn, = self.connections
+        self.assertEqual(conn.connection_pool.disconnect.call_count, 1)
+        self.assertEqual(join._table, None)
+
+    def test_disk_cache_keys(self):
+        """test redis keys are hashed before being used as file names"""
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        self.redis.set('group:../escape', json.dumps({'group': 'x'}))
+        self.table['cache'] = {'type': 'disk', 'path': tempdir}
+        oper = p.PipelineJoin(
+            action=r.get_id, table=self.table, combine=r.merge_group
+        )
+        result = run(oper, [{'id': '../escape'}, {'id': 2}])
+        self.assertEqual([x['group'] for x in result], ['x', 2])
+        names = os.listdir(tempdir)
+        self.assertEqual(len(names), 2)
+        self.failUnless(all(len(name) == 40 for name in names))
+
+
+if __name__ == '__main__':
+    unittest.main()
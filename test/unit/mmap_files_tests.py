@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+mmap file source tests
+
+"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import data_pipelines.pipelines as p
+from data_pipelines.sources.mmap_files import (
+    MmapLines,
+    MmapRecords,
+    byte_ranges
+)
+
+
+def read_all(source):
+    """helper to exhaust a source and copy its records"""
+    source.connect()
+    result = []
+    try:
+        while True:
+            result.append(bytes(source.next()))
+    except StopIteration:
+        pass
+    source.disconnect()
+    return result
+
+
+class MmapLinesTests(unittest.TestCase):
+    """tests for delimited records"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'data.json')
+        self.lines = [json.dumps({'x': i, 'pad': 'a' * i}) for i in range(50)]
+        with open(self.filename, 'w') as handle:
+            handle.write('\n'.join(self.lines))
+            handle.write('\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_read_lines(self):
+        """test reading the whole file"""
+        result = read_all(MmapLines(filename=self.filename))
+        self.assertEqual(result, self.lines)
+        self.assertEqual(json.loads(result[3])['x'], 3)
+
+    def test_pipeline_results(self):
+        """test records are still usable after the source disconnects"""
+        source = p.PipelineSource(
+            plugin='MmapLines', config={'filename': self.filename}
+        )
+        result = p.Pipeline(source, source).execute()
+        self.assertEqual([str(r) for r in result], self.lines)
+
+    def test_byte_ranges(self):
+        """test disjoint ranges cover every line exactly once"""
+        for partitions in (1, 2, 3, 7, 64):
+            result = []
+            for start, end in byte_ranges(self.filename, partitions):
+                result.extend(
+                    read_all(
+                        MmapLines(filename=self.filename, start=start, end=end)
+                    )
+                )
+            self.assertEqual(result, self.lines)
+
+    def test_blocks(self):
+        """test block mode returns whole lines"""
+        blocks = read_all(MmapLines(filename=self.filename, block_size=100))
+        self.failUnless(len(blocks) > 1)
+        self.assertEqual(''.join(blocks).splitlines(), self.lines)
+
+    def test_skip_header(self):
+        """test skipping the first line"""
+        result = read_all(MmapLines(filename=self.filename, skip_header=True))
+        self.assertEqual(result, self.lines[1:])
+
+
+class MmapRecordsTests(unittest.TestCase):
+    """tests for fixed width records"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'data.bin')
+        self.records = ['{:08d}'.format(i) for i in range(40)]
+        with open(self.filename, 'wb') as handle:
+            handle.write('HDR')
+            handle.write(''.join(self.records))
+            # trailing partial record is ignored
+            handle.write('123')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_records(self):
+        """test reading fixed width records in ranges"""
+        for partitions in (1, 3, 10):
+            result = []
+            for start, end in byte_ranges(self.filename, partitions):
+                result.extend(
+                    read_all(
+                        MmapRecords(
+                            filename=self.filename,
+                            record_size=8,
+                            header_size=3,
+                            start=start,
+                            end=end
+                        )
+                    )
+                )
+            self.assertEqual(result, self.records)
+
+    def test_blocks(self):
+        """test block mode returns whole records"""
+        blocks = read_all(
+            MmapRecords(
+                filename=self.filename,
+                record_size=8,
+                header_size=3,
+                block_size=64
+            )
+        )
+        self.assertEqual([len(b) for b in blocks], [64] * 5)
+        self.assertEqual(''.join(blocks), ''.join(self.records))
+
+
+if __name__ == '__main__':
+    unittest.main()
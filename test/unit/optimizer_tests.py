@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+"""
+pipeline optimizer tests
+
+"""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import fakeredis
+import mock
+
+import data_pipelines.pipelines as p
+import fixtures.records as r
+from data_pipelines.tuning import TuningStore
+from data_pipelines.pipelines import operator_chain
+from data_pipelines.optimizer import (
+    segments,
+    measure,
+    optimize,
+    explain,
+    plan
+)
+
+
+def row_pipeline(*actions, **source_config):
+    """Integers source made into rows, then the given actions"""
+    source_config.setdefault('limit', 100)
+    source = p.PipelineSource(plugin='Integers', config=source_config)
+    rows = p.PipelineTransform(action=r.make_row)
+    rows.chain(source)
+    last = rows
+    for oper in actions:
+        oper.chain(last)
+        last = oper
+    pipeline = p.Pipeline(source, last)
+    return p.Pipeline.from_configuration(pipeline.to_json())
+
+
+def actions(pipeline):
+    return [
+        getattr(oper.action, '__name__', None)
+        for oper in operator_chain(pipeline)
+    ]
+
+
+def natural_order():
+    """expensive transform first, then a weak and a selective filter"""
+    return row_pipeline(
+        p.PipelineTransform(action=r.add_label),
+        p.PipelineFilter(action=r.even_id),
+        p.PipelineFilter(action=r.id_under_ten)
+    )
+
+
+class OptimizerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_segments(self):
+        """test only pure filters and commuting transforms are moved"""
+        chain = operator_chain(row_pipeline(
+            p.PipelineTransform(action=r.add_label),
+            p.PipelineFilter(action=r.even_id),
+            p.PipelineOperator(action=r.get_id),
+            p.PipelineFilter(action=r.id_under_ten)
+        ))
+        self.assertEqual(segments(chain), [(2, 4)])
+
+    def test_measure(self):
+        stats = measure(natural_order(), sample=50)
+        selectivity = sorted(s['selectivity'] for s in stats.values())
+        self.assertEqual(selectivity, [0.2, 0.5, 1.0])
+        self.failUnless(all(s['cost'] >= 0 for s in stats.values()))
+
+    def test_reorder(self):
+        """test filters run first, the most selective per cost first"""
+        pipeline = natural_order()
+        expected = natural_order().execute()
+        chain = operator_chain(pipeline)
+        stats = {
+            chain[2].label: {'cost': 1e-5, 'selectivity': 1.0},
+            chain[3].label: {'cost': 1e-6, 'selectivity': 0.5},
+            chain[4].label: {'cost': 1e-6, 'selectivity': 0.1},
+        }
+        optimize(pipeline, stats=stats)
+        self.assertEqual(
+            actions(pipeline),
+            [None, 'make_row', 'id_under_ten', 'even_id', 'add_label']
+        )
+        self.assertEqual(pipeline.execute(), expected)
+        # the optimized pipeline round trips through its config
+        rebuilt = p.Pipeline.from_configuration(pipeline.to_json())
+        self.assertEqual(actions(rebuilt), actions(pipeline))
+
+    def test_sampled_and_stored(self):
+        """test statistics are sampled once and reused from a store"""
+        store = TuningStore(self.dir)
+        config = natural_order().to_json()
+        pipeline = p.Pipeline.from_configuration(config)
+        stats = optimize(pipeline, sample=50, store=store)
+        self.assertEqual(actions(pipeline)[-1], 'add_label')
+        self.assertEqual(pipeline.execute(), natural_order().execute())
+        with mock.patch('data_pipelines.optimizer.measure') as measured:
+            pipeline = p.Pipeline.from_configuration(config)
+            self.assertEqual(optimize(pipeline, store=store), stats)
+            self.assertEqual(measured.call_count, 0)
+
+    def test_explain(self):
+        pipeline = natural_order()
+        before = actions(pipeline)
+        text = explain(pipeline, sample=20)
+        self.failUnless(text.startswith('original plan'))
+        self.failUnless('optimized plan' in text)
+        self.failUnless('selectivity=0.50' in text)
+        self.assertEqual(actions(pipeline), before)
+
+    def test_acking_source(self):
+        """test sources that ack what they read arent sampled"""
+        source = p.PipelineSource(
+            plugin='RedisStream',
+            config={'stream': 'events', 'group': 'workers'}
+        )
+        last = source
+        for action in (r.even_id, r.id_under_ten):
+            oper = p.PipelineFilter(action=action)
+            oper.chain(last)
+            last = oper
+        pipeline = p.Pipeline(source, last)
+        self.assertRaises(ValueError, measure, pipeline)
+        self.assertRaises(ValueError, optimize, pipeline)
+        with mock.patch('data_pipelines.optimizer._sample') as sampled:
+            optimize(pipeline, stats={last.label: {
+                'cost': 1e-6, 'selectivity': 0.1
+            }})
+            self.assertEqual(sampled.call_count, 0)
+        self.assertEqual(actions(pipeline), [None, 'id_under_ten', 'even_id'])
+
+    def test_sample_without_state(self):
+        """test sampling doesnt save fingerprints or distinct state"""
+        server = fakeredis.FakeServer()
+        redis = fakeredis.FakeRedis(server=server)
+        for i in range(20):
+            redis.set('user:{}'.format(i), 'user:{}'.format(i))
+        source = p.PipelineSource(
+            plugin='RedisScan', config={'fingerprints': 'fp'}
+        )
+        users = p.PipelineFilter(action=r.user_value)
+        users.chain(source)
+        short = p.PipelineFilter(action=r.short_value)
+        short.chain(users)
+        pipeline = p.Pipeline(source, short)
+        with mock.patch(
+            'data_pipelines.sources.redis_scan.redis.Redis',
+            lambda **kwargs: fakeredis.FakeRedis(server=server)
+        ):
+            self.assertEqual(len(measure(pipeline, sample=5)), 2)
+            self.assertEqual(redis.hlen('fp'), 0)
+            self.assertEqual(len(pipeline.execute()), 20)
+        state_file = os.path.join(self.dir, 'seen')
+        source = p.PipelineSource(plugin='Integers', config={'limit': 100})
+        last = source
+        for oper in (p.PipelineDistinct(state_file=state_file),
+                     p.PipelineTransform(action=r.make_row),
+                     p.PipelineFilter(action=r.even_id),
+                     p.PipelineFilter(action=r.id_under_ten)):
+            oper.chain(last)
+            last = oper
+        self.assertEqual(len(measure(p.Pipeline(source, last), 5)), 2)
+        self.failIf(os.path.exists(state_file))
+
+    def test_unsafe_sources(self):
+        """test sources that cant be read again arent sampled"""
+        source = p.PipelineSource(
+            plugin='RedisKeyspace', config={'match': 'user:*'}
+        )
+        users = p.PipelineFilter(action=r.user_value)
+        users.chain(source)
+        short = p.PipelineFilter(action=r.short_value)
+        short.chain(users)
+        pipeline = p.Pipeline(source, short)
+        with self.assertRaises(ValueError) as ctx:
+            measure(pipeline)
+        self.failUnless('RedisKeyspace' in str(ctx.exception))
+
+    def test_sample_time(self):
+        """test sampling stops after max_time seconds"""
+        source = p.PipelineSource(plugin='Integers', config={'limit': 10000})
+        rows = p.PipelineTransform(action=r.slow_row)
+        rows.chain(source)
+        last = rows
+        for action in (r.even_id, r.id_under_ten):
+            oper = p.PipelineFilter(action=action)
+            oper.chain(last)
+            last = oper
+        began = time.time()
+        stats = measure(p.Pipeline(source, last), max_time=0.05)
+        self.failUnless(time.time() - began < 1)
+        self.assertEqual(len(stats), 2)
+
+    def test_plan_names(self):
+        """test operators without actions are named by their class"""
+        pipeline = row_pipeline(p.PipelineLimit(count=5))
+        steps, _ = plan(pipeline, {})
+        self.assertEqual(
+            [step['name'] for step in steps],
+            ['Integers', 'fixtures.records.make_row', 'PipelineLimit']
+        )
+        text = explain(pipeline, stats={})
+        self.failIf('NoneType' in text)
+        self.failUnless('  PipelineLimit\n' in text + '\n')
+
+    def test_keep_chainable_start(self):
+        """test a pipeline chained to a RedisScan keeps its filter"""
+        source = p.PipelineSource(plugin='RedisScan', config={})
+        users = p.PipelineFilter(action=r.user_value)
+        pipeline = p.Pipeline(users, users)
+        pipeline.chain(source)
+        optimize(pipeline, stats={})
+        self.failUnless(pipeline.start is users)
+        self.assertEqual(source._config, {})
+        pipeline.chain(iter(['user:1', 'other:1']))
+        self.assertEqual(pipeline.execute(), ['user:1'])
+
+    def test_push_key_pattern(self):
+        """test a key pattern filter becomes the RedisScan match"""
+        server = fakeredis.FakeServer()
+        redis = fakeredis.FakeRedis(server=server)
+        for i in range(5):
+            redis.set('user:{}'.format(i), 'user:{}'.format(i))
+            redis.set('other:{}'.format(i), 'other:{}'.format(i))
+        source = p.PipelineSource(plugin='RedisScan', config={})
+        users = p.PipelineFilter(action=r.user_value)
+        users.chain(source)
+        pipeline = p.Pipeline(source, users)
+        optimize(pipeline, stats={})
+        self.failUnless(pipeline.end is source)
+        self.assertEqual(source._config['match'], 'user:*')
+        with mock.patch(
+            'data_pipelines.sources.redis_scan.redis.Redis',
+            lambda **kwargs: fakeredis.FakeRedis(server=server)
+        ):
+            self.assertEqual(
+                sorted(pipeline.execute()),
+                ['user:{}'.format(i) for i in range(5)]
+            )
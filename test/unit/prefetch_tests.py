@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+prefetching source tests
+
+"""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import fakeredis
+import mock
+
+import data_pipelines.pipelines as p
+import fixtures.sources
+from data_pipelines.prefetch import PrefetchError
+
+
+def source_pipeline(plugin, **config):
+    source = p.PipelineSource(plugin=plugin, config=config)
+    pipeline = p.Pipeline(source, source)
+    return p.Pipeline.from_configuration(pipeline.to_json())
+
+
+class PrefetchTests(unittest.TestCase):
+
+    def test_modes(self):
+        """test prefetched sources return the same elements"""
+        for prefetch in (True, {'mode': 'process', 'batch_size': 7}):
+            pipeline = source_pipeline(
+                'Integers', limit=1000, prefetch=prefetch
+            )
+            self.assertEqual(pipeline.execute(), range(1000))
+            self.assertEqual(pipeline.start._plugin, None)
+
+    def test_thread_error(self):
+        pipeline = source_pipeline(
+            'Failing', after=10, prefetch={'batch_size': 3}
+        )
+        with self.assertRaises(ValueError):
+            pipeline.execute()
+        pipeline.close()
+
+    def test_process_error(self):
+        pipeline = source_pipeline(
+            'Failing', after=10, prefetch={'mode': 'process'}
+        )
+        with self.assertRaises(PrefetchError) as ctx:
+            pipeline.execute()
+        self.failUnless('source failed after 10' in str(ctx.exception))
+        pipeline.close()
+
+    def test_early_close(self):
+        """test closing stops the worker and disconnects the source"""
+        source = p.PipelineSource(
+            plugin='Counting', config={'prefetch': {'queue_size': 2}}
+        )
+        limit = p.PipelineLimit(count=5)
+        limit.chain(source)
+        counting = fixtures.sources.Counting
+        with mock.patch.object(counting, 'disconnect') as disconnect:
+            start = time.time()
+            self.assertEqual(p.Pipeline(source, limit).execute(), range(5))
+            self.failUnless(time.time() - start < 5)
+            self.assertEqual(disconnect.call_count, 1)
+
+    def test_acking_source(self):
+        """test sources that acknowledge entries cant be prefetched"""
+        pipeline = source_pipeline(
+            'RedisStream', stream='s', group='g', prefetch=True
+        )
+        with mock.patch('data_pipelines.sources.redis_stream.redis.Redis'):
+            with self.assertRaises(ValueError) as ctx:
+                pipeline.execute()
+        self.failUnless('RedisStream' in str(ctx.exception))
+
+    def test_mmap_records(self):
+        """test mmap records are usable after the worker finishes"""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        filename = os.path.join(tmpdir, 'lines')
+        lines = ['line {}'.format(i) for i in range(500)]
+        with open(filename, 'w') as handle:
+            handle.write('\n'.join(lines))
+        source = p.PipelineSource(
+            plugin='MmapLines',
+            config={'filename': filename, 'prefetch': {'batch_size': 7}}
+        )
+        to_str = p.PipelineTransform(action=str)
+        to_str.chain(source)
+        self.assertEqual(p.Pipeline(source, to_str).execute(), lines)
+
+    def test_disconnect_after_drain(self):
+        """test fingerprints are only saved for values the pipeline read"""
+        server = fakeredis.FakeServer()
+        redis = fakeredis.FakeRedis(server=server)
+        for i in range(50):
+            redis.set('key{}'.format(i), 'value{}'.format(i))
+        patcher = mock.patch(
+            'data_pipelines.sources.redis_scan.redis.Redis',
+            lambda **kwargs: fakeredis.FakeRedis(server=server)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        config = {
+            'fingerprints': 'fp', 'prefetch': {'batch_size': 5}
+        }
+        source = p.PipelineSource(plugin='RedisScan', config=config)
+        limit = p.PipelineLimit(count=3)
+        limit.chain(source)
+        self.assertEqual(len(p.Pipeline(source, limit).execute()), 3)
+        self.assertEqual(redis.hlen('fp'), 0)
+        source = p.PipelineSource(plugin='RedisScan', config=config)
+        self.assertEqual(len(list(source)), 50)
+        self.assertEqual(redis.hlen('fp'), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
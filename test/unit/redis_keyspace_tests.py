@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+redis keyspace notification source tests
+
+"""
+import unittest
+
+import fakeredis
+import mock
+
+import data_pipelines.pipelines as p
+from data_pipelines.benchmarks import server_load
+from data_pipelines.sources.redis_keyspace import RedisKeyspace
+
+
+class RedisKeyspaceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=self.server)
+        for i in range(5):
+            self.redis.set('user:{}'.format(i), 'v{}'.format(i))
+        self.redis.set('other:0', 'o')
+        self.connections = []
+        patcher = mock.patch(
+            'data_pipelines.sources.redis_keyspace.redis.Redis', self.connect
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def connect(self, **kwargs):
+        conn = mock.Mock(wraps=fakeredis.FakeRedis(server=self.server))
+        # fakeredis has no CONFIG command
+        conn.config_set = mock.Mock()
+        self.connections.append(conn)
+        return conn
+
+    def notify(self, key, event):
+        """fakeredis doesnt publish keyspace notifications itself"""
+        self.redis.publish('__keyspace@0__:{}'.format(key), event)
+
+    def source(self, **config):
+        config.setdefault('match', 'user:*')
+        config.setdefault('block', 50)
+        config.setdefault('coalesce', 20)
+        config.setdefault('stop_when_idle', True)
+        source = RedisKeyspace(**config)
+        source.connect()
+        self.addCleanup(source.disconnect)
+        return source
+
+    def test_initial_scan(self):
+        """test every matching key is returned by the initial scan"""
+        source = p.PipelineSource(
+            plugin='RedisKeyspace',
+            config={
+                'match': 'user:*', 'block': 50, 'count': 2,
+                'stop_when_idle': True
+            }
+        )
+        result = p.Pipeline(source, source).execute()
+        self.assertEqual(
+            sorted(r['key'] for r in result),
+            ['user:{}'.format(i) for i in range(5)]
+        )
+        self.assertEqual(
+            sorted(r['value'] for r in result),
+            ['v{}'.format(i) for i in range(5)]
+        )
+
+    def test_coalesced_changes(self):
+        """test a burst of events is read with one MGET per key once"""
+        source = self.source(initial_scan=False)
+        conn = self.connections[0]
+        for i in range(5):
+            self.redis.set('user:1', 'new{}'.format(i))
+            self.notify('user:1', 'set')
+        self.redis.delete('user:2')
+        self.notify('user:2', 'del')
+        self.notify('other:0', 'set')
+        self.assertEqual(source.next(), {'key': 'user:1', 'value': 'new4'})
+        self.assertEqual(source.next(), {'key': 'user:2', 'value': None})
+        self.assertEqual(conn.mget.call_count, 1)
+        self.assertRaises(StopIteration, source.next)
+
+    def test_scan_then_changes(self):
+        """test changes after the initial scan are returned"""
+        source = self.source(count=2)
+        keys = [source.next()['key'] for _ in range(5)]
+        self.assertEqual(len(set(keys)), 5)
+        self.redis.set('user:9', 'v9')
+        self.notify('user:9', 'set')
+        self.assertEqual(source.next(), {'key': 'user:9', 'value': 'v9'})
+
+    def test_settings(self):
+        """test deleted keys can be left out and max_entries stops"""
+        source = self.source(
+            initial_scan=False, include_deleted=False, max_entries=1
+        )
+        self.redis.delete('user:0')
+        self.notify('user:0', 'del')
+        self.notify('user:3', 'set')
+        self.notify('user:4', 'set')
+        self.assertEqual(source.next(), {'key': 'user:3', 'value': 'v3'})
+        self.assertRaises(StopIteration, source.next)
+
+    def test_notify_events(self):
+        """test notify_events configures the redis server"""
+        self.source(notify_events='K$gx')
+        self.connections[0].config_set.assert_called_with(
+            'notify-keyspace-events', 'K$gx'
+        )
+
+    def test_non_string_keys(self):
+        """test changed keys of other types arent reported deleted"""
+        source = self.source(initial_scan=False)
+        self.redis.rpush('user:7', 'a')
+        self.notify('user:7', 'rpush')
+        self.redis.delete('user:2')
+        self.notify('user:2', 'del')
+        self.assertEqual(source.next(), {'key': 'user:2', 'value': None})
+        self.assertRaises(StopIteration, source.next)
+
+    def test_waits_by_default(self):
+        """test the source keeps waiting for changes unless told not to"""
+        self.assertEqual(RedisKeyspace().stop_when_idle, False)
+        source = self.source(initial_scan=False, stop_when_idle=False)
+        with mock.patch.object(
+            source, '_changed', side_effect=[[], [], ['user:1']]
+        ) as changed:
+            self.assertEqual(source.next(), {'key': 'user:1', 'value': 'v1'})
+            self.assertEqual(changed.call_count, 3)
+
+    def test_client_factory(self):
+        """test the client can be created by a named factory"""
+        source = RedisKeyspace(
+            match='user:*', block=50, coalesce=20, stop_when_idle=True,
+            client_factory='data_pipelines.benchmarks.server_load.fake_client'
+        )
+        with mock.patch.object(server_load, 'FAKE_SERVER', self.server):
+            source.connect()
+            self.addCleanup(source.disconnect)
+        self.assertEqual(self.connections, [])
+        self.assertEqual(
+            sorted(source.next()['key'] for _ in range(5)),
+            ['user:{}'.format(i) for i in range(5)]
+        )
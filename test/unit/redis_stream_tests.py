@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""
+redis stream source tests
+
+"""
+import mock
+import unittest
+
+import data_pipelines.pipelines as p
+import fixtures.math as m
+
+
+class FakeStreams(object):
+    """
+    minimal in memory implementation of the redis
+    stream consumer group commands used by RedisStream
+    """
+    def __init__(self):
+        self.entries = []
+        self.pending = {}
+        self.last_delivered = 0
+        self.acks = []
+        self.idle = {}
+
+    def add(self, count):
+        start = len(self.entries)
+        for i in range(start, start + count):
+            self.entries.append(('{}-0'.format(i + 1), {'n': str(i)}))
+
+    def xgroup_create(self, name, group, id='$', mkstream=False):
+        pass
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        (name, start), = streams.items()
+        if start == '>':
+            first = self.last_delivered
+            batch = self.entries[first:first + count]
+            self.last_delivered += len(batch)
+            for entry_id, _ in batch:
+                self.pending[entry_id] = consumer
+        else:
+            after = int(start.split('-')[0])
+            batch = [
+                e for e in self.entries
+                if self.pending.get(e[0]) == consumer and
+                int(e[0].split('-')[0]) > after
+            ][:count]
+        if not batch:
+            return []
+        return [[name, batch]]
+
+    def xack(self, name, group, *ids):
+        self.acks.append(list(ids))
+        for entry_id in ids:
+            self.pending.pop(entry_id, None)
+        return len(ids)
+
+    def xpending_range(self, name, group, start, end, count):
+        return [
+            {
+                'message_id': entry_id,
+                'consumer': consumer,
+                'time_since_delivered': self.idle.get(entry_id, 0),
+                'times_delivered': 1
+            }
+            for entry_id, consumer in sorted(self.pending.items())
+        ][:count]
+
+    def xclaim(self, name, group, consumer, min_idle, ids):
+        for entry_id in ids:
+            self.pending[entry_id] = consumer
+        return [e for e in self.entries if e[0] in ids]
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self)
+
+
+class FakePipeline(object):
+    def __init__(self, target):
+        self.target = target
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((getattr(self.target, name), args, kwargs))
+        return call
+
+    def execute(self):
+        return [func(*args, **kwargs) for func, args, kwargs in self.calls]
+
+
+class RedisStreamTests(unittest.TestCase):
+    """tests for the RedisStream source"""
+
+    def setUp(self):
+        self.fake = FakeStreams()
+        patcher = mock.patch(
+            'data_pipelines.sources.redis_stream.redis.Redis',
+            lambda **kwargs: self.fake
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def source(self, **config):
+        settings = {'stream': 's', 'group': 'g', 'consumer': 'c1', 'count': 4}
+        settings.update(config)
+        return p.PipelineSource(plugin='RedisStream', config=settings)
+
+    def test_batches_acked(self):
+        """test entries are read in batches and acked after delivery"""
+        self.fake.add(10)
+        result = [x['fields']['n'] for x in self.source()]
+        self.assertEqual(result, [str(i) for i in range(10)])
+        self.assertEqual(
+            self.fake.acks,
+            [['1-0', '2-0', '3-0', '4-0'],
+             ['5-0', '6-0', '7-0', '8-0'],
+             ['9-0', '10-0']]
+        )
+        self.assertEqual(self.fake.pending, {})
+
+    def test_max_entries(self):
+        """test stopping early leaves the rest unread"""
+        self.fake.add(10)
+        result = list(self.source(max_entries=6))
+        self.assertEqual(len(result), 6)
+        self.assertEqual(self.fake.pending, {})
+        self.assertEqual(self.fake.last_delivered, 6)
+
+    def test_recover_pending(self):
+        """test own pending entries are reread and stale ones claimed"""
+        self.fake.add(6)
+        self.fake.xreadgroup('g', 'c1', {'s': '>'}, count=2)
+        self.fake.xreadgroup('g', 'dead', {'s': '>'}, count=2)
+        self.fake.idle['3-0'] = self.fake.idle['4-0'] = 120000
+        result = [x['id'] for x in self.source()]
+        self.assertEqual(
+            sorted(result), ['1-0', '2-0', '3-0', '4-0', '5-0', '6-0']
+        )
+        self.assertEqual(result[:2], ['3-0', '4-0'])
+        self.assertEqual(self.fake.pending, {})
+
+    def test_ack_on_end(self):
+        """test acknowledging everything once iteration ends"""
+        self.fake.add(10)
+        list(self.source(ack_on_end=True))
+        self.assertEqual(len(self.fake.acks), 1)
+        self.assertEqual(len(self.fake.acks[0]), 10)
+
+    def test_failed_entry_pending(self):
+        """test the entry in flight when the pipeline fails isnt acked"""
+        self.fake.add(4)
+        source = self.source()
+        fields = p.PipelineTransform(action=lambda x: int(x['fields']['n']))
+        fields.chain(source)
+        failing = p.PipelineFilter(action=m.fail_from_two)
+        failing.chain(fields)
+        pipeline = p.Pipeline(source, failing)
+        with self.assertRaises(ValueError):
+            with pipeline:
+                pipeline.execute()
+        self.assertEqual(self.fake.acks, [['1-0', '2-0']])
+        self.assertEqual(sorted(self.fake.pending), ['3-0', '4-0'])
+
+    def test_limit_in_flight(self):
+        """test closing early leaves the last entry handed out pending"""
+        self.fake.add(10)
+        source = self.source()
+        limit = p.PipelineLimit(count=3)
+        limit.chain(source)
+        self.assertEqual(len(p.Pipeline(source, limit).execute()), 3)
+        self.assertEqual(self.fake.acks, [['1-0', '2-0']])
+        self.assertEqual(sorted(self.fake.pending), ['3-0', '4-0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
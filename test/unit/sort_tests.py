@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+sort and top k operator tests
+
+"""
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import data_pipelines.pipelines as p
+import fixtures.records as r
+from data_pipelines.sorting import ExternalSorter
+
+
+def make_rows(count):
+    rand = random.Random(count)
+    return [
+        {'id': i, 'value': rand.randint(0, count // 4)}
+        for i in range(count)
+    ]
+
+
+def run(oper, rows):
+    pipeline = p.Pipeline(oper, oper)
+    pipeline = p.Pipeline.from_configuration(pipeline.to_json())
+    pipeline.chain(iter(rows))
+    return pipeline.execute()
+
+
+class SortTests(unittest.TestCase):
+
+    def setUp(self):
+        self.spill_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spill_dir)
+
+    def test_in_memory(self):
+        """test rows that fit in memory are sorted without spilling"""
+        rows = make_rows(500)
+        result = run(p.PipelineSort(action=r.get_value), rows)
+        self.assertEqual(result, sorted(rows, key=r.get_value))
+
+    def test_spilled(self):
+        """test runs are spilled, merged stably and removed"""
+        rows = make_rows(5000)
+        oper = p.PipelineSort(
+            action=r.get_value, max_items=300, fan_in=4,
+            spill_dir=self.spill_dir
+        )
+        self.assertEqual(run(oper, rows), sorted(rows, key=r.get_value))
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+    def test_reverse(self):
+        """test a spilled sort in descending order"""
+        rows = make_rows(2000)
+        oper = p.PipelineSort(
+            action=r.get_value, reverse=True, max_items=250,
+            spill_dir=self.spill_dir
+        )
+        expected = sorted(rows, key=r.get_value, reverse=True)
+        self.assertEqual(run(oper, rows), expected)
+
+    def test_sorter_lazy(self):
+        """test the merge only reads the runs as needed"""
+        sorter = ExternalSorter(max_items=10, spill_dir=self.spill_dir)
+        for i in reversed(range(100)):
+            sorter.add(i)
+        self.assertEqual(len(sorter.runs), 10)
+        items = sorter.items()
+        self.assertEqual([items.next() for _ in range(3)], [0, 1, 2])
+        items.close()
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+
+class TopKTests(unittest.TestCase):
+
+    def test_largest(self):
+        """test the k largest rows are returned in order"""
+        rows = make_rows(1000)
+        result = run(p.PipelineTopK(action=r.get_value, k=5), rows)
+        expected = sorted(rows, key=r.get_value, reverse=True)[:5]
+        self.assertEqual(result, expected)
+
+    def test_smallest(self):
+        """test the k smallest rows are returned in order"""
+        rows = make_rows(1000)
+        oper = p.PipelineTopK(action=r.get_id, k=3, smallest=True)
+        self.assertEqual(run(oper, rows), rows[:3])
+
+    def test_short_input(self):
+        """test fewer than k elements are all returned"""
+        self.assertEqual(run(p.PipelineTopK(k=10), [3, 1, 2]), [3, 2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
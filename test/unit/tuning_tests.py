@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+adaptive tuning tests
+
+"""
+import json
+import shutil
+import tempfile
+import unittest
+
+import fakeredis
+import mock
+
+import data_pipelines.pipelines as p
+import fixtures.records as r
+from data_pipelines.tuning import AIMDTuner, TuningStore
+
+
+class AIMDTunerTests(unittest.TestCase):
+
+    def test_increase(self):
+        """test the value grows additively up to the maximum"""
+        tuner = AIMDTuner(value=10, increase=5, maximum=30)
+        self.assertEqual(
+            [tuner.observe(10, 0.01) for _ in range(5)], [15, 20, 25, 30, 30]
+        )
+
+    def test_slow_batch(self):
+        """test the value halves when a batch is too slow"""
+        tuner = AIMDTuner(value=100, target_latency=0.5, minimum=30)
+        self.assertEqual(tuner.observe(100, 0.1), 110)
+        self.assertEqual(tuner.observe(110, 1.0), 55)
+        self.assertEqual(tuner.observe(55, 1.0), 30)
+        self.assertEqual(tuner.stats()['batches'], 3)
+
+    def test_throughput_drop(self):
+        """test the value shrinks when throughput drops"""
+        tuner = AIMDTuner(value=100, increase=100)
+        self.assertEqual(tuner.observe(100, 0.1), 200)
+        self.assertEqual(tuner.observe(200, 1.0), 100)
+
+
+class TuningStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.server = fakeredis.FakeServer()
+        redis = fakeredis.FakeRedis(server=self.server)
+        for i in range(100):
+            redis.set('row:{}'.format(i), json.dumps({'group': i}))
+        patcher = mock.patch(
+            'data_pipelines.joins.redis.Redis',
+            lambda **kwargs: fakeredis.FakeRedis(server=self.server)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def make_config(self):
+        source = p.PipelineSource(
+            plugin='Integers',
+            config={'limit': 500, 'prefetch': {
+                'batch_size': 20, 'tune': {'increase': 10}
+            }}
+        )
+        to_row = p.PipelineTransform(action=r.make_row)
+        to_row.chain(source)
+        join = p.PipelineJoin(
+            action=r.get_id,
+            table={'type': 'redis', 'prefix': 'row:', 'codec': 'json'},
+            how='left',
+            batch_size=10,
+            tune={'increase': 5, 'tolerance': 1}
+        )
+        join.chain(to_row)
+        return json.dumps(p.Pipeline(source, join).to_json())
+
+    def test_continuous_runs(self):
+        """test a second run starts from the tuned settings"""
+        config = self.make_config()
+        store = TuningStore(self.tempdir)
+        result = p.run_pipeline(config, tuning=store)
+        self.assertEqual(len(result), 500)
+        label = json.loads(config)['label']
+        saved = store.load(label)
+        settings = sorted(v['settings']['batch_size'] for v in saved.values())
+        self.assertEqual(len(settings), 2)
+        self.failUnless(settings[0] > 10)
+
+        pipeline = p.Pipeline.from_configuration(json.loads(config))
+        store.apply(pipeline)
+        self.assertEqual(
+            pipeline.end.batch_size,
+            saved[pipeline.end.label]['settings']['batch_size']
+        )
+        self.assertEqual(
+            pipeline.start._config['prefetch']['batch_size'],
+            saved[pipeline.start.label]['settings']['batch_size']
+        )
+        p.run_pipeline(config, tuning=store)
+        again = store.load(label)
+        self.failUnless(
+            again[pipeline.end.label]['settings']['batch_size'] >
+            saved[pipeline.end.label]['settings']['batch_size']
+        )
+
+
+
+class ScanTuningTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.server = fakeredis.FakeServer()
+        redis = fakeredis.FakeRedis(server=self.server)
+        for i in range(200):
+            redis.set('key:{}'.format(i), str(i))
+        patcher = mock.patch(
+            'data_pipelines.sources.redis_scan.redis.Redis',
+            lambda **kwargs: fakeredis.FakeRedis(server=self.server)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def make_config(self, prefetch=None):
+        config = {'match': 'key:*', 'count': 5, 'tune': {'increase': 5}}
+        if prefetch is not None:
+            config['prefetch'] = prefetch
+        source = p.PipelineSource(plugin='RedisScan', config=config)
+        return json.dumps(p.Pipeline(source, source).to_json())
+
+    def test_scan_count(self):
+        """test the scan count is tuned and used by the next run"""
+        config = self.make_config()
+        store = TuningStore(self.tempdir)
+        result = p.run_pipeline(config, tuning=store)
+        self.assertEqual(len(result), 200)
+        label = json.loads(config)['label']
+        saved = store.load(label).values()[0]
+        self.failUnless(saved['settings']['count'] > 5)
+
+        pipeline = p.Pipeline.from_configuration(json.loads(config))
+        store.apply(pipeline)
+        self.assertEqual(
+            pipeline.start._config['count'], saved['settings']['count']
+        )
+
+    def test_prefetched_scan_count(self):
+        """test the scan count is tuned in the prefetch worker"""
+        config = self.make_config(
+            {'batch_size': 10, 'tune': {'increase': 10}}
+        )
+        store = TuningStore(self.tempdir)
+        result = p.run_pipeline(config, tuning=store)
+        self.assertEqual(len(result), 200)
+        label = json.loads(config)['label']
+        saved = store.load(label).values()[0]
+        self.failUnless(saved['settings']['count'] > 5)
+        self.failUnless(saved['settings']['batch_size'] > 10)
+        self.assertEqual(
+            sorted(saved['stats'].keys()), ['prefetch', 'source']
+        )
+
+        pipeline = p.Pipeline.from_configuration(json.loads(config))
+        store.apply(pipeline)
+        config = pipeline.start._config
+        self.assertEqual(config['count'], saved['settings']['count'])
+        self.assertEqual(
+            config['prefetch']['batch_size'],
+            saved['settings']['batch_size']
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+window operator tests
+
+"""
+import random
+import unittest
+
+import data_pipelines.pipelines as p
+import fixtures.records as r
+from data_pipelines.windows import RingBuffer
+
+
+AGGREGATIONS = {
+    'count': {'type': 'count'},
+    'total': {'type': 'sum', 'action': r.get_value},
+    'mean': {'type': 'mean', 'action': r.get_value},
+    'low': {'type': 'min', 'action': r.get_value},
+    'high': {'type': 'max', 'action': r.get_value},
+}
+
+
+def summarize(rows, start, end):
+    values = [x['value'] for x in rows]
+    return {
+        'start': start,
+        'end': end,
+        'count': len(values),
+        'total': sum(values),
+        'mean': float(sum(values)) / len(values),
+        'low': min(values),
+        'high': max(values),
+    }
+
+
+def run(rows, **kwargs):
+    window = p.PipelineWindow(aggregations=AGGREGATIONS, **kwargs)
+    pipeline = p.Pipeline(window, window)
+    pipeline = p.Pipeline.from_configuration(pipeline.to_json())
+    pipeline.chain(iter(rows))
+    return pipeline.execute()
+
+
+class WindowTests(unittest.TestCase):
+    """tests for windows over count and time"""
+
+    def setUp(self):
+        rand = random.Random(42)
+        self.rows = [
+            {'ts': i * 0.5, 'value': rand.randint(-50, 50)}
+            for i in range(200)
+        ]
+
+    def test_ring_buffer(self):
+        """test ring buffer eviction"""
+        buf = RingBuffer(3)
+        for i in range(5):
+            buf.append(i)
+        self.assertEqual(list(buf), [2, 3, 4])
+        self.assertEqual(buf.append(5), 2)
+        self.assertEqual(buf.pop(), 5)
+        self.assertEqual(buf.popleft(), 3)
+
+    def test_count_tumbling(self):
+        """test tumbling count windows including a partial one"""
+        result = run(self.rows, mode='count', kind='tumbling', size=30)
+        expected = [
+            summarize(self.rows[i:i + 30], i, min(i + 30, 200))
+            for i in range(0, 200, 30)
+        ]
+        self.assertEqual(result, expected)
+
+    def test_count_sliding(self):
+        """test sliding count windows match a recomputation"""
+        result = run(
+            self.rows, mode='count', kind='sliding', size=10, slide=3
+        )
+        expected = [
+            summarize(self.rows[i:i + 10], i, i + 10)
+            for i in range(0, 191, 3)
+        ]
+        self.assertEqual(result, expected)
+
+    def test_time_tumbling(self):
+        """test time windows aligned to the size"""
+        result = run(
+            self.rows, action=r.get_ts, mode='time', kind='tumbling', size=7
+        )
+        expected = []
+        for start in range(0, 100, 7):
+            rows = [x for x in self.rows if start <= x['ts'] < start + 7]
+            expected.append(summarize(rows, start, start + 7))
+        self.assertEqual(result, expected)
+
+    def test_time_sliding(self):
+        """test sliding time windows match a recomputation"""
+        result = run(
+            self.rows, action=r.get_ts, mode='time', kind='sliding',
+            size=10, slide=4, capacity=100
+        )
+        expected = []
+        for end in range(4, 120, 4):
+            rows = [x for x in self.rows if end - 10 <= x['ts'] < end]
+            if rows:
+                expected.append(summarize(rows, end - 10, end))
+        self.assertEqual(result, expected)
+
+    def test_sessions(self):
+        """test session windows split on gaps"""
+        rows = [
+            {'ts': ts, 'value': 1}
+            for ts in [0, 1, 2, 10, 11, 30, 31, 32, 33]
+        ]
+        result = run(rows, action=r.get_ts, mode='time', kind='session', gap=5)
+        self.assertEqual(
+            [(x['start'], x['end'], x['count']) for x in result],
+            [(0, 2, 3), (10, 11, 2), (30, 33, 4)]
+        )
+
+    def test_invalid(self):
+        """test count sessions are rejected"""
+        self.assertRaises(
+            ValueError, run, self.rows, mode='count', kind='session'
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()